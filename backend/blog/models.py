@@ -7,7 +7,7 @@ from django.contrib.auth import get_user_model
 from autoslug import AutoSlugField
 from django_ckeditor_5.fields import CKEditor5Field
 
-from core.models import BaseModel, SeoModel, UploadPath, FileSizeValidator
+from core.models import BaseModel, SeoModel, cached_structured_data, UploadPath, FileSizeValidator
 
 User = get_user_model()
 
@@ -51,6 +51,13 @@ class Post(SeoModel, BaseModel):
         verbose_name=_("Thumbnail"),
         validators=[FileSizeValidator(max_size_mb=5)],
     )
+    thumbnail_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("Thumbnail Variants"),
+        help_text=_("Resized copies of the thumbnail, generated after upload."),
+    )
     author_user = models.ForeignKey(
         User,
         blank=True,
@@ -102,6 +109,7 @@ class Post(SeoModel, BaseModel):
         return self.author or (
             self.author_user.get_full_name() if self.author_user else "Anonymous")
 
+    @cached_structured_data
     def get_structured_data(self, frontend_base_url: str) -> str:
         """
         Returns JSON-LD structured data, using the frontend base URL.
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.images import schedule_image_variants, schedule_variants_cleanup
+from .models import Post
+
+
+@receiver(post_save, sender=Post)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_image_variants(instance, 'og_image')
+    schedule_image_variants(instance, 'thumbnail')
+
+
+@receiver(post_delete, sender=Post)
+def delete_image_variants(sender, instance, **kwargs):
+    schedule_variants_cleanup(instance, 'og_image')
+    schedule_variants_cleanup(instance, 'thumbnail')
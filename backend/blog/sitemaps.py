@@ -0,0 +1,17 @@
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import SeoModel
+from core.sitemaps import StreamingSitemap
+from blog.models import Post
+
+
+class PostSitemap(StreamingSitemap):
+    def get_queryset(self):
+        return Post.objects.filter(
+            Q(publish_date__isnull=True) | Q(publish_date__lte=timezone.now()),
+            is_active=True,
+        ).exclude(robots_index=SeoModel.RobotsIndexChoices.NOINDEX)
+
+    def location(self, row):
+        return f"/blog/{row[0]}/"
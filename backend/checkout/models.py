@@ -116,6 +116,45 @@ class ShoppingCartItem(BaseModel):
         return f"{self.inventory_item} x {self.quantity_kg}kg"
 
 
+class StockHold(models.Model):
+    """
+    A cart's time-limited hold on stock, used when reservations are kept in
+    the database (see ``checkout.reservations``).
+    """
+    cart = models.ForeignKey(
+        ShoppingCart,
+        on_delete=models.CASCADE,
+        related_name='stock_holds',
+        verbose_name=_('Shopping Cart'),
+    )
+    inventory_item = models.ForeignKey(
+        'inventory.InventoryItem',
+        on_delete=models.CASCADE,
+        related_name='stock_holds',
+        verbose_name=_('Inventory Item'),
+    )
+    quantity = models.FloatField(
+        verbose_name=_('Quantity'),
+        help_text=_("Held quantity, in the inventory item's unit."),
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_('Expires at'),
+    )
+
+    class Meta:
+        verbose_name = _('Stock Hold')
+        verbose_name_plural = _('Stock Holds')
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'inventory_item'], name='unique_stock_hold'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.inventory_item_id} for cart #{self.cart_id} until {self.expires_at}"
+
+
 class Payment(BaseModel):
     class StatusChoices(models.TextChoices):
         PENDING = 'pending', _('Pending')
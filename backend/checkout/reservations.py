@@ -0,0 +1,279 @@
+"""
+Time-limited stock reservations for shopping carts.
+
+Adding or changing a cart item holds its quantity for
+``STOCK_RESERVATION_TTL`` seconds; the available-to-sell quantity of an
+inventory item is its on-hand quantity minus the live holds, and a hold is
+refused when it would go over. Every item keeps a running total of its holds,
+so checking or placing a hold is O(1) whatever the number of carts.
+
+Holds live in Redis when ``STOCK_RESERVATION_REDIS_URL`` is set, each
+reservation being one Lua script so concurrent carts cannot over-reserve.
+Otherwise they are ``StockHold`` rows, with the total kept in
+``InventoryItem.reserved_quantity`` and updated under the item's row lock.
+Either way, expired holds keep counting until
+``checkout.tasks.expire_stock_holds`` sweeps them in batches. When an order
+takes its quantities out of stock, ``inventory.stock.deduct_order_stock``
+consumes the holds of the customer's cart at that partner.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from checkout.models import StockHold
+from inventory.models import InventoryItem
+from inventory.stock import InsufficientStock
+
+RESERVATION_TTL = settings.STOCK_RESERVATION_TTL
+REDIS_URL = settings.STOCK_RESERVATION_REDIS_URL
+SWEEP_BATCH_SIZE = 500
+# Floating point slack when comparing quantities.
+EPSILON = 1e-9
+
+
+class DatabaseReservationBackend:
+
+    def reserve(self, cart_id, inventory_item_id, quantity, ttl=RESERVATION_TTL):
+        """
+        Holds ``quantity`` (in the item's unit) for the cart, replacing and
+        renewing any hold it already has on the item.
+
+        :raises InsufficientStock: When the item cannot cover the hold.
+        """
+        with transaction.atomic():
+            item = InventoryItem.objects.select_for_update().only('quantity', 'reserved_quantity').get(
+                pk=inventory_item_id
+            )
+            hold = StockHold.objects.filter(cart_id=cart_id, inventory_item_id=inventory_item_id).first()
+            held = hold.quantity if hold else 0
+            available = item.quantity - item.reserved_quantity + held
+            if quantity > available + EPSILON:
+                raise InsufficientStock({inventory_item_id: (quantity, max(available, 0))})
+
+            expires_at = timezone.now() + timedelta(seconds=ttl)
+            if hold:
+                StockHold.objects.filter(pk=hold.pk).update(quantity=quantity, expires_at=expires_at)
+            else:
+                StockHold.objects.create(
+                    cart_id=cart_id, inventory_item_id=inventory_item_id, quantity=quantity, expires_at=expires_at
+                )
+            InventoryItem.objects.filter(pk=inventory_item_id).update(
+                reserved_quantity=F('reserved_quantity') + (quantity - held)
+            )
+
+    def release(self, cart_id, inventory_item_id):
+        with transaction.atomic():
+            hold = StockHold.objects.select_for_update().filter(
+                cart_id=cart_id, inventory_item_id=inventory_item_id
+            ).first()
+            if hold is None:
+                return
+            hold.delete()
+            InventoryItem.objects.filter(pk=inventory_item_id).update(
+                reserved_quantity=F('reserved_quantity') - hold.quantity
+            )
+
+    def reserved(self, items):
+        # The running totals are columns of the item rows themselves.
+        return {item.pk: item.reserved_quantity for item in items}
+
+    def held(self, cart_id, inventory_item_ids):
+        return dict(
+            StockHold.objects.filter(cart_id=cart_id, inventory_item__in=inventory_item_ids)
+            .values_list('inventory_item_id', 'quantity')
+        )
+
+    def consume(self, cart_id, inventory_item_ids):
+        """
+        Drops the cart's holds on items its order has just taken out of
+        stock, in the caller's transaction.
+        """
+        self._delete(
+            StockHold.objects.select_for_update()
+            .filter(cart_id=cart_id, inventory_item__in=inventory_item_ids)
+            .values_list('pk', 'inventory_item_id', 'quantity')
+        )
+
+    def expire(self, now, batch_size=SWEEP_BATCH_SIZE):
+        """
+        Releases up to ``batch_size`` holds expired at ``now``.
+
+        :return: Number of holds released.
+        """
+        with transaction.atomic():
+            return self._delete(
+                StockHold.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', 'inventory_item_id', 'quantity')[:batch_size]
+            )
+
+    @staticmethod
+    def _delete(holds):
+        """
+        Deletes ``(pk, inventory item id, quantity)`` holds and takes them off
+        the items' totals.
+
+        :return: Number of holds deleted.
+        """
+        holds = list(holds)
+        if not holds:
+            return 0
+        totals = defaultdict(float)
+        for _, inventory_item_id, quantity in holds:
+            totals[inventory_item_id] += quantity
+        StockHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).delete()
+        InventoryItem.objects.filter(pk__in=totals).update(
+            reserved_quantity=F('reserved_quantity') - Case(
+                *[When(pk=pk, then=Value(total)) for pk, total in totals.items()],
+                output_field=FloatField(),
+            )
+        )
+        return len(holds)
+
+
+# KEYS: reserved total, holds hash, expiry zset
+# ARGV: cart id, quantity, on-hand quantity, expiry timestamp, expiry member
+RESERVE_SCRIPT = """
+local held = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+local reserved = tonumber(redis.call('GET', KEYS[1]) or '0')
+local delta = tonumber(ARGV[2]) - held
+if delta > 0 and reserved + delta > tonumber(ARGV[3]) + 1e-9 then
+    return tostring(tonumber(ARGV[3]) - reserved + held)
+end
+redis.call('INCRBYFLOAT', KEYS[1], delta)
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[5])
+return false
+"""
+
+# KEYS: reserved total, holds hash, expiry zset
+# ARGV: cart id, expiry member, latest expiry to release (empty for any)
+RELEASE_SCRIPT = """
+local expires = redis.call('ZSCORE', KEYS[3], ARGV[2])
+if expires and ARGV[3] ~= '' and tonumber(expires) > tonumber(ARGV[3]) then
+    return 0
+end
+local held = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[2])
+if held ~= 0 then
+    redis.call('INCRBYFLOAT', KEYS[1], -held)
+end
+return 1
+"""
+
+
+class RedisReservationBackend:
+    expiry_key = 'stock:holds:expiry'
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.reserve_script = self.client.register_script(RESERVE_SCRIPT)
+        self.release_script = self.client.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def keys(inventory_item_id):
+        return f"stock:reserved:{inventory_item_id}", f"stock:holds:{inventory_item_id}"
+
+    @staticmethod
+    def member(cart_id, inventory_item_id):
+        return f"{inventory_item_id}:{cart_id}"
+
+    def reserve(self, cart_id, inventory_item_id, quantity, ttl=RESERVATION_TTL):
+        on_hand = InventoryItem.objects.filter(pk=inventory_item_id).values_list('quantity', flat=True).get()
+        expires_at = timezone.now().timestamp() + ttl
+        available = self.reserve_script(
+            keys=[*self.keys(inventory_item_id), self.expiry_key],
+            args=[cart_id, repr(quantity), repr(on_hand), expires_at, self.member(cart_id, inventory_item_id)],
+        )
+        if available is not None:
+            raise InsufficientStock({inventory_item_id: (quantity, max(float(available), 0))})
+
+    def release(self, cart_id, inventory_item_id, latest_expiry=None):
+        return self.release_script(
+            keys=[*self.keys(inventory_item_id), self.expiry_key],
+            args=[cart_id, self.member(cart_id, inventory_item_id), '' if latest_expiry is None else latest_expiry],
+        )
+
+    def reserved(self, items):
+        inventory_item_ids = [item.pk for item in items]
+        totals = self.client.mget([self.keys(pk)[0] for pk in inventory_item_ids])
+        return {pk: float(total or 0) for pk, total in zip(inventory_item_ids, totals)}
+
+    def held(self, cart_id, inventory_item_ids):
+        inventory_item_ids = list(inventory_item_ids)
+        pipeline = self.client.pipeline(transaction=False)
+        for pk in inventory_item_ids:
+            pipeline.hget(self.keys(pk)[1], cart_id)
+        return {
+            pk: float(quantity)
+            for pk, quantity in zip(inventory_item_ids, pipeline.execute()) if quantity is not None
+        }
+
+    def consume(self, cart_id, inventory_item_ids):
+        """
+        Releases the cart's holds on items its order has just taken out of
+        stock, once that transaction commits; until then they keep counting.
+        """
+        inventory_item_ids = list(inventory_item_ids)
+
+        def release():
+            for pk in inventory_item_ids:
+                self.release(cart_id, pk)
+
+        transaction.on_commit(release)
+
+    def expire(self, now, batch_size=SWEEP_BATCH_SIZE):
+        timestamp = now.timestamp()
+        released = 0
+        for member in self.client.zrangebyscore(self.expiry_key, '-inf', timestamp, start=0, num=batch_size):
+            inventory_item_id, cart_id = member.decode().split(':')
+            released += self.release(cart_id, inventory_item_id, latest_expiry=timestamp)
+        return released
+
+
+_backend = None
+
+
+def get_reservation_backend():
+    global _backend
+    if _backend is None:
+        _backend = RedisReservationBackend(REDIS_URL) if REDIS_URL else DatabaseReservationBackend()
+    return _backend
+
+
+def available_quantities(items, cart_id=None):
+    """
+    :param items: ``InventoryItem`` rows.
+    :param cart_id: Cart whose own holds stay available to it.
+    :return: Mapping of item id to its on-hand quantity minus live holds.
+    """
+    backend = get_reservation_backend()
+    items = list(items)
+    reserved = backend.reserved(items)
+    held = backend.held(cart_id, [item.pk for item in items]) if cart_id else {}
+    return {
+        item.pk: max(item.quantity - reserved.get(item.pk, 0) + held.get(item.pk, 0), 0)
+        for item in items
+    }
+
+
+def expire_holds(batch_size=SWEEP_BATCH_SIZE):
+    """
+    Releases every hold expired by now, ``batch_size`` at a time.
+
+    :return: Number of holds released.
+    """
+    now, total = timezone.now(), 0
+    while True:
+        released = get_reservation_backend().expire(now, batch_size)
+        total += released
+        if released < batch_size:
+            return total
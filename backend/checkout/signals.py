@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+
+from inventory.units import convert_quantity
+
+from .models import ShoppingCartItem
+from .reservations import get_reservation_backend
+
+
+@receiver(pre_save, sender=ShoppingCartItem)
+def reserve_cart_item(sender, instance, raw=False, **kwargs):
+    """
+    Holds the item's quantity for the cart; ``InsufficientStock`` aborts the save.
+    Items counted in a unit without a conversion from kilograms are not held.
+    """
+    if raw:
+        return
+    backend = get_reservation_backend()
+    if instance.pk:
+        previous = ShoppingCartItem.objects.filter(pk=instance.pk).values_list('inventory_item_id', flat=True).first()
+        if previous is not None and previous != instance.inventory_item_id:
+            backend.release(instance.cart_id, previous)
+    item = instance.inventory_item
+    try:
+        quantity = convert_quantity(instance.quantity_kg, 'kg', item.quantity_unit, inventory_item_id=item.pk)
+    except ValueError:
+        backend.release(instance.cart_id, item.pk)
+        return
+    backend.reserve(instance.cart_id, item.pk, quantity)
+
+
+@receiver(post_delete, sender=ShoppingCartItem)
+def release_cart_item(sender, instance, **kwargs):
+    get_reservation_backend().release(instance.cart_id, instance.inventory_item_id)
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from checkout import reservations
+
+
+@shared_task
+def expire_stock_holds():
+    return reservations.expire_holds()
@@ -1,3 +1,126 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from checkout.models import ShoppingCart, ShoppingCartItem, StockHold
+from checkout.reservations import available_quantities, expire_holds, get_reservation_backend
+from checkout.tasks import expire_stock_holds
+from herbs.models import Herb
+from inventory.models import InventoryBase, InventoryItem, InventoryUnitConversion, Order, OrderItem
+from inventory.stock import InsufficientStock
+from partners.models import Country, Partner
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="France", iso_code="FR")
+        cls.partner = Partner.objects.create(name="Herboristerie", country=country)
+        base = InventoryBase.objects.create(partner=cls.partner, name="Lyon", country=country)
+        cls.carts = [
+            ShoppingCart.objects.create(
+                user=get_user_model().objects.create_user(
+                    email=f"buyer{index}@example.com", password="secret", first_name="Ada", last_name="Buyer"
+                ),
+                partner=cls.partner,
+            )
+            for index in range(3)
+        ]
+        cls.item = InventoryItem.objects.create(
+            herb=Herb.objects.create(name="Chamomile"), base=base, quantity=5, quantity_unit='g'
+        )
+
+    def available(self):
+        self.item.refresh_from_db()
+        return available_quantities([self.item])[self.item.pk]
+
+    def test_holds_reduce_available_quantity(self):
+        first = ShoppingCartItem.objects.create(cart=self.carts[0], inventory_item=self.item, quantity_kg=0.003)
+        self.assertAlmostEqual(self.available(), 2)
+
+        with self.assertRaises(InsufficientStock):
+            ShoppingCartItem.objects.create(cart=self.carts[1], inventory_item=self.item, quantity_kg=0.0025)
+        self.assertFalse(ShoppingCartItem.objects.filter(cart=self.carts[1]).exists())
+
+        # Changing a cart item replaces its hold instead of adding to it.
+        first.quantity_kg = 0.001
+        first.save()
+        self.assertAlmostEqual(self.available(), 4)
+        second = ShoppingCartItem.objects.create(cart=self.carts[1], inventory_item=self.item, quantity_kg=0.004)
+        self.assertAlmostEqual(self.available(), 0)
+
+        second.delete()
+        self.assertAlmostEqual(self.available(), 4)
+        self.assertEqual(StockHold.objects.count(), 1)
+
+    def test_items_without_a_kilogram_conversion_are_not_held(self):
+        item = InventoryItem.objects.create(
+            herb=Herb.objects.create(name="Ginger"), base=self.item.base, quantity=3, quantity_unit='bag'
+        )
+        cart_item = ShoppingCartItem.objects.create(cart=self.carts[0], inventory_item=item, quantity_kg=1)
+        self.assertFalse(StockHold.objects.exists())
+
+        InventoryUnitConversion.objects.create(inventory_item=item, unit='bag', kilograms=0.5)
+        cart_item.save()
+        self.assertEqual(StockHold.objects.get().quantity, 2)
+
+    def test_reservation_queries_do_not_grow_with_holds(self):
+        backend = get_reservation_backend()
+        backend.reserve(self.carts[0].pk, self.item.pk, 1)
+        with self.assertNumQueries(6):
+            # Savepoint, item lock, hold lookup, insert, counter update, release.
+            backend.reserve(self.carts[1].pk, self.item.pk, 1)
+        with self.assertNumQueries(6):
+            backend.reserve(self.carts[2].pk, self.item.pk, 1)
+
+    def test_sweeper_expires_stale_holds_in_batches(self):
+        backend = get_reservation_backend()
+        for cart in self.carts:
+            backend.reserve(cart.pk, self.item.pk, 1)
+        StockHold.objects.exclude(cart=self.carts[2]).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(expire_holds(batch_size=1), 2)
+        self.assertEqual(list(StockHold.objects.values_list('cart', flat=True)), [self.carts[2].pk])
+        self.assertAlmostEqual(self.available(), 4)
+        self.assertEqual(expire_stock_holds.delay().get(), 0)
+
+    def order(self, cart, grams):
+        order = Order.objects.create(user=cart.user, partner=self.partner, total_price=Decimal("1"))
+        OrderItem.objects.create(
+            order=order, inventory_item=self.item, quantity=grams, quantity_unit='g',
+            unit_price=Decimal("1"), total_price=Decimal("1"),
+        )
+        order.status = Order.StatusChoices.PROCESSING
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        return order
+
+    def test_held_stock_cannot_be_ordered_by_another_cart(self):
+        ShoppingCartItem.objects.create(cart=self.carts[0], inventory_item=self.item, quantity_kg=0.004)
+        offers = self.client.get(reverse('herbs-v1:herbs_offers', kwargs={'slug': self.item.herb.slug})).json()
+        self.assertEqual([(offer['quantity'], offer['available_quantity']) for offer in offers], [(5, 1)])
+
+        with self.assertRaises(InsufficientStock):
+            ShoppingCartItem.objects.create(cart=self.carts[1], inventory_item=self.item, quantity_kg=0.002)
+        with self.assertRaises(InsufficientStock):
+            self.order(self.carts[1], 2)
+        self.assertEqual(Order.objects.get(user=self.carts[1].user).status, Order.StatusChoices.PENDING)
+
+        self.order(self.carts[0], 4)
+        self.order(self.carts[1], 1)
+        self.assertEqual((self.available(), self.item.quantity, StockHold.objects.count()), (0, 0, 0))
+
+    def test_holds_change_the_offers_etag(self):
+        url = reverse('herbs-v1:herbs_offers', kwargs={'slug': self.item.herb.slug})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
 
-# Create your tests here.
+        ShoppingCartItem.objects.create(cart=self.carts[0], inventory_item=self.item, quantity_kg=0.004)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['available_quantity'], 1)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Build in-memory indexes before serving the first request.
+from herbs.bitmaps import warm_bitmap_index  # noqa: E402
+
+warm_bitmap_index()
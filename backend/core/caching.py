@@ -0,0 +1,88 @@
+"""
+Per-process objects kept in step across workers through a cache version.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+class VersionedObject:
+    """
+    An object every worker builds for itself (an in-memory index, a matrix)
+    and rebuilds once the version shared in the cache under ``key`` moves.
+
+    Changes bump the version only after their transaction commits, so no
+    worker rebuilds from pre-commit data and then keeps it as current.
+    """
+
+    def __init__(self, key, build, refresh_interval=0):
+        """
+        :param build: Callable returning a fresh object.
+        :param refresh_interval: Seconds the object is served without checking
+            the version; 0 checks it on every :meth:`get`.
+        """
+        self.key = key
+        self.build = build
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.value = None
+        self.version = None
+        self.checked_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self.value is not None and now - self.checked_at < self.refresh_interval:
+            return self.value
+
+        with self.lock:
+            version = cache.get(self.key)
+            if self.value is None or version != self.version:
+                self.value = self.build()
+                self.version = version
+            self.checked_at = now
+            return self.value
+
+    def reset(self, version=0):
+        """
+        Drops this worker's object and sets the shared version, e.g. between tests.
+        """
+        with self.lock:
+            cache.set(self.key, version, timeout=None)
+            self.value = None
+
+    def _bump(self):
+        try:
+            return cache.incr(self.key)
+        except ValueError:
+            cache.set(self.key, 1, timeout=None)
+            return 1
+
+    def invalidate(self):
+        """
+        Makes every worker rebuild once the current transaction commits.
+        """
+        def run():
+            with self.lock:
+                self._bump()
+                self.value = None
+
+        transaction.on_commit(run)
+
+    def apply(self, update):
+        """
+        Runs ``update(value)`` on this worker's object once the current
+        transaction commits, and makes the other workers rebuild.
+        """
+        def run():
+            with self.lock:
+                version = self._bump()
+                if self.value is not None and self.version == version - 1:
+                    update(self.value)
+                    self.version = version
+                else:
+                    # Missed a change from another worker; rebuild on next use.
+                    self.value = None
+
+        transaction.on_commit(run)
@@ -0,0 +1,145 @@
+"""
+Responsive image variants.
+
+After an image field changes, a Celery task writes resized copies of the
+upload at ``IMAGE_VARIANT_WIDTHS`` in every format of
+``IMAGE_VARIANT_FORMATS`` (AVIF only where Pillow supports it) next to the
+original, e.g. ``herbs/medias/20250101_120000_640w.webp``, and records them in
+the model's ``<field>_variants`` JSON field::
+
+    {"source": "<original name>", "width": 2400,
+     "variants": {"webp": {"320": "<name>", "640": "<name>"}, ...}}
+
+``core.serializers.ImageVariantsField`` turns that into ``srcset`` strings.
+"""
+import os
+from io import BytesIO
+
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+VARIANT_WIDTHS = settings.IMAGE_VARIANT_WIDTHS
+VARIANT_FORMATS = settings.IMAGE_VARIANT_FORMATS
+
+# Sent with ``instance`` and ``field_name`` once new variants are stored.
+variants_generated = Signal()
+
+# format -> (Pillow format, extension, save options)
+ENCODERS = {
+    'avif': ('AVIF', 'avif', {'quality': 60}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variants_field_name(field_name):
+    return f"{field_name}_variants"
+
+
+def available_formats():
+    return [name for name in VARIANT_FORMATS if name != 'avif' or features.check('avif')]
+
+
+def variant_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f"{root}_{width}w.{extension}"
+
+
+def delete_variants(storage, variants):
+    for names in (variants or {}).get('variants', {}).values():
+        for name in names.values():
+            storage.delete(name)
+
+
+def build_variants(field_file):
+    """
+    Writes the variants of ``field_file`` to its storage.
+
+    :return: The map to store in the ``<field>_variants`` field; without
+        ``variants`` when the file is missing or not an image.
+    """
+    result = {'source': field_file.name}
+    try:
+        with field_file.open('rb') as handle:
+            image = ImageOps.exif_transpose(Image.open(handle))
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return result
+
+    result['width'] = image.width
+    widths = [width for width in VARIANT_WIDTHS if width < image.width] or [image.width]
+    variants = {}
+    for width in widths:
+        height = max(round(image.height * width / image.width), 1)
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for name in available_formats():
+            pillow_format, extension, options = ENCODERS[name]
+            converted = resized
+            if pillow_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                converted = resized.convert('RGB')
+            buffer = BytesIO()
+            converted.save(buffer, pillow_format, **options)
+
+            target = variant_name(field_file.name, width, extension)
+            field_file.storage.delete(target)
+            saved = field_file.storage.save(target, ContentFile(buffer.getvalue()))
+            variants.setdefault(name, {})[str(width)] = saved
+    result['variants'] = variants
+    return result
+
+
+@shared_task
+def generate_image_variants(model_label, pk, field_name):
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+
+    field_file = getattr(instance, field_name)
+    variants_field = variants_field_name(field_name)
+    delete_variants(field_file.storage, getattr(instance, variants_field))
+    variants = build_variants(field_file) if field_file else {}
+    # Only store them while the row still holds this file; a replacement has
+    # queued its own run.
+    if field_file:
+        unchanged = Q(**{field_name: field_file.name})
+    else:
+        unchanged = Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+    updated = model.objects.filter(unchanged, pk=pk).update(**{variants_field: variants, 'updated_at': timezone.now()})
+    if not updated:
+        delete_variants(field_file.storage, variants)
+        return None
+    setattr(instance, variants_field, variants)
+    variants_generated.send(sender=model, instance=instance, field_name=field_name)
+    return variants
+
+
+def schedule_image_variants(instance, field_name):
+    """
+    Queues :func:`generate_image_variants` after commit when the file in
+    ``field_name`` differs from the one the stored variants were built from.
+    """
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field_name(field_name)) or {}
+    if (field_file.name or None) == variants.get('source'):
+        return
+    model_label, pk = instance._meta.label, instance.pk
+    transaction.on_commit(lambda: generate_image_variants.delay(model_label, pk, field_name))
+
+
+def schedule_variants_cleanup(instance, field_name):
+    """
+    Deletes the stored variants of ``field_name`` once the deletion of
+    ``instance`` commits.
+    """
+    storage = getattr(instance, field_name).storage
+    variants = getattr(instance, variants_field_name(field_name))
+    if variants:
+        transaction.on_commit(lambda: delete_variants(storage, variants))
@@ -1,6 +1,26 @@
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework.response import Response
 
+from core.pagination import KeysetPagination
+from core.prefetch import get_prefetch_plan, get_sparse_prefetch_plan, apply_prefetch_plan
+from core.renderers import json_dumps
+from core.serializers import apply_fieldset_params
+
+
 class OptionalPaginationMixin:
+    """
+    ``?pagination=false`` disables pagination, ``?pagination=cursor`` (or a
+    ``?cursor=`` from a previous page) switches to keyset pagination.
+
+    Unpaginated JSON responses are streamed: the queryset is read in chunks of
+    ``stream_chunk_size`` rows and encoded item by item, so memory stays flat
+    whatever the size of the table.
+    """
+    cursor_pagination_class = KeysetPagination
+    stream_chunk_size = 500
+
     def get_paginate_queryset(self, queryset):
         """
         Handles DRF's pagination logic.
@@ -10,10 +30,20 @@ class OptionalPaginationMixin:
         return super().paginate_queryset(queryset)
 
     def get_pagination_class(self):
-        if self.request.query_params.get("pagination") == "false":
+        mode = self.request.query_params.get("pagination")
+        if mode == "false":
             return None
+        if mode == "cursor" or "cursor" in self.request.query_params:
+            return self.cursor_pagination_class
         return self.pagination_class
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.get_pagination_class()
+            self._paginator = pagination_class() if pagination_class is not None else None
+        return self._paginator
+
     def paginate_queryset(self, queryset):
         if self.get_pagination_class() is None:
             return None
@@ -23,3 +53,119 @@ class OptionalPaginationMixin:
         if self.get_pagination_class() is None:
             return Response(data)
         return super().get_paginated_response(data)
+
+    def list(self, request, *args, **kwargs):
+        if self.get_pagination_class() is None and request.accepted_renderer.format == 'json':
+            queryset = self.filter_queryset(self.get_queryset())
+            return StreamingHttpResponse(
+                self.stream_json(queryset),
+                content_type=request.accepted_renderer.media_type,
+            )
+        return super().list(request, *args, **kwargs)
+
+    def stream_json(self, queryset):
+        chunk, first = [], True
+
+        yield b'['
+        for instance in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(instance)
+            if len(chunk) == self.stream_chunk_size:
+                yield from self._encode_chunk(chunk, first)
+                chunk, first = [], False
+        if chunk:
+            yield from self._encode_chunk(chunk, first)
+        yield b']'
+
+    def _encode_chunk(self, chunk, first):
+        items = self.get_serializer(chunk, many=True).data
+        body = b','.join(json_dumps(item) for item in items)
+        yield body if first else b',' + body
+
+
+class PrefetchPlanMixin:
+    """
+    Applies the ``select_related`` / ``prefetch_related`` lookups derived from the
+    view's serializer, so rendering costs a fixed number of queries.
+    """
+
+    def get_prefetch_plan(self):
+        return get_prefetch_plan(self.get_serializer_class())
+
+    def get_queryset(self):
+        return apply_prefetch_plan(super().get_queryset(), self.get_prefetch_plan())
+
+
+class SparseFieldsetMixin:
+    """
+    ``?fields=name,slug,tags.name`` keeps only the listed (dotted for nested)
+    fields and ``?expand=category,tags`` keeps only the listed nested
+    serializers expanded, collapsing the others to slugs; ``?expand=`` alone
+    collapses them all. Combined with ``PrefetchPlanMixin`` the prefetches are
+    derived from the trimmed serializer, so dropped relations cost nothing.
+    """
+    fields_param = 'fields'
+    expand_param = 'expand'
+
+    def get_fieldset(self):
+        """
+        :return: The raw ``(fields, expand)`` values, or ``None`` without either.
+        """
+        params = self.request.query_params
+        fields, expand = params.get(self.fields_param) or None, params.get(self.expand_param)
+        if fields is None and expand is None:
+            return None
+        return fields, expand
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            apply_fieldset_params(serializer, *fieldset)
+        return serializer
+
+    def get_prefetch_plan(self):
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return super().get_prefetch_plan()
+        return get_sparse_prefetch_plan(self.get_serializer_class(), *fieldset)
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified revalidation for ``GET`` handlers.
+
+    Views implement :meth:`get_version`, a cheap lookup returning
+    ``(etag, last_modified)`` for the requested resource (or ``None`` when it
+    does not exist), and render the resource in ``retrieve()``. A matching
+    ``If-None-Match`` / ``If-Modified-Since`` is answered with 304 before
+    ``retrieve()`` runs any serializer.
+    """
+
+    def get_version(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version(request, *args, **kwargs)
+        if version is None:
+            return self.retrieve(request, *args, **kwargs)
+
+        etag, last_modified = version
+        renderer_format = getattr(request.accepted_renderer, 'format', 'json')
+        if etag and renderer_format != 'json':
+            # Other encodings of the same resource are different representations.
+            etag = f"{etag}-{renderer_format}"
+        etag = quote_etag(etag) if etag else None
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = self.retrieve(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        if timestamp is not None:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
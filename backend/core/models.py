@@ -1,4 +1,9 @@
 import os
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.utils.deconstruct import deconstructible
 from django.core.validators import ValidationError
@@ -116,6 +121,13 @@ class SeoModel(models.Model):
         validators=[FileSizeValidator(max_size_mb=3)],
         help_text=_("Image for social media sharing."),
     )
+    og_image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("OG Image Variants"),
+        help_text=_("Resized copies of the OG image, generated after upload."),
+    )
 
     twitter_title = models.CharField(
         max_length=255,
@@ -156,6 +168,33 @@ class SeoModel(models.Model):
         abstract = True
 
 
+def cached_structured_data(method):
+    """
+    Caches a model's ``get_structured_data(frontend_base_url)`` per object.
+
+    The key includes ``updated_at``, so any save (or touch of ``updated_at``)
+    makes the next call rebuild the JSON-LD instead of serving a stale copy.
+    """
+    @wraps(method)
+    def wrapper(self, frontend_base_url: str) -> str:
+        if self.pk is None or self.updated_at is None:
+            return method(self, frontend_base_url)
+
+        key = "jsonld:{}:{}:{:.6f}:{}".format(
+            self._meta.label_lower,
+            self.pk,
+            self.updated_at.timestamp(),
+            md5(frontend_base_url.encode()).hexdigest(),
+        )
+        data = cache.get(key)
+        if data is None:
+            data = method(self, frontend_base_url)
+            cache.set(key, data, timeout=settings.STRUCTURED_DATA_CACHE_TIMEOUT)
+        return data
+
+    return wrapper
+
+
 SEO_MODEL_FIELDS = [
     'meta_title',
     'meta_description',
@@ -0,0 +1,141 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over ``(<ordering field>, id)``.
+
+    Pages are addressed by opaque cursors holding the last row's key, so every
+    page costs the same indexed range scan and no ``COUNT(*)`` is issued. The
+    ordering field is taken from ``?ordering=`` when it is one of the view's
+    ``ordering_fields``, otherwise from the model's default ordering.
+    """
+    cursor_query_param = 'cursor'
+    ordering_param = api_settings.ORDERING_PARAM
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, queryset, view):
+        allowed = list(getattr(view, 'ordering_fields', None) or [])
+        requested = request.query_params.get(self.ordering_param, '').split(',')[0].strip()
+        if requested and requested.lstrip('-') in allowed and self.is_model_field(queryset.model, requested):
+            return requested
+
+        for field in queryset.model._meta.ordering or ():
+            if isinstance(field, str) and field.lstrip('-') != 'id':
+                return field
+        return 'id'
+
+    def is_model_field(self, model, ordering):
+        try:
+            model._meta.get_field(ordering.lstrip('-'))
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    def encode_cursor(self, ordering, row, direction):
+        field = ordering.lstrip('-')
+        value = getattr(row, field)
+        if field != 'id' and value is not None:
+            value = row._meta.get_field(field).value_to_string(row)
+        payload = {'o': ordering, 'v': value, 'id': row.pk, 'd': direction}
+        token = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token.rstrip('='))
+
+    def decode_cursor(self, request, model, ordering):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            if payload['o'] != ordering or payload['d'] not in ('n', 'p'):
+                raise ValueError
+            field = model._meta.get_field(ordering.lstrip('-'))
+            value = payload['v'] if payload['v'] is None else field.to_python(payload['v'])
+            return value, int(payload['id']), payload['d']
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def seek(self, field, value, pk, descending):
+        """
+        Rows strictly after ``(value, pk)``; NULLs sort first ascending and last descending.
+        """
+        after = 'lt' if descending else 'gt'
+        if field == 'id':
+            return Q(**{f'id__{after}': pk})
+
+        if value is None:
+            condition = Q(**{f'{field}__isnull': True, f'id__{after}': pk})
+            return condition if descending else condition | Q(**{f'{field}__isnull': False})
+
+        condition = Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk})
+        return condition | Q(**{f'{field}__isnull': True}) if descending else condition
+
+    def order(self, queryset, field, descending):
+        if field == 'id':
+            return queryset.order_by('-id' if descending else 'id')
+        if descending:
+            return queryset.order_by(F(field).desc(nulls_last=True), '-id')
+        return queryset.order_by(F(field).asc(nulls_first=True), 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        self.ordering = self.get_ordering(request, queryset, view)
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+
+        cursor = self.decode_cursor(request, queryset.model, self.ordering)
+        direction = cursor[2] if cursor else 'n'
+        backwards = direction == 'p'
+
+        queryset = self.order(queryset, field, descending != backwards)
+        if cursor:
+            queryset = queryset.filter(self.seek(field, cursor[0], cursor[1], descending != backwards))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+
+        self.has_next = has_more if not backwards else True
+        self.has_previous = (cursor is not None) if not backwards else has_more
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.ordering, self.page[-1], 'n')
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.ordering, self.page[0], 'p')
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,112 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+
+from core.serializers import apply_fieldset_params
+
+
+def _walk_relations(model, source_attrs):
+    """
+    Follows a dotted serializer source over the model relations.
+
+    Returns the relation path (list of field names), whether any hop is a
+    to-many relation, and the model at the end of the path.
+    """
+    path = []
+    many = False
+    for attr in source_attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        path.append(attr)
+        many = many or field.many_to_many or field.one_to_many
+        model = field.related_model
+    return path, many, model
+
+
+def build_prefetch_plan(serializer):
+    """
+    Builds the ``select_related`` / ``prefetch_related`` lookups needed to render
+    ``serializer`` without issuing a query per object.
+
+    Forward foreign keys and one-to-one relations are joined, to-many relations
+    are prefetched, and nested serializers are followed recursively so their own
+    relations are loaded with the parent.
+
+    :param serializer: A serializer instance (or ``ListSerializer``).
+    :return: A tuple of ``(select_related, prefetch_related)`` lookup lists.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is None:
+        return [], []
+
+    select_related, prefetch_related = [], []
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            nested = field.child
+        elif isinstance(field, serializers.BaseSerializer):
+            nested = field
+        elif isinstance(field, ManyRelatedField):
+            nested = None
+        elif isinstance(field, PrimaryKeyRelatedField):
+            # DRF reads ``<fk>_id`` directly for single primary key relations.
+            continue
+        elif isinstance(field, RelatedField) or '.' in field.source:
+            nested = None
+        else:
+            continue
+
+        path, many, _ = _walk_relations(model, field.source_attrs)
+        if not path:
+            continue
+
+        lookup = '__'.join(path)
+        nested_select, nested_prefetch = build_prefetch_plan(nested) if nested is not None else ([], [])
+
+        if many:
+            prefetch_related.append(lookup)
+            prefetch_related += [f"{lookup}__{item}" for item in nested_select + nested_prefetch]
+        else:
+            select_related.append(lookup)
+            select_related += [f"{lookup}__{item}" for item in nested_select]
+            prefetch_related += [f"{lookup}__{item}" for item in nested_prefetch]
+
+    return list(dict.fromkeys(select_related)), list(dict.fromkeys(prefetch_related))
+
+
+@lru_cache(maxsize=None)
+def get_prefetch_plan(serializer_class):
+    """
+    Cached :func:`build_prefetch_plan` for a serializer class with its default fields.
+    """
+    return build_prefetch_plan(serializer_class())
+
+
+def apply_prefetch_plan(queryset, plan):
+    select_related, prefetch_related = plan
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+@lru_cache(maxsize=256)
+def get_sparse_prefetch_plan(serializer_class, fields, expand):
+    """
+    Cached :func:`build_prefetch_plan` for a serializer class trimmed by the
+    raw ``?fields=`` / ``?expand=`` values (``expand`` may be ``None``).
+    """
+    return build_prefetch_plan(apply_fieldset_params(serializer_class(), fields, expand))
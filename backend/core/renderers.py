@@ -0,0 +1,62 @@
+"""
+Faster renderers for the public API.
+
+``ORJSONRenderer`` encodes with orjson when it is installed and falls back to
+DRF's stdlib encoder otherwise, so the output is the same JSON either way.
+``MessagePackRenderer`` answers ``Accept: application/msgpack`` (or
+``?format=msgpack``) and is only enabled in settings when msgpack is
+installed. Both hand anything they cannot encode natively (``Decimal``, lazy
+translations, querysets...) to DRF's ``JSONEncoder.default``.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def json_dumps(data):
+    """
+    Compact JSON for ``data`` as ``bytes``, with orjson when available.
+    """
+    if orjson is None:
+        return _encoder.encode(data).encode()
+    return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        option = orjson.OPT_NON_STR_KEYS
+        # orjson only pretty prints with two spaces; any requested indent gets those.
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=_encoder.default, option=option)
+        # Keep the output a strict JavaScript subset, like DRF does.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
@@ -0,0 +1,98 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Renders a ``<field>_variants`` map (see ``core.images``) as one ``srcset``
+    string per format, e.g. ``{"webp": "https://…/a_320w.webp 320w, …"}``.
+    URLs are absolute when the request is in the serializer context.
+    """
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        srcsets = {}
+        for name, widths in (value or {}).get('variants', {}).items():
+            candidates = []
+            for width, path in sorted(widths.items(), key=lambda item: int(item[0])):
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                candidates.append(f"{url} {width}w")
+            srcsets[name] = ", ".join(candidates)
+        return srcsets
+
+
+def parse_fieldset(value):
+    """
+    Parses ``"name,tags.name,tags.slug"`` into
+    ``{'name': {}, 'tags': {'name': {}, 'slug': {}}}``.
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def collapse_nested(field, field_name):
+    """
+    A read-only field rendering the objects of the nested serializer ``field``
+    by slug (or primary key when the model has no slug).
+    """
+    nested = field.child if isinstance(field, serializers.ListSerializer) else field
+    model = nested.Meta.model
+    kwargs = {'read_only': True, 'many': isinstance(field, serializers.ListSerializer)}
+    if field.source != field_name:
+        kwargs['source'] = field.source
+    try:
+        model._meta.get_field('slug')
+    except FieldDoesNotExist:
+        return serializers.PrimaryKeyRelatedField(**kwargs)
+    return serializers.SlugRelatedField(slug_field='slug', **kwargs)
+
+
+def apply_fieldset(serializer, fields=None, expand=None):
+    """
+    Trims a serializer tree in place.
+
+    :param fields: Parsed ``?fields=``; only these fields are kept, and a
+        nested field with sub-paths keeps only those. ``None`` keeps everything.
+    :param expand: Parsed ``?expand=``; nested serializers not listed are
+        collapsed to slugs. ``None`` keeps every nested serializer expanded.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    if fields:
+        for name in [name for name in serializer.fields if name not in fields]:
+            serializer.fields.pop(name)
+
+    for name, field in list(serializer.fields.items()):
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if not isinstance(nested, serializers.ModelSerializer):
+            continue
+        if expand is not None and name not in expand:
+            serializer.fields[name] = collapse_nested(field, name)
+        else:
+            apply_fieldset(
+                nested,
+                (fields or {}).get(name) or None,
+                expand.get(name) if expand is not None else None,
+            )
+    return serializer
+
+
+def apply_fieldset_params(serializer, fields, expand):
+    """
+    :func:`apply_fieldset` from the raw ``?fields=`` and ``?expand=`` values
+    (``None`` when the parameter is absent).
+    """
+    return apply_fieldset(
+        serializer,
+        parse_fieldset(fields) or None,
+        None if expand is None else parse_fieldset(expand),
+    )
@@ -1,5 +1,7 @@
 import uuid
 import environ
+from importlib.util import find_spec
+from celery.schedules import crontab
 
 from django.utils.translation import gettext_lazy as _
 from pathlib import Path
@@ -241,6 +243,14 @@ REST_FRAMEWORK = {
     #     'user': '1000/day',  # Limit authenticated users to 1000 requests per day
     # },
 
+    # orjson-backed JSON (stdlib fallback) and, when msgpack is installed,
+    # MessagePack for clients sending `Accept: application/msgpack`
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['core.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    ],
+
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 25,
 
@@ -323,10 +333,58 @@ CELERY_TASK_RETRY = True
 CELERY_TASK_DEFAULT_RETRY_DELAY = 60
 CELERY_TASK_MAX_RETRIES = 3
 CELERY_TIMEZONE = 'UTC'
+# Tests run Celery tasks inline, see core.testing.TestRunner
+TEST_RUNNER = 'core.testing.TestRunner'
 CELERY_BEAT_SCHEDULE = {
     # Example: 'task_name': {'task': 'task_path', 'schedule': 'interval_or_cron'}
+    'rebuild-related-herbs': {
+        'task': 'herbs.tasks.rebuild_related_herbs',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'expire-stock-holds': {
+        'task': 'checkout.tasks.expire_stock_holds',
+        'schedule': crontab(minute='*'),
+    },
+    'scan-low-stock': {
+        'task': 'inventory.tasks.scan_low_stock',
+        'schedule': crontab(minute='*/15'),
+    },
+    'take-ledger-snapshots': {
+        'task': 'inventory.tasks.take_ledger_snapshots',
+        'schedule': crontab(hour=2, minute=0),
+    },
 }
 
+# PostgreSQL text search configuration of the herb full-text index
+HERBS_SEARCH_CONFIG = env("HERBS_SEARCH_CONFIG", default="english")
+# Seconds a worker serves its autocomplete index before checking for changes
+AUTOCOMPLETE_REFRESH_INTERVAL = env.int("AUTOCOMPLETE_REFRESH_INTERVAL", default=5)
+# Seconds a rendered herb detail document stays cached
+HERB_DETAIL_CACHE_TIMEOUT = env.int("HERB_DETAIL_CACHE_TIMEOUT", default=60 * 60 * 24)
+# Seconds the rendered taxonomy bundle stays cached
+HERB_TAXONOMY_CACHE_TIMEOUT = env.int("HERB_TAXONOMY_CACHE_TIMEOUT", default=60 * 60 * 24)
+# Seconds a model's JSON-LD structured data stays cached
+STRUCTURED_DATA_CACHE_TIMEOUT = env.int("STRUCTURED_DATA_CACHE_TIMEOUT", default=60 * 60 * 24 * 7)
+# Widths (px) and formats of the responsive variants generated for uploaded images
+IMAGE_VARIANT_WIDTHS = env.list("IMAGE_VARIANT_WIDTHS", cast=int, default=[320, 640, 1024, 1600])
+IMAGE_VARIANT_FORMATS = env.list("IMAGE_VARIANT_FORMATS", default=["avif", "webp", "jpeg"])
+# Number of related herbs stored per herb
+HERBS_RELATED_COUNT = env.int("HERBS_RELATED_COUNT", default=8)
+# Related herb similarity: "cosine" or "jaccard"
+HERBS_SIMILARITY_METRIC = env("HERBS_SIMILARITY_METRIC", default="cosine")
+# Seconds related herb updates wait to coalesce further changes
+HERBS_RELATED_UPDATE_DELAY = env.int("HERBS_RELATED_UPDATE_DELAY", default=30)
+# Resolve herb category/tag/symptom filters from an in-memory bitmap index
+HERBS_BITMAP_INDEX = env.bool("HERBS_BITMAP_INDEX", default=False)
+# Currency used to order the herb catalog by price when ?currency= is not given
+HERBS_PRICE_CURRENCY = env("HERBS_PRICE_CURRENCY", default="USD")
+# Seconds a shopping cart holds the stock of its items
+STOCK_RESERVATION_TTL = env.int("STOCK_RESERVATION_TTL", default=15 * 60)
+# Redis holding cart reservations; empty keeps them in the database
+STOCK_RESERVATION_REDIS_URL = env("STOCK_RESERVATION_REDIS_URL", default=None)
+# Seconds stock ledger snapshots stay behind, longer than any stock transaction
+STOCK_LEDGER_SNAPSHOT_LAG = env.int("STOCK_LEDGER_SNAPSHOT_LAG", default=5 * 60)
+
 CKEDITOR_5_CONFIGS = BASE_CKEDITOR_5_CONFIGS
 PHONENUMBER_DEFAULT_FORMAT = "INTERNATIONAL"
 
@@ -0,0 +1,104 @@
+"""
+Streaming XML sitemaps.
+
+``sitemap.xml`` is an index pointing at ``sitemap-<section>-<page>.xml`` files
+of at most ``StreamingSitemap.limit`` URLs each. Every file is read with
+``values_list(...).iterator()`` and written out row by row, so neither the
+queryset nor the document is ever held in memory, and each response is cached
+downstream for ``max_age`` seconds so crawlers mostly hit the proxy.
+"""
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+class StreamingSitemap:
+    limit = 5000
+    chunk_size = 1000
+    lastmod_field = 'updated_at'
+    fields = ('slug',)
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def location(self, row):
+        """
+        :param row: Tuple of ``fields`` followed by the lastmod value.
+        :return: Path of the page on the frontend.
+        """
+        raise NotImplementedError
+
+    def ordered(self):
+        return self.get_queryset().order_by('id')
+
+    def page_count(self):
+        count = self.ordered().count()
+        return max((count + self.limit - 1) // self.limit, 1)
+
+    def page(self, number):
+        start = (number - 1) * self.limit
+        return self.ordered()[start:start + self.limit]
+
+    def page_lastmod(self, number):
+        return self.page(number).aggregate(lastmod=Max(self.lastmod_field))['lastmod']
+
+    def rows(self, number):
+        return self.page(number).values_list(*self.fields, self.lastmod_field).iterator(
+            chunk_size=self.chunk_size
+        )
+
+
+def _frontend_url(path):
+    return settings.FRONTEND_DOMAIN.rstrip('/') + path
+
+
+def _lastmod(value):
+    return f"<lastmod>{value.isoformat()}</lastmod>" if value else ""
+
+
+def _stream(lines):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield from lines
+
+
+def _response(lines, max_age):
+    response = StreamingHttpResponse(_stream(lines), content_type='application/xml; charset=utf-8')
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def index(request, sitemaps, section_url_name, max_age=60 * 60):
+    def lines():
+        yield f'<sitemapindex xmlns="{SITEMAP_NS}">\n'
+        for section, sitemap in sitemaps.items():
+            for number in range(1, sitemap.page_count() + 1):
+                location = request.build_absolute_uri(
+                    reverse(section_url_name, kwargs={'section': section, 'page': number})
+                )
+                yield (
+                    f"<sitemap><loc>{escape(location)}</loc>"
+                    f"{_lastmod(sitemap.page_lastmod(number))}</sitemap>\n"
+                )
+        yield '</sitemapindex>\n'
+
+    return _response(lines(), max_age)
+
+
+def section(request, sitemaps, section, page, max_age=60 * 60):
+    sitemap = sitemaps.get(section)
+    if sitemap is None or page < 1 or (page > 1 and page > sitemap.page_count()):
+        raise Http404("No such sitemap")
+
+    def lines():
+        yield f'<urlset xmlns="{SITEMAP_NS}">\n'
+        for row in sitemap.rows(page):
+            yield f"<url><loc>{escape(_frontend_url(sitemap.location(row)))}</loc>{_lastmod(row[-1])}</url>\n"
+        yield '</urlset>\n'
+
+    return _response(lines(), max_age)
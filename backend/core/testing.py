@@ -0,0 +1,52 @@
+import json
+
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+from core.celery import app
+
+
+def read_json(response):
+    """
+    Decodes a JSON body from a regular or a streaming response.
+    """
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return response.json()
+
+
+class QueryBudgetMixin:
+    """
+    Test helper that fails when an endpoint goes over its query budget.
+
+    Subclasses declare ``query_budgets`` as a mapping of a label to the maximum
+    number of queries the request may issue.
+    """
+    query_budgets = {}
+
+    def get_with_query_count(self, url, data=None, **extra):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data, **extra)
+            if response.streaming:
+                # Streaming bodies run their queries while being consumed.
+                response.streaming_content = [b''.join(response.streaming_content)]
+        return response, len(context.captured_queries), context.captured_queries
+
+    def assertWithinQueryBudget(self, label, url, data=None, **extra):
+        budget = self.query_budgets[label]
+        response, count, queries = self.get_with_query_count(url, data, **extra)
+        if count > budget:
+            executed = "\n".join(f"{i}. {query['sql']}" for i, query in enumerate(queries, start=1))
+            self.fail(f"{label}: {count} queries exceeds the budget of {budget}.\n{executed}")
+        return response, count
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs Celery tasks inline, so the tests need no broker or worker.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        app.conf.update(task_always_eager=True, task_eager_propagates=True)
@@ -25,6 +25,16 @@ from django.conf.urls.static import static
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from blog.sitemaps import PostSitemap
+from core import sitemaps
+from herbs.sitemaps import HerbSitemap, CategorySitemap
+
+SITEMAPS = {
+    'herbs': HerbSitemap(),
+    'categories': CategorySitemap(),
+    'posts': PostSitemap(),
+}
+
 urlpatterns = [
     path('api/v1/account/', include('account.v1.urls', namespace='account-v1')),
     path('api/', include('main.urls', namespace='main')),
@@ -52,5 +62,12 @@ urlpatterns += [
     path('api/schema/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='docs'),
 ]
 
+urlpatterns += [
+    path('sitemap.xml', sitemaps.index, {'sitemaps': SITEMAPS, 'section_url_name': 'sitemap_section'},
+         name='sitemap_index'),
+    path('sitemap-<slug:section>-<int:page>.xml', sitemaps.section, {'sitemaps': SITEMAPS},
+         name='sitemap_section'),
+]
+
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class HerbsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'herbs'
+
+    def ready(self):
+        import herbs.signals
+
+        post_migrate.connect(herbs.signals.ensure_search_index, sender=self)
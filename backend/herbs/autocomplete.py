@@ -0,0 +1,144 @@
+"""
+In-memory autocomplete index for the herb catalog search box.
+
+Every worker keeps its own index of herb names, latin names, symptoms, tags and
+categories. Lookups walk a sorted prefix table and fall back to trigram
+similarity for typos, so answering a keystroke never touches the database.
+Model signals bump a shared version in the cache once their transaction
+commits; workers notice it within ``AUTOCOMPLETE_REFRESH_INTERVAL`` seconds
+and rebuild on the next lookup.
+"""
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+
+from core.caching import VersionedObject
+from herbs.models import Herb, Symptom, Tag, Category
+
+VERSION_CACHE_KEY = 'herbs:autocomplete:version'
+REFRESH_INTERVAL = settings.AUTOCOMPLETE_REFRESH_INTERVAL
+MIN_SIMILARITY = 0.3
+
+Suggestion = namedtuple('Suggestion', ['type', 'name', 'slug'])
+
+
+def normalize(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in value if not unicodedata.combining(char)).casefold().strip()
+
+
+def trigrams(value):
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AutocompleteIndex:
+    def __init__(self, entries):
+        """
+        :param entries: Iterable of ``(text, Suggestion)`` pairs; a suggestion may
+            appear under several texts (e.g. a herb's name and latin name).
+        """
+        self.suggestions = []
+        self.keys = []
+        self.grams = []
+        self.postings = defaultdict(list)
+
+        positions = {}
+        for text, suggestion in entries:
+            text = normalize(text)
+            if not text:
+                continue
+            position = positions.setdefault(suggestion, len(self.suggestions))
+            if position == len(self.suggestions):
+                self.suggestions.append(suggestion)
+
+            words = text.split()
+            for start in range(len(words)):
+                self.keys.append((' '.join(words[start:]), start, position))
+
+            text_grams = trigrams(text)
+            text_id = len(self.grams)
+            self.grams.append((len(text_grams), position))
+            for gram in text_grams:
+                self.postings[gram].append(text_id)
+
+        self.keys.sort()
+
+    def _allowed(self, position, types):
+        return not types or self.suggestions[position].type in types
+
+    def _prefix_matches(self, query, limit, types=None):
+        matches = {}
+        index = bisect_left(self.keys, (query,))
+        while index < len(self.keys) and len(matches) < limit * 4:
+            key, start, position = self.keys[index]
+            if not key.startswith(query):
+                break
+            index += 1
+            if not self._allowed(position, types):
+                continue
+            # Matches at the start of the text beat matches on a later word.
+            rank = (0 if start == 0 else 1, len(key))
+            if position not in matches or rank < matches[position]:
+                matches[position] = rank
+        return sorted(matches, key=lambda position: (matches[position], self.suggestions[position].name))
+
+    def _fuzzy_matches(self, query, exclude, types=None):
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scores = {}
+        for text_id, count in shared.items():
+            size, position = self.grams[text_id]
+            if position in exclude or not self._allowed(position, types):
+                continue
+            score = count / (len(query_grams) + size - count)
+            if score >= MIN_SIMILARITY and score > scores.get(position, 0):
+                scores[position] = score
+        return sorted(scores, key=lambda position: (-scores[position], self.suggestions[position].name))
+
+    def lookup(self, query, limit=10, types=None):
+        """
+        :param types: Suggestion types to keep, all by default. The filter
+            applies before ``limit``.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        positions = self._prefix_matches(query, limit, types)
+        if len(positions) < limit and len(query) >= 3:
+            positions += self._fuzzy_matches(query, set(positions), types)
+        return [self.suggestions[position] for position in positions[:limit]]
+
+
+def build_index():
+    entries = []
+    for name, latin_name, slug in Herb.objects.filter(is_active=True).values_list(
+            'name', 'latin_name', 'slug'
+    ):
+        suggestion = Suggestion('herb', name, slug)
+        entries.append((name, suggestion))
+        if latin_name:
+            entries.append((latin_name, suggestion))
+
+    for kind, model in (('symptom', Symptom), ('tag', Tag), ('category', Category)):
+        for name, slug in model.objects.filter(is_active=True).values_list('name', 'slug'):
+            entries.append((name, Suggestion(kind, name, slug)))
+
+    return AutocompleteIndex(entries)
+
+
+_holder = VersionedObject(VERSION_CACHE_KEY, build_index, refresh_interval=REFRESH_INTERVAL)
+
+
+def get_index():
+    return _holder.get()
+
+
+def invalidate_index():
+    _holder.invalidate()
@@ -0,0 +1,98 @@
+"""
+Cache of fully rendered herb detail documents.
+
+``HerbDetail`` stores the serialized ``HerbSEOSerializer`` output per slug and
+serves hot pages from the cache. Saving a herb moves its
+``document_updated_at`` forward, and so does :func:`mark_herbs_changed`,
+called by the signals in ``herbs.signals`` whenever anything else rendered in
+the herb's document changes. That timestamp is the source of the detail
+ETag / Last-Modified; ``updated_at`` is left to the herb's own edits.
+
+Every herb also has a document version in the cache, bumped once a change
+commits. Documents are stored under that version and the request's base URL
+(they embed absolute media URLs) and never rewritten, so a request that
+rendered pre-commit data stores it under a version nobody reads anymore.
+"""
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from herbs.models import Herb
+
+
+def _version_key(slug):
+    return f'herbs:detail:version:{slug}'
+
+
+def document_version(slug):
+    key = _version_key(slug)
+    version = cache.get(key)
+    if version is None:
+        # Start from a fresh value, so documents cached under an evicted
+        # version stay unreachable.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def detail_cache_key(slug, version, base_url):
+    return f'herbs:detail:{slug}:{version}:{md5(base_url.encode()).hexdigest()}'
+
+
+def get_detail_document(slug, base_url):
+    """
+    :return: ``(version, document)``, the document being the cached
+        ``(document_updated_at, data)`` pair or ``None``.
+    """
+    version = document_version(slug)
+    return version, cache.get(detail_cache_key(slug, version, base_url))
+
+
+def set_detail_document(slug, version, base_url, updated_at, data):
+    """
+    Caches a document rendered after reading ``version``.
+    """
+    cache.set(
+        detail_cache_key(slug, version, base_url), (updated_at, data), timeout=settings.HERB_DETAIL_CACHE_TIMEOUT
+    )
+
+
+def invalidate_detail_documents(slugs):
+    """
+    Bumps the document version of ``slugs`` once the current transaction
+    commits, so a concurrent request cannot re-cache the pre-commit state.
+    """
+    slugs = {slug for slug in slugs if slug}
+    if not slugs:
+        return
+
+    def bump():
+        for slug in slugs:
+            try:
+                cache.incr(_version_key(slug))
+            except ValueError:
+                # No version yet; the next read starts a fresh one.
+                pass
+
+    transaction.on_commit(bump)
+
+
+def mark_herbs_changed(herb_ids):
+    herb_ids = {herb_id for herb_id in herb_ids or () if herb_id is not None}
+    if herb_ids:
+        _mark_changed(Herb.objects.filter(id__in=herb_ids))
+
+
+def mark_herbs_changed_matching(**lookup):
+    _mark_changed(Herb.objects.filter(**lookup))
+
+
+def _mark_changed(queryset):
+    slugs = list(queryset.values_list('slug', flat=True))
+    if slugs:
+        Herb.objects.filter(slug__in=slugs).update(document_updated_at=timezone.now())
+        invalidate_detail_documents(slugs)
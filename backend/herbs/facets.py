@@ -0,0 +1,51 @@
+"""
+Facet counts for the herb filter sidebar.
+
+Each facet is counted with one grouped aggregate over the herbs matching the
+current search and every *other* facet filter, so a sidebar can show how many
+herbs each value would return without one query per value.
+"""
+from django.db.models import Count
+
+from herbs.models import Herb
+from herbs.search import get_search_backend
+from herbs.v1.filters import HerbFilter
+
+# Facet name (also its HerbFilter parameter) -> relation from Herb.
+FACETS = {
+    'category': 'category',
+    'tags': 'tags',
+    'symptoms': 'symptoms',
+}
+
+
+def _matching_herbs(queryset, params, request, exclude):
+    data = params.copy()
+    data.pop(exclude, None)
+    filtered = HerbFilter(data=data, queryset=queryset, request=request).qs
+
+    query = params.get('search', '')
+    if query.strip():
+        filtered = get_search_backend().search(filtered, query)
+    return filtered.order_by().values('id')
+
+
+def facet_counts(queryset, params, request=None, facets=None):
+    """
+    :param queryset: Base herb queryset (e.g. active herbs).
+    :param params: Query parameters holding the ``HerbFilter`` values and ``search``.
+    :param facets: Facet names to count; defaults to all of :data:`FACETS`.
+    :return: ``{facet: [{'slug', 'name', 'count'}, ...]}`` ordered by count.
+    """
+    results = {}
+    for facet in facets or FACETS:
+        relation = FACETS[facet]
+        rows = (
+            Herb.objects.filter(id__in=_matching_herbs(queryset, params, request, facet))
+            .filter(**{f'{relation}__is_active': True})
+            .values_list(f'{relation}__slug', f'{relation}__name')
+            .annotate(count=Count('id', distinct=True))
+            .order_by('-count', f'{relation}__name')
+        )
+        results[facet] = [{'slug': slug, 'name': name, 'count': count} for slug, name, count in rows]
+    return results
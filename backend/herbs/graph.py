@@ -0,0 +1,150 @@
+"""
+Herb / illness / symptom / ailment knowledge graph closure.
+
+Herbs link to illnesses, symptoms and ailments, and illnesses link to
+symptoms and ailments. ``HerbConditionLink`` stores, for every condition, the
+herbs reachable from it in at most two hops:
+
+* 1 hop: the herb is linked to the condition itself;
+* 2 hops: through an illness, i.e. the herb is linked to an illness having
+  the symptom or ailment, or to a symptom or ailment of the illness.
+
+Each row keeps the shortest distance and the number of paths, so "herbs for
+this illness, directly or through its symptoms" is one indexed read. The
+receivers in ``herbs.signals`` recompute the rows of the affected herbs after
+every committed change of the underlying M2Ms; ``rebuild_herb_graph``
+recomputes the whole table.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from herbs.models import Herb, HerbConditionLink, Illness
+
+ILLNESS = HerbConditionLink.KindChoices.ILLNESS
+SYMPTOM = HerbConditionLink.KindChoices.SYMPTOM
+AILMENT = HerbConditionLink.KindChoices.AILMENT
+
+
+def _edges(through, source, target, *conditions, **lookup):
+    edges = defaultdict(set)
+    for source_id, target_id in through.objects.filter(*conditions, **lookup).values_list(source, target):
+        edges[source_id].add(target_id)
+    return edges
+
+
+def _invert(edges):
+    inverted = defaultdict(set)
+    for source_id, targets in edges.items():
+        for target_id in targets:
+            inverted[target_id].add(source_id)
+    return inverted
+
+
+def build_links(herb_ids=None):
+    """
+    :param herb_ids: Herbs to compute the links of; every herb when ``None``.
+    :return: Unsaved ``HerbConditionLink`` rows.
+    """
+    herb_lookup = {} if herb_ids is None else {'herb_id__in': herb_ids}
+    herb_edges = {
+        ILLNESS: _edges(Herb.illnesses.through, 'herb_id', 'illness_id', **herb_lookup),
+        SYMPTOM: _edges(Herb.symptoms.through, 'herb_id', 'symptom_id', **herb_lookup),
+        AILMENT: _edges(Herb.ailments.through, 'herb_id', 'ailment_id', **herb_lookup),
+    }
+
+    def linked(kind):
+        return {target_id for targets in herb_edges[kind].values() for target_id in targets}
+
+    if herb_ids is None:
+        symptom_filter = ailment_filter = Q()
+    else:
+        illness_ids = linked(ILLNESS)
+        symptom_filter = Q(illness_id__in=illness_ids) | Q(symptom_id__in=linked(SYMPTOM))
+        ailment_filter = Q(illness_id__in=illness_ids) | Q(ailment_id__in=linked(AILMENT))
+    illness_symptoms = _edges(Illness.symptoms.through, 'illness_id', 'symptom_id', symptom_filter)
+    illness_ailments = _edges(Illness.ailments.through, 'illness_id', 'ailment_id', ailment_filter)
+    # Second hop from each kind of condition a herb is linked to.
+    neighbours = {
+        ILLNESS: [(SYMPTOM, illness_symptoms), (AILMENT, illness_ailments)],
+        SYMPTOM: [(ILLNESS, _invert(illness_symptoms))],
+        AILMENT: [(ILLNESS, _invert(illness_ailments))],
+    }
+
+    direct, paths = set(), defaultdict(int)
+    for kind, edges in herb_edges.items():
+        for herb_id, targets in edges.items():
+            for target_id in targets:
+                direct.add((herb_id, kind, target_id))
+                paths[herb_id, kind, target_id] += 1
+                for next_kind, next_edges in neighbours[kind]:
+                    for next_id in next_edges.get(target_id, ()):
+                        paths[herb_id, next_kind, next_id] += 1
+
+    return [
+        HerbConditionLink(
+            herb_id=herb_id,
+            kind=kind,
+            target_id=target_id,
+            hops=1 if (herb_id, kind, target_id) in direct else 2,
+            paths=count,
+        )
+        for (herb_id, kind, target_id), count in paths.items()
+    ]
+
+
+def rebuild_herb_graph():
+    """
+    :return: Number of links written.
+    """
+    links = build_links()
+    with transaction.atomic():
+        HerbConditionLink.objects.all().delete()
+        HerbConditionLink.objects.bulk_create(links, batch_size=1000)
+    return len(links)
+
+
+def refresh_herb_graph(herb_ids):
+    herb_ids = {herb_id for herb_id in herb_ids if herb_id is not None}
+    if not herb_ids:
+        return
+    links = build_links(herb_ids)
+    with transaction.atomic():
+        HerbConditionLink.objects.filter(herb_id__in=herb_ids).delete()
+        HerbConditionLink.objects.bulk_create(links, batch_size=1000)
+
+
+def schedule_graph_refresh(herb_ids):
+    herb_ids = set(herb_ids)
+    if herb_ids:
+        transaction.on_commit(lambda: refresh_herb_graph(herb_ids))
+
+
+def affected_herbs(illness_ids=(), symptom_ids=(), ailment_ids=()):
+    """
+    Herbs linked to any of the given conditions. Evaluated immediately, so it
+    can run before the links are cleared or deleted.
+    """
+    return set(
+        Herb.objects.filter(
+            Q(illnesses__in=illness_ids) | Q(symptoms__in=symptom_ids) | Q(ailments__in=ailment_ids)
+        ).values_list('id', flat=True)
+    )
+
+
+def herbs_for_condition(kind, target_id, max_hops=2):
+    """
+    :return: Active herbs reachable from the condition in at most ``max_hops``,
+        annotated with ``hops`` and ``paths``; closest and best connected first.
+    """
+    return (
+        Herb.objects.filter(
+            is_active=True,
+            condition_links__kind=kind,
+            condition_links__target_id=target_id,
+            condition_links__hops__lte=max_hops,
+        )
+        .annotate(hops=F('condition_links__hops'), paths=F('condition_links__paths'))
+        .order_by('hops', '-paths', 'name', 'id')
+    )
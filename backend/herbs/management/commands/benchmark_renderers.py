@@ -0,0 +1,56 @@
+from timeit import repeat
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.prefetch import get_prefetch_plan, apply_prefetch_plan
+from core.renderers import ORJSONRenderer, MessagePackRenderer, msgpack
+from herbs.models import Herb
+from herbs.v1.serializers import HerbSerializer, HerbSEOSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare API renderer timings on the herb list and detail payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=10, help='Multiplier of the scaled list payload')
+        parser.add_argument('--number', type=int, default=20, help='Renders per timing run')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing runs; the fastest is reported')
+
+    def get_payloads(self, scale):
+        herbs = list(apply_prefetch_plan(Herb.objects.filter(is_active=True), get_prefetch_plan(HerbSerializer)))
+        if not herbs:
+            return {}
+        listing = HerbSerializer(herbs, many=True).data
+        detail = HerbSEOSerializer(
+            apply_prefetch_plan(Herb.objects.filter(pk=herbs[0].pk), get_prefetch_plan(HerbSEOSerializer)).get()
+        ).data
+        return {
+            f"list ({len(herbs)} herbs)": listing,
+            f"list x{scale} ({len(herbs) * scale} herbs)": listing * scale,
+            "detail": detail,
+        }
+
+    def handle(self, *args, **options):
+        payloads = self.get_payloads(options['scale'])
+        if not payloads:
+            self.stdout.write(self.style.WARNING("⚠️ No active herbs; load the fixtures first"))
+            return
+
+        renderers = [JSONRenderer(), ORJSONRenderer()]
+        if msgpack is not None:
+            renderers.append(MessagePackRenderer())
+
+        for name, data in payloads.items():
+            self.stdout.write(f"📦 {name}")
+            baseline = None
+            for renderer in renderers:
+                size = len(renderer.render(data))
+                best = min(repeat(lambda: renderer.render(data), number=options['number'], repeat=options['repeat']))
+                per_render = best / options['number'] * 1000
+                baseline = baseline or per_render
+                self.stdout.write(
+                    f"   {renderer.__class__.__name__:<22} {per_render:9.3f} ms  "
+                    f"{size / 1024:9.1f} KiB  x{baseline / per_render:.2f}"
+                )
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark finished"))
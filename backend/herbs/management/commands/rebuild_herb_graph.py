@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from herbs.graph import rebuild_herb_graph
+
+
+class Command(BaseCommand):
+    help = 'Recompute the herb / illness / symptom / ailment graph closure'
+
+    def handle(self, *args, **options):
+        count = rebuild_herb_graph()
+        self.stdout.write(self.style.SUCCESS(f"✅ Stored {count} herb condition link(s)"))
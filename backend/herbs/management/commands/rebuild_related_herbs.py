@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from herbs.similarity import rebuild_related_herbs
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related herbs (nearest neighbours) of every herb'
+
+    def handle(self, *args, **options):
+        count = rebuild_related_herbs()
+        self.stdout.write(self.style.SUCCESS(f"✅ Stored {count} related herb link(s)"))
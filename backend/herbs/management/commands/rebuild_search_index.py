@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from herbs.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Create the herb full-text search index if needed and reindex every herb'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.ensure_index()
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"✅ Indexed {count} herb(s) with {backend.__class__.__name__}"))
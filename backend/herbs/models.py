@@ -1,12 +1,15 @@
 import json
 from urllib.parse import urljoin
 
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from autoslug import AutoSlugField
 from django_ckeditor_5.fields import CKEditor5Field
 
-from core.models import BaseModel, SeoModel, FileSizeValidator, UploadPath
+from core.models import BaseModel, SeoModel, cached_structured_data, FileSizeValidator, UploadPath
 
 
 class Category(BaseModel):
@@ -31,6 +34,13 @@ class Category(BaseModel):
         verbose_name=_("Image"),
         help_text=_("Optional representative image for the category."),
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("Image Variants"),
+        help_text=_("Resized copies of the image, generated after upload."),
+    )
 
     class Meta:
         verbose_name = _("Category")
@@ -45,6 +55,53 @@ class Category(BaseModel):
         return self.name
 
 
+class SearchVectorColumn(SearchVectorField):
+    """
+    ``tsvector`` on PostgreSQL, an always ``NULL`` placeholder elsewhere.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return super().db_type(connection)
+        return models.CharField(max_length=1).db_type(connection)
+
+
+class SearchVectorIndex(GinIndex):
+    """
+    GIN index on PostgreSQL, a plain index on the placeholder elsewhere.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        return models.Index.create_sql(self, model, schema_editor, using=using, **kwargs)
+
+
+class SearchDocument(models.Func):
+    """
+    Weighted search vector of a herb: name (A), Latin name (B) and description
+    with its HTML stripped (D). Evaluates to ``NULL`` outside PostgreSQL.
+    """
+    template = '%(expressions)s'
+    output_field = SearchVectorColumn()
+
+    def __init__(self, config):
+        description = models.Func(
+            models.F('description'), models.Value('<[^>]+>'), models.Value(' '), models.Value('g'),
+            function='REGEXP_REPLACE',
+        )
+        super().__init__(
+            SearchVector('name', config=config, weight='A')
+            + SearchVector('latin_name', config='simple', weight='B')
+            + SearchVector(description, config=config, weight='D')
+        )
+
+    def as_sql(self, compiler, connection, **extra_context):
+        if connection.vendor != 'postgresql':
+            return 'NULL', []
+        return super().as_sql(compiler, connection, **extra_context)
+
+
 class Herb(SeoModel, BaseModel):
     name = models.CharField(
         max_length=255,
@@ -133,6 +190,19 @@ class Herb(SeoModel, BaseModel):
         blank=True,
         related_name='herbs'
     )
+    document_updated_at = models.DateTimeField(
+        auto_now=True,
+        blank=True,
+        null=True,
+        verbose_name=_('Document Updated At'),
+        help_text=_('Latest change to the herb or to anything shown on its detail page.'),
+    )
+    search_vector = models.GeneratedField(
+        expression=SearchDocument(settings.HERBS_SEARCH_CONFIG),
+        output_field=SearchVectorColumn(null=True),
+        db_persist=True,
+        verbose_name=_('Search Vector'),
+    )
 
     class Meta:
         verbose_name = _('Herb')
@@ -142,11 +212,13 @@ class Herb(SeoModel, BaseModel):
             models.Index(fields=['name']),
             models.Index(fields=['slug']),
             models.Index(fields=['latin_name']),
+            SearchVectorIndex(fields=['search_vector'], name='herbs_herb_search_vector_gin'),
         ]
 
     def __str__(self):
         return f"{self.name} ({self.latin_name})" if self.latin_name else self.name
 
+    @cached_structured_data
     def get_structured_data(self, frontend_base_url: str) -> str:
         herb_url = urljoin(frontend_base_url, f"/herbs/{self.slug}/")
         image_url = self.image_link or (
@@ -217,6 +289,13 @@ class HerbMedia(BaseModel):
         blank=True,
         null=True,
     )
+    file_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_('File Variants'),
+        help_text=_('Resized copies of an image file, generated after upload.'),
+    )
     type = models.CharField(
         verbose_name=_('Type'),
         choices=TypeChoices.choices,
@@ -432,6 +511,92 @@ class ScientificStudy(BaseModel):
         return f"{self.herb.name} - {self.title}"
 
 
+class RelatedHerb(models.Model):
+    """
+    Precomputed nearest neighbours of a herb by shared tags, ailments, symptoms
+    and illnesses, maintained by ``herbs.similarity``.
+    """
+    herb = models.ForeignKey(
+        Herb,
+        verbose_name=_('Herb'),
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+    )
+    related = models.ForeignKey(
+        Herb,
+        verbose_name=_('Related Herb'),
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    rank = models.PositiveSmallIntegerField(
+        verbose_name=_('Rank'),
+    )
+    score = models.FloatField(
+        verbose_name=_('Similarity Score'),
+    )
+
+    class Meta:
+        verbose_name = _('Related Herb')
+        verbose_name_plural = _('Related Herbs')
+        ordering = ('herb', 'rank')
+        constraints = [
+            models.UniqueConstraint(fields=['herb', 'rank'], name='unique_related_herb_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.herb.name} -> {self.related.name} ({self.score:.3f})"
+
+
+class HerbConditionLink(models.Model):
+    """
+    Closure of the herb / illness / symptom / ailment graph, maintained by
+    ``herbs.graph``: one row per herb reachable from an illness, symptom or
+    ailment in at most two hops, with the shortest distance and the number of
+    paths, so condition pages read their herbs from one index.
+    """
+
+    class KindChoices(models.TextChoices):
+        ILLNESS = 'illness', _('Illness')
+        SYMPTOM = 'symptom', _('Symptom')
+        AILMENT = 'ailment', _('Ailment')
+
+    herb = models.ForeignKey(
+        Herb,
+        verbose_name=_('Herb'),
+        on_delete=models.CASCADE,
+        related_name='condition_links',
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KindChoices.choices,
+        verbose_name=_('Condition Kind'),
+    )
+    target_id = models.PositiveBigIntegerField(
+        verbose_name=_('Condition ID'),
+    )
+    hops = models.PositiveSmallIntegerField(
+        verbose_name=_('Hops'),
+        help_text=_('1 for a direct link, 2 through a linked illness, symptom or ailment.'),
+    )
+    paths = models.PositiveIntegerField(
+        verbose_name=_('Paths'),
+        help_text=_('Number of distinct paths of at most two hops.'),
+    )
+
+    class Meta:
+        verbose_name = _('Herb Condition Link')
+        verbose_name_plural = _('Herb Condition Links')
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'target_id', 'herb'], name='unique_herb_condition_link'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'target_id', 'hops']),
+        ]
+
+    def __str__(self):
+        return f"{self.herb_id} <- {self.kind} {self.target_id} ({self.hops} hop(s))"
+
+
 class Ailment(BaseModel):
     name = models.CharField(
         max_length=255,
@@ -0,0 +1,118 @@
+"""
+Symptom-driven herb ranking.
+
+Each worker holds a sparse herb x symptom matrix in NumPy, stored column-wise
+(CSC: ``indptr``/``indices``/``weights``) so the herbs linked to a symptom are
+one contiguous slice. A herb linked to a symptom directly weighs
+``DIRECT_WEIGHT``; a herb linked only through one of its illnesses weighs
+``ILLNESS_WEIGHT``. Ranking ``?symptoms=a,b,c`` sums the selected columns with
+a single ``bincount`` over the whole catalog and divides by the number of
+symptoms asked for, giving each herb's weighted coverage in ``[0, 1]``.
+
+Signals in ``herbs.signals`` bump a shared version in the cache once the
+change commits; workers compare it on every lookup and rebuild lazily.
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from core.caching import VersionedObject
+from herbs.models import Herb, Illness, Symptom
+
+VERSION_CACHE_KEY = 'herbs:ranking:version'
+DIRECT_WEIGHT = 1.0
+ILLNESS_WEIGHT = 0.5
+
+
+class SymptomMatrix:
+    def __init__(self, herb_ids, symptom_slugs, rows, columns, weights):
+        """
+        :param herb_ids: Herb id per row, in the order ties are broken (by name).
+        :param symptom_slugs: Symptom slug per column.
+        :param rows, columns, weights: Coordinates of the links; a herb linked to
+            a symptom more than once keeps its highest weight.
+        """
+        self.herb_ids = np.asarray(herb_ids, dtype=np.int64)
+        self.columns = {slug: column for column, slug in enumerate(symptom_slugs)}
+
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        # Sort by column, then row, then weight descending; keep the first of each cell.
+        order = np.lexsort((-weights, rows, columns))
+        rows, columns, weights = rows[order], columns[order], weights[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+        rows, columns, weights = rows[first], columns[first], weights[first]
+
+        self.indices = rows
+        self.weights = weights
+        self.indptr = np.zeros(len(symptom_slugs) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(columns, minlength=len(symptom_slugs)), out=self.indptr[1:])
+
+    @classmethod
+    def build(cls):
+        herb_ids = list(Herb.objects.filter(is_active=True).order_by('name', 'id').values_list('id', flat=True))
+        herb_rows = {herb_id: row for row, herb_id in enumerate(herb_ids)}
+        symptoms = list(Symptom.objects.filter(is_active=True).values_list('id', 'slug'))
+        symptom_columns = {symptom_id: column for column, (symptom_id, _) in enumerate(symptoms)}
+
+        rows, columns, weights = [], [], []
+
+        def add(herb_id, symptom_id, weight):
+            row, column = herb_rows.get(herb_id), symptom_columns.get(symptom_id)
+            if row is not None and column is not None:
+                rows.append(row)
+                columns.append(column)
+                weights.append(weight)
+
+        for herb_id, symptom_id in Herb.symptoms.through.objects.values_list('herb_id', 'symptom_id').iterator():
+            add(herb_id, symptom_id, DIRECT_WEIGHT)
+
+        illness_symptoms = defaultdict(list)
+        for illness_id, symptom_id in Illness.symptoms.through.objects.values_list('illness_id', 'symptom_id'):
+            illness_symptoms[illness_id].append(symptom_id)
+        for herb_id, illness_id in Herb.illnesses.through.objects.values_list('herb_id', 'illness_id').iterator():
+            for symptom_id in illness_symptoms.get(illness_id, ()):
+                add(herb_id, symptom_id, ILLNESS_WEIGHT)
+
+        return cls(herb_ids, [slug for _, slug in symptoms], rows, columns, weights)
+
+    def rank(self, slugs, limit=None):
+        """
+        :param slugs: Symptom slugs to cover; unknown slugs count as uncovered.
+        :return: ``(herb_id, score, matched)`` triples for the herbs covering at
+            least one symptom, best first, where ``matched`` is the number of
+            the given symptoms the herb is linked to.
+        """
+        slugs = list(dict.fromkeys(slugs))
+        columns = [self.columns[slug] for slug in slugs if slug in self.columns]
+        if not columns or not len(self.herb_ids):
+            return []
+
+        slices = [slice(self.indptr[column], self.indptr[column + 1]) for column in columns]
+        indices = np.concatenate([self.indices[part] for part in slices])
+        weights = np.concatenate([self.weights[part] for part in slices])
+
+        scores = np.bincount(indices, weights=weights, minlength=len(self.herb_ids)) / len(slugs)
+        matched = np.bincount(indices, minlength=len(self.herb_ids))
+
+        candidates = np.flatnonzero(scores)
+        # Stable sort keeps rows (already in name order) for equal scores.
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')][:limit]
+        return [
+            (int(self.herb_ids[row]), float(scores[row]), int(matched[row]))
+            for row in candidates
+        ]
+
+
+_holder = VersionedObject(VERSION_CACHE_KEY, SymptomMatrix.build)
+
+
+def get_symptom_matrix():
+    return _holder.get()
+
+
+def invalidate_symptom_matrix():
+    _holder.invalidate()
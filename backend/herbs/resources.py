@@ -22,6 +22,7 @@ class CategoryResource(resources.ModelResource):
 class HerbResource(resources.ModelResource):
     class Meta:
         model = Herb
+        exclude = ('search_vector',)
 
 
 class HerbPreparationStepResource(resources.ModelResource):
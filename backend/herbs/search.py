@@ -0,0 +1,158 @@
+"""
+Ranked full-text search over the herb catalog.
+
+PostgreSQL reads the weighted ``Herb.search_vector`` generated column behind a
+GIN index. SQLite keeps an FTS5 shadow table keyed by the herb id, created
+after ``migrate`` and updated row by row from the ``Herb`` signals. Other
+databases fall back to ``icontains`` matching.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+from herbs.models import Herb
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def _search_terms(query):
+    return TERM_PATTERN.findall(query or '')[:16]
+
+
+def _document(herb):
+    return (
+        herb.name or '',
+        herb.latin_name or '',
+        strip_tags(herb.description or ''),
+    )
+
+
+class BaseSearchBackend:
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+
+    def ensure_index(self):
+        pass
+
+    def index(self, herb):
+        pass
+
+    def remove(self, herb_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def search(self, queryset, query):
+        """
+        Filters ``queryset`` down to herbs matching ``query`` ordered by relevance.
+        """
+        terms = _search_terms(query)
+        if not terms:
+            return queryset
+        condition = Q()
+        for term in terms:
+            condition &= (
+                    Q(name__icontains=term)
+                    | Q(latin_name__icontains=term)
+                    | Q(description__icontains=term)
+            )
+        return queryset.filter(condition)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Reads ``Herb.search_vector``, a stored generated column behind a GIN
+    index, so PostgreSQL keeps it current on every write.
+    """
+
+    def rebuild(self):
+        return Herb.objects.count()
+
+    def search(self, queryset, query):
+        terms = _search_terms(query)
+        if not terms:
+            return queryset
+        tsquery = SearchQuery(
+            ' & '.join(f"{term}:*" for term in terms), config=settings.HERBS_SEARCH_CONFIG, search_type='raw'
+        )
+        return queryset.filter(search_vector=tsquery).annotate(
+            search_rank=SearchRank(F('search_vector'), tsquery),
+        ).order_by('-search_rank', 'name')
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    # bm25() weights for the name, latin_name and description columns.
+    weights = (10.0, 5.0, 1.0)
+
+    @property
+    def table(self):
+        return self.connection.ops.quote_name(f"{Herb._meta.db_table}_fts")
+
+    def ensure_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "name, latin_name, description, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def index(self, herb):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [herb.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, name, latin_name, description) "
+                "VALUES (%s, %s, %s, %s)",
+                [herb.pk, *_document(herb)],
+            )
+
+    def remove(self, herb_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [herb_id])
+
+    def rebuild(self):
+        rows = [
+            (herb.pk, *_document(herb))
+            for herb in Herb.objects.only('id', 'name', 'latin_name', 'description').iterator(
+                chunk_size=500
+            )
+        ]
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, name, latin_name, description) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+        return len(rows)
+
+    def search(self, queryset, query):
+        terms = _search_terms(query)
+        if not terms:
+            return queryset
+        match = ' '.join(f'"{term}"*' for term in terms)
+        herb_id = f"{self.connection.ops.quote_name(Herb._meta.db_table)}.id"
+        bm25 = f"bm25({self.table}, {', '.join(str(weight) for weight in self.weights)})"
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT -{bm25} FROM {self.table} "
+                f"WHERE {self.table} MATCH %s AND rowid = {herb_id}",
+                [match],
+                output_field=FloatField(),
+            )
+        ).order_by('-search_rank', 'name')
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return PostgresSearchBackend(using)
+    if vendor == 'sqlite':
+        return SQLiteSearchBackend(using)
+    return BaseSearchBackend(using)
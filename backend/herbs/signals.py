@@ -0,0 +1,293 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from core.images import schedule_image_variants, schedule_variants_cleanup, variants_generated
+
+from .autocomplete import invalidate_index
+from .bitmaps import FACETS as BITMAP_FACETS, apply_to_bitmap_index
+from .graph import affected_herbs, schedule_graph_refresh
+from .documents import invalidate_detail_documents, mark_herbs_changed, mark_herbs_changed_matching
+from .models import (
+    Herb,
+    HerbMedia,
+    HerbWarning,
+    ScientificStudy,
+    Category,
+    Ailment,
+    SideEffect,
+    Symptom,
+    Illness,
+    Source,
+    Tag,
+)
+from .ranking import invalidate_symptom_matrix
+from .search import get_search_backend
+from .similarity import schedule_related_update
+from .taxonomy import invalidate_bundle
+
+IMAGE_FIELDS = {HerbMedia: 'file', Category: 'image', Herb: 'og_image'}
+
+
+def affected_herb_ids(instance, action, reverse, pk_set):
+    """
+    Herbs whose links change in an ``m2m_changed`` of a ``Herb`` relation,
+    whichever side it is sent from.
+    """
+    if not reverse:
+        return [instance.pk]
+    if action == 'pre_clear':
+        return instance.herbs.values_list('id', flat=True)
+    return pk_set
+
+
+def ensure_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    get_search_backend(using).ensure_index()
+
+
+@receiver(post_save, sender=Herb)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Herb)
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Herb)
+@receiver([post_save, post_delete], sender=Symptom)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Category)
+def refresh_autocomplete_index(sender, **kwargs):
+    invalidate_index()
+
+
+@receiver(pre_save, sender=Herb)
+def remember_previous_slug(sender, instance, raw=False, **kwargs):
+    instance._previous_slug = None
+    if not raw and instance.pk:
+        instance._previous_slug = (
+            Herb.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Herb)
+def invalidate_herb_document(sender, instance, **kwargs):
+    invalidate_detail_documents([instance.slug, getattr(instance, '_previous_slug', None)])
+
+
+@receiver([post_save, post_delete], sender=HerbMedia)
+@receiver([post_save, post_delete], sender=HerbWarning)
+@receiver([post_save, post_delete], sender=ScientificStudy)
+def mark_herb_changed_for_child(sender, instance, **kwargs):
+    mark_herbs_changed([instance.herb_id])
+
+
+@receiver(m2m_changed, sender=Herb.ailments.through)
+@receiver(m2m_changed, sender=Herb.tags.through)
+@receiver(m2m_changed, sender=Herb.symptoms.through)
+@receiver(m2m_changed, sender=Herb.illnesses.through)
+@receiver(m2m_changed, sender=Herb.side_effects.through)
+@receiver(m2m_changed, sender=Herb.sources.through)
+def mark_herb_changed_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        mark_herbs_changed(affected_herb_ids(instance, action, reverse, pk_set))
+
+
+@receiver(m2m_changed, sender=Illness.symptoms.through)
+@receiver(m2m_changed, sender=Illness.ailments.through)
+def mark_herbs_changed_on_illness_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        mark_herbs_changed_matching(illnesses=instance)
+    elif action == 'pre_clear':
+        mark_herbs_changed_matching(illnesses__in=instance.illnesses.all())
+    else:
+        mark_herbs_changed_matching(illnesses__in=pk_set)
+
+
+@receiver([post_save, pre_delete], sender=Category)
+def mark_herbs_changed_for_category(sender, instance, **kwargs):
+    mark_herbs_changed_matching(category=instance)
+
+
+@receiver([post_save, pre_delete], sender=Ailment)
+@receiver([post_save, pre_delete], sender=SideEffect)
+@receiver([post_save, pre_delete], sender=Symptom)
+@receiver([post_save, pre_delete], sender=Illness)
+@receiver([post_save, pre_delete], sender=Source)
+@receiver([post_save, pre_delete], sender=Tag)
+def mark_herbs_changed_for_related(sender, instance, **kwargs):
+    mark_herbs_changed(instance.herbs.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Herb)
+def update_bitmap_category(sender, instance, **kwargs):
+    herb_id, category_id = instance.pk, instance.category_id
+
+    def update(index):
+        index.unlink_herb(herb_id, facets=['category'])
+        if category_id is not None:
+            index.link('category', category_id, [herb_id])
+
+    apply_to_bitmap_index(update)
+
+
+@receiver(post_delete, sender=Herb)
+def remove_herb_from_bitmaps(sender, instance, **kwargs):
+    herb_id = instance.pk
+    apply_to_bitmap_index(lambda index: index.unlink_herb(herb_id))
+
+
+@receiver(m2m_changed, sender=Herb.tags.through)
+@receiver(m2m_changed, sender=Herb.symptoms.through)
+def update_bitmap_links(sender, instance, action, reverse, pk_set, **kwargs):
+    facet = 'tags' if sender is Herb.tags.through else 'symptoms'
+    pk_set = set(pk_set or ())
+
+    if action in ('post_add', 'post_remove'):
+        if reverse:
+            links = [(instance.pk, pk_set)]
+        else:
+            links = [(related_id, [instance.pk]) for related_id in pk_set]
+
+        def update(index):
+            for related_id, herb_ids in links:
+                if action == 'post_add':
+                    index.link(facet, related_id, herb_ids)
+                else:
+                    index.unlink(facet, related_id, herb_ids)
+
+        apply_to_bitmap_index(update)
+    elif action == 'pre_clear':
+        pk = instance.pk
+        if reverse:
+            apply_to_bitmap_index(lambda index: index.bitsets[facet].pop(pk, None))
+        else:
+            apply_to_bitmap_index(lambda index: index.unlink_herb(pk, facets=[facet]))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Symptom)
+def update_bitmap_slug(sender, instance, **kwargs):
+    facet = next(name for name, model in BITMAP_FACETS.items() if model is sender)
+    related_id, slug = instance.pk, instance.slug
+    apply_to_bitmap_index(lambda index: index.set_slug(facet, related_id, slug))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Symptom)
+def remove_bitmap_related(sender, instance, **kwargs):
+    facet = next(name for name, model in BITMAP_FACETS.items() if model is sender)
+    related_id = instance.pk
+    apply_to_bitmap_index(lambda index: index.remove_related(facet, related_id))
+
+
+@receiver([post_save, post_delete], sender=Herb)
+@receiver([post_save, post_delete], sender=Symptom)
+@receiver(post_delete, sender=Illness)
+@receiver(m2m_changed, sender=Herb.symptoms.through)
+@receiver(m2m_changed, sender=Herb.illnesses.through)
+@receiver(m2m_changed, sender=Illness.symptoms.through)
+def refresh_symptom_matrix(sender, action=None, **kwargs):
+    if action is None or action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_symptom_matrix()
+
+
+@receiver(m2m_changed, sender=Herb.tags.through)
+@receiver(m2m_changed, sender=Herb.ailments.through)
+@receiver(m2m_changed, sender=Herb.symptoms.through)
+@receiver(m2m_changed, sender=Herb.illnesses.through)
+def update_related_herbs(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        schedule_related_update(affected_herb_ids(instance, action, reverse, pk_set))
+
+
+@receiver(post_save, sender=HerbMedia)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Herb)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_image_variants(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(post_delete, sender=HerbMedia)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Herb)
+def delete_image_variants(sender, instance, **kwargs):
+    schedule_variants_cleanup(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(variants_generated, sender=HerbMedia)
+@receiver(variants_generated, sender=Category)
+@receiver(variants_generated, sender=Herb)
+def mark_herbs_changed_for_variants(sender, instance, **kwargs):
+    if sender is Herb:
+        mark_herbs_changed([instance.pk])
+    elif sender is HerbMedia:
+        mark_herbs_changed([instance.herb_id])
+    else:
+        mark_herbs_changed_matching(category=instance)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Symptom)
+@receiver([post_save, post_delete], sender=Ailment)
+@receiver([post_save, post_delete], sender=Illness)
+@receiver(m2m_changed, sender=Illness.symptoms.through)
+@receiver(m2m_changed, sender=Illness.ailments.through)
+def refresh_taxonomy_bundle(sender, action=None, **kwargs):
+    if action is None or action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_bundle()
+
+
+@receiver(m2m_changed, sender=Herb.illnesses.through)
+@receiver(m2m_changed, sender=Herb.symptoms.through)
+@receiver(m2m_changed, sender=Herb.ailments.through)
+def refresh_herb_graph_for_herb(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        schedule_graph_refresh(affected_herb_ids(instance, action, reverse, pk_set))
+
+
+@receiver(m2m_changed, sender=Illness.symptoms.through)
+@receiver(m2m_changed, sender=Illness.ailments.through)
+def refresh_herb_graph_for_illness(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if sender is Illness.symptoms.through:
+        related_name, target_field = 'symptoms', 'symptom_ids'
+    else:
+        related_name, target_field = 'ailments', 'ailment_ids'
+    if not reverse:
+        illness_ids = [instance.pk]
+        targets = getattr(instance, related_name).values_list('id', flat=True) if action == 'pre_clear' else pk_set
+    else:
+        illness_ids = instance.illnesses.values_list('id', flat=True) if action == 'pre_clear' else pk_set
+        targets = [instance.pk]
+    schedule_graph_refresh(affected_herbs(illness_ids=illness_ids, **{target_field: targets}))
+
+
+@receiver(pre_delete, sender=Illness)
+def refresh_herb_graph_for_deleted_illness(sender, instance, **kwargs):
+    schedule_graph_refresh(affected_herbs(
+        illness_ids=[instance.pk],
+        symptom_ids=instance.symptoms.values_list('id', flat=True),
+        ailment_ids=instance.ailments.values_list('id', flat=True),
+    ))
+
+
+@receiver(pre_delete, sender=Symptom)
+@receiver(pre_delete, sender=Ailment)
+def refresh_herb_graph_for_deleted_condition(sender, instance, **kwargs):
+    field = 'symptom_ids' if sender is Symptom else 'ailment_ids'
+    schedule_graph_refresh(affected_herbs(
+        illness_ids=instance.illnesses.values_list('id', flat=True), **{field: [instance.pk]}
+    ))
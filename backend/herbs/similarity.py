@@ -0,0 +1,232 @@
+"""
+"Related herbs" similarity index.
+
+Herbs are compared on the tags, ailments, symptoms and illnesses they share.
+The catalog is loaded as a sparse herb x feature matrix (CSR, plus its
+feature x herb transpose) and scored in blocks: the overlap of a herb with
+every other herb is counted over the herbs listed under its features only,
+then turned into cosine or Jaccard scores (``HERBS_SIMILARITY_METRIC``). The
+best ``HERBS_RELATED_COUNT`` neighbours of each herb are stored in
+``RelatedHerb`` so pages read them with a single indexed lookup.
+
+``rebuild_related_herbs`` recomputes the whole table (nightly, from Celery
+beat). The ``m2m_changed`` receivers call ``schedule_related_update``, which
+queues ``update_related_herbs`` after a short delay, once per herb however
+many changes it gets meanwhile. The update only loads the herbs sharing a
+feature with the changed ones and rewrites the rows of the changed herbs and
+of the herbs whose neighbour lists they enter or leave.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from herbs.models import Herb, RelatedHerb
+
+TOP_K = settings.HERBS_RELATED_COUNT
+METRIC = settings.HERBS_SIMILARITY_METRIC
+UPDATE_DELAY = settings.HERBS_RELATED_UPDATE_DELAY
+BLOCK_SIZE = 512
+# Set while a herb waits for a queued update; expires so a lost task does not
+# hold back later updates.
+QUEUED_CACHE_KEY = 'herbs:related:queued:{}'
+QUEUED_TIMEOUT = UPDATE_DELAY + 5 * 60
+
+RELATIONS = (
+    (Herb.tags.through, 'tag_id'),
+    (Herb.ailments.through, 'ailment_id'),
+    (Herb.symptoms.through, 'symptom_id'),
+    (Herb.illnesses.through, 'illness_id'),
+)
+
+
+def _csr(rows, columns, size):
+    """
+    :return: ``(indptr, indices)`` listing the ``columns`` of each of ``size``
+        rows in order.
+    """
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, columns[np.lexsort((columns, rows))]
+
+
+def _ranges(indptr, positions):
+    """
+    :return: The indices ``indptr[p]:indptr[p + 1]`` of each of ``positions``,
+        concatenated, and for each index the offset in ``positions`` it came from.
+    """
+    starts = indptr[positions]
+    lengths = indptr[positions + 1] - starts
+    owners = np.repeat(np.arange(len(positions)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owners
+
+
+class FeatureMatrix:
+    def __init__(self, herb_ids, rows, columns, metric=METRIC):
+        """
+        :param rows: Herb row of each (herb, feature) link.
+        :param columns: Feature column of each link.
+        """
+        self.herb_ids = np.asarray(herb_ids, dtype=np.int64)
+        self.rows = {herb_id: row for row, herb_id in enumerate(herb_ids)}
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        self.indptr, self.indices = _csr(rows, columns, len(self.herb_ids))
+        self.feature_indptr, self.feature_herbs = _csr(columns, rows, int(columns.max(initial=-1)) + 1)
+        self.sizes = np.diff(self.indptr).astype(np.float32)
+        self.metric = metric
+
+    @classmethod
+    def build(cls, metric=METRIC, near=None):
+        """
+        :param near: Herb ids to load with every herb sharing a feature with
+            them, which is enough to score them exactly; all herbs by default.
+        """
+        herbs = Herb.objects.filter(is_active=True)
+        if near is not None:
+            nearby = Q(pk__in=near)
+            for through, column in RELATIONS:
+                shared = through.objects.filter(herb__in=near).values(column)
+                nearby |= Q(pk__in=through.objects.filter(**{f'{column}__in': shared}).values('herb_id'))
+            herbs = herbs.filter(nearby)
+        herb_ids = list(herbs.order_by('id').values_list('id', flat=True))
+        rows = {herb_id: row for row, herb_id in enumerate(herb_ids)}
+
+        feature_rows, feature_columns, offset = [], [], 0
+        for through, column in RELATIONS:
+            links = through.objects.all() if near is None else through.objects.filter(herb__in=herbs.values('pk'))
+            columns = {}
+            for herb_id, related_id in links.values_list('herb_id', column).iterator():
+                if herb_id in rows:
+                    feature_rows.append(rows[herb_id])
+                    feature_columns.append(offset + columns.setdefault(related_id, len(columns)))
+            offset += len(columns)
+        return cls(herb_ids, feature_rows, feature_columns, metric=metric)
+
+    def scores(self, rows):
+        """
+        :return: ``(len(rows), herbs)`` similarities of ``rows`` to every herb,
+            with each herb's similarity to itself zeroed.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        herbs = len(self.herb_ids)
+        links, owners = _ranges(self.indptr, rows)
+        postings, sources = _ranges(self.feature_indptr, self.indices[links])
+        overlap = np.bincount(
+            owners[sources] * herbs + self.feature_herbs[postings], minlength=len(rows) * herbs
+        ).reshape(len(rows), herbs).astype(np.float32)
+        if self.metric == 'jaccard':
+            denominator = self.sizes[rows, None] + self.sizes[None, :] - overlap
+        else:
+            denominator = np.sqrt(self.sizes[rows, None] * self.sizes[None, :])
+        scores = np.divide(overlap, denominator, out=np.zeros_like(overlap), where=denominator > 0)
+        scores[np.arange(len(rows)), rows] = 0.0
+        return scores
+
+    def neighbours(self, rows, k=TOP_K):
+        """
+        Yields ``(herb_id, [(related_id, score), ...])`` for each of ``rows``,
+        best first and ties broken by herb id.
+        """
+        k = min(k, len(self.herb_ids) - 1)
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block = rows[start:start + BLOCK_SIZE]
+            if k <= 0:
+                yield from ((int(self.herb_ids[row]), []) for row in block)
+                continue
+
+            scores = self.scores(block)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.lexsort((top, -top_scores), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            for row, columns, values in zip(block, top, top_scores):
+                yield int(self.herb_ids[row]), [
+                    (int(self.herb_ids[column]), float(value))
+                    for column, value in zip(columns, values) if value > 0
+                ]
+
+
+def _neighbour_rows(matrix, rows):
+    return [
+        RelatedHerb(herb_id=herb_id, related_id=related_id, rank=rank, score=score)
+        for herb_id, neighbours in matrix.neighbours(rows)
+        for rank, (related_id, score) in enumerate(neighbours, start=1)
+    ]
+
+
+def rebuild_related_herbs():
+    """
+    Recomputes every herb's neighbours.
+
+    :return: Number of neighbour rows written.
+    """
+    matrix = FeatureMatrix.build()
+    objects = _neighbour_rows(matrix, list(range(len(matrix.herb_ids))))
+    with transaction.atomic():
+        RelatedHerb.objects.all().delete()
+        RelatedHerb.objects.bulk_create(objects, batch_size=1000)
+    return len(objects)
+
+
+def update_related_herbs(herb_ids):
+    """
+    Recomputes the neighbours of ``herb_ids`` and of every herb whose
+    neighbour list gains or loses one of them.
+
+    :return: Number of neighbour rows written.
+    """
+    herb_ids = set(herb_ids)
+    # Changes committed from now on queue a new update.
+    cache.delete_many([QUEUED_CACHE_KEY.format(herb_id) for herb_id in herb_ids])
+
+    matrix = FeatureMatrix.build(near=herb_ids)
+    changed = [matrix.rows[herb_id] for herb_id in herb_ids if herb_id in matrix.rows]
+
+    affected = set(herb_ids)
+    affected.update(RelatedHerb.objects.filter(related_id__in=herb_ids).values_list('herb_id', flat=True))
+    if changed and len(matrix.herb_ids) > 1:
+        # A herb is affected when a changed herb now beats its weakest neighbour.
+        thresholds = np.zeros(len(matrix.herb_ids), dtype=np.float32)
+        for herb_id, count, weakest in RelatedHerb.objects.filter(herb__in=matrix.herb_ids.tolist()).values(
+                'herb_id'
+        ).annotate(count=Count('id'), weakest=Min('score')).values_list('herb_id', 'count', 'weakest'):
+            if count >= TOP_K:
+                thresholds[matrix.rows[herb_id]] = weakest
+        best = matrix.scores(changed).max(axis=0)
+        affected.update(int(herb_id) for herb_id in matrix.herb_ids[best > thresholds])
+
+    matrix = FeatureMatrix.build(near=affected)
+    rows = sorted(matrix.rows[herb_id] for herb_id in affected if herb_id in matrix.rows)
+    objects = _neighbour_rows(matrix, rows)
+    with transaction.atomic():
+        RelatedHerb.objects.filter(herb_id__in=affected).delete()
+        RelatedHerb.objects.bulk_create(objects, batch_size=1000)
+    return len(objects)
+
+
+def _queue_related_update(herb_ids):
+    from herbs.tasks import update_related_herbs as task
+
+    herb_ids = [
+        herb_id for herb_id in herb_ids
+        if cache.add(QUEUED_CACHE_KEY.format(herb_id), True, timeout=QUEUED_TIMEOUT)
+    ]
+    if herb_ids:
+        task.apply_async((herb_ids,), countdown=UPDATE_DELAY)
+
+
+def schedule_related_update(herb_ids):
+    """
+    Queues ``update_related_herbs`` for ``herb_ids`` once the current
+    transaction commits, ``HERBS_RELATED_UPDATE_DELAY`` seconds later. Herbs
+    already waiting for an update are left to it, so a burst of changes to a
+    herb is recomputed once.
+    """
+    herb_ids = sorted({herb_id for herb_id in herb_ids if herb_id is not None})
+    if herb_ids:
+        transaction.on_commit(lambda: _queue_related_update(herb_ids))
@@ -0,0 +1,19 @@
+from core.models import SeoModel
+from core.sitemaps import StreamingSitemap
+from herbs.models import Herb, Category
+
+
+class HerbSitemap(StreamingSitemap):
+    def get_queryset(self):
+        return Herb.objects.filter(is_active=True).exclude(robots_index=SeoModel.RobotsIndexChoices.NOINDEX)
+
+    def location(self, row):
+        return f"/herbs/{row[0]}/"
+
+
+class CategorySitemap(StreamingSitemap):
+    def get_queryset(self):
+        return Category.objects.filter(is_active=True)
+
+    def location(self, row):
+        return f"/herbs/?category={row[0]}"
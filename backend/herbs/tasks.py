@@ -0,0 +1,13 @@
+from celery import shared_task
+
+from herbs import similarity
+
+
+@shared_task
+def rebuild_related_herbs():
+    return similarity.rebuild_related_herbs()
+
+
+@shared_task
+def update_related_herbs(herb_ids):
+    return similarity.update_related_herbs(herb_ids)
@@ -0,0 +1,96 @@
+"""
+Taxonomy bundle: every active category, tag, symptom, ailment and illness in
+one payload.
+
+The bundle is versioned by a hash of its content and cached until a taxonomy
+row changes (see ``herbs.signals``). ``/herbs/taxonomy/`` always answers with
+the current bundle and its versioned URL; the versioned URL never changes
+content, so it is served as ``immutable``. ``/herbs/taxonomy/current/``
+returns only the version and that URL.
+
+Rendered bundles embed absolute media URLs, so they are cached per request
+base URL. As with ``herbs.documents``, they are stored under a cache
+generation read before rendering, and a taxonomy change bumps that
+generation once it commits, so a request that rendered pre-commit data
+stores it under a generation nobody reads anymore.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.prefetch import get_prefetch_plan, apply_prefetch_plan
+from core.renderers import json_dumps
+from herbs.models import Ailment, Category, Illness, Symptom, Tag
+from herbs.v1.serializers import (
+    AilmentSerializer,
+    CategorySerializer,
+    IllnessSerializer,
+    SymptomSerializer,
+    TagSerializer,
+)
+
+TAXONOMY_GENERATION_KEY = 'herbs:taxonomy:generation'
+
+SECTIONS = {
+    'categories': (Category, CategorySerializer),
+    'tags': (Tag, TagSerializer),
+    'symptoms': (Symptom, SymptomSerializer),
+    'ailments': (Ailment, AilmentSerializer),
+    'illnesses': (Illness, IllnessSerializer),
+}
+
+
+def build_bundle(request=None):
+    """
+    :return: ``(version, data)`` for the current taxonomy.
+    """
+    data = {}
+    for name, (model, serializer_class) in SECTIONS.items():
+        queryset = apply_prefetch_plan(model.objects.filter(is_active=True), get_prefetch_plan(serializer_class))
+        data[name] = serializer_class(queryset, many=True, context={'request': request}).data
+    version = hashlib.sha256(json_dumps(data)).hexdigest()[:16]
+    return version, data
+
+
+def bundle_generation():
+    generation = cache.get(TAXONOMY_GENERATION_KEY)
+    if generation is None:
+        # Start from a fresh value, so bundles cached under an evicted
+        # generation stay unreachable.
+        cache.add(TAXONOMY_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(TAXONOMY_GENERATION_KEY)
+    return generation
+
+
+def bundle_cache_key(generation, base_url):
+    return f'herbs:taxonomy:{generation}:{hashlib.md5(base_url.encode()).hexdigest()}'
+
+
+def get_bundle(request):
+    """
+    :return: The cached ``(version, data)`` pair for the request's base URL,
+        built and cached on a miss.
+    """
+    key = bundle_cache_key(bundle_generation(), request.build_absolute_uri('/'))
+    bundle = cache.get(key)
+    if bundle is None:
+        bundle = build_bundle(request)
+        cache.set(key, bundle, timeout=settings.HERB_TAXONOMY_CACHE_TIMEOUT)
+    return bundle
+
+
+def invalidate_bundle():
+    """
+    Bumps the bundle generation once the current transaction commits.
+    """
+    def bump():
+        try:
+            cache.incr(TAXONOMY_GENERATION_KEY)
+        except ValueError:
+            # No generation yet; the next read starts a fresh one.
+            pass
+
+    transaction.on_commit(bump)
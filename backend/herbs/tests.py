@@ -1,3 +1,1195 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import msgpack
+from PIL import Image
+
+from core.testing import QueryBudgetMixin, read_json
+from herbs import bitmaps
+from herbs.autocomplete import invalidate_index
+from herbs.documents import get_detail_document, set_detail_document
+from herbs.graph import build_links, rebuild_herb_graph
+from herbs.taxonomy import build_bundle
+from herbs.similarity import FeatureMatrix, rebuild_related_herbs, update_related_herbs
+from herbs.v1.views import HerbsList
+from checkout.models import Currency, ExchangeRate
+from inventory.models import HerbPriceSummary, InventoryBase, InventoryItem, InventoryPrice
+from inventory.projections import rebuild_price_summaries, refresh_price_summaries
+from partners.models import Country, Partner
+from herbs.models import (
+    Ailment,
+    Category,
+    Herb,
+    HerbConditionLink,
+    HerbMedia,
+    HerbWarning,
+    Illness,
+    RelatedHerb,
+    ScientificStudy,
+    SideEffect,
+    Source,
+    Symptom,
+    Tag,
+)
+
+
+def create_catalog(size):
+    category = Category.objects.create(name="Digestive Health")
+    ailment = Ailment.objects.create(name="Indigestion")
+    side_effect = SideEffect.objects.create(name="Drowsiness")
+    symptom = Symptom.objects.create(name="Nausea")
+    illness = Illness.objects.create(name="Gastritis")
+    illness.symptoms.add(symptom)
+    illness.ailments.add(ailment)
+    source = Source.objects.create(name="Example", url="https://example.com/")
+    tag = Tag.objects.create(name="Calming")
+
+    herbs = []
+    for index in range(size):
+        herb = Herb.objects.create(
+            name=f"Herb {index:03d}",
+            latin_name=f"Herba {index:03d}",
+            description="<p>Description</p>",
+            category=category,
+        )
+        herb.ailments.add(ailment)
+        herb.side_effects.add(side_effect)
+        herb.symptoms.add(symptom)
+        herb.illnesses.add(illness)
+        herb.sources.add(source)
+        herb.tags.add(tag)
+        HerbMedia.objects.create(herb=herb, type=HerbMedia.TypeChoices.IMAGE)
+        HerbWarning.objects.create(herb=herb, name="Pregnancy")
+        ScientificStudy.objects.create(herb=herb, title="Study")
+        herbs.append(herb)
+    return herbs
+
+
+def create_offer(herb, base=None, price="12.5000", unit='kg', currency_code='USD'):
+    if base is None:
+        country, _ = Country.objects.get_or_create(name="France", iso_code="FR")
+        partner, _ = Partner.objects.get_or_create(name="Herboristerie", country=country)
+        base, _ = InventoryBase.objects.get_or_create(partner=partner, name="Lyon", country=country)
+    currency, _ = Currency.objects.get_or_create(
+        code=currency_code, defaults={'name': currency_code, 'symbol': currency_code}
+    )
+    item, _ = InventoryItem.objects.get_or_create(herb=herb, base=base, defaults={'quantity': 40})
+    InventoryPrice.objects.create(inventory_item=item, unit=unit, price=price, currency=currency)
+    return item
+
+
+class HerbQueryBudgetTests(QueryBudgetMixin, TestCase):
+    query_budgets = {
+        'herbs_list': 9,
+        'herbs_list_unpaginated': 8,
+        # Cold cache: version lookup, herb + category, and eleven prefetches.
+        'herbs_detail': 13,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.herbs = create_catalog(30)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_herbs_list_is_within_budget(self):
+        url = reverse('herbs-v1:herbs_list')
+        response, count = self.assertWithinQueryBudget('herbs_list', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 25)
+
+    def test_herbs_list_query_count_is_independent_of_size(self):
+        url = reverse('herbs-v1:herbs_list')
+        _, first_page, _ = self.get_with_query_count(url)
+        _, second_page, _ = self.get_with_query_count(url, {'page': 2})
+        self.assertEqual(first_page, second_page)
+
+    def test_unpaginated_herbs_list_is_within_budget(self):
+        url = reverse('herbs-v1:herbs_list')
+        response, _ = self.assertWithinQueryBudget(
+            'herbs_list_unpaginated', url, {'pagination': 'false'}
+        )
+        self.assertEqual(len(read_json(response)), 30)
+
+    def test_unpaginated_herbs_list_is_streamed(self):
+        response = self.client.get(reverse('herbs-v1:herbs_list'), {'pagination': 'false'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        body = read_json(response)
+        self.assertEqual([herb['name'] for herb in body], [herb.name for herb in self.herbs])
+        self.assertEqual(body[0]['tags'], ["Calming"])
+
+    def test_streamed_herbs_list_reads_in_chunks(self):
+        with mock.patch.object(HerbsList, 'stream_chunk_size', 7):
+            response, count, _ = self.get_with_query_count(
+                reverse('herbs-v1:herbs_list'), {'pagination': 'false'}
+            )
+        self.assertEqual(len(read_json(response)), 30)
+        # One server-side cursor over the herbs plus seven prefetches per chunk of seven.
+        self.assertEqual(count, 1 + 5 * 7)
+
+    def test_herbs_detail_is_within_budget(self):
+        url = reverse('herbs-v1:herbs_detail', kwargs={'slug': self.herbs[0].slug})
+        response, _ = self.assertWithinQueryBudget('herbs_detail', url)
+        self.assertEqual(response.status_code, 200)
+
+
+class HerbSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.in_description = Herb.objects.create(
+            name="Peppermint",
+            description="<p>Often blended with <strong>chamomile</strong> tea.</p>",
+        )
+        cls.in_name = Herb.objects.create(name="Chamomile", latin_name="Matricaria chamomilla")
+        Herb.objects.create(name="Ginger", description="<p>Warming root.</p>")
+
+    def search(self, query):
+        response = self.client.get(
+            reverse('herbs-v1:herbs_list'), {'search': query, 'pagination': 'false'}
+        )
+        return [herb['name'] for herb in read_json(response)]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("chamomile"), ["Chamomile", "Peppermint"])
+
+    def test_prefix_terms_match(self):
+        self.assertEqual(self.search("matri"), ["Chamomile"])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.in_name.name = "German Chamomile"
+        self.in_name.save()
+        self.assertEqual(self.search("german"), ["German Chamomile"])
+
+        self.in_name.delete()
+        self.assertEqual(self.search("german"), [])
+
+    def test_markup_is_not_indexed(self):
+        self.assertEqual(self.search("strong"), [])
+
+
+class HerbAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Herb.objects.create(name="Chamomile", latin_name="Matricaria chamomilla")
+        Herb.objects.create(name="Peppermint", latin_name="Mentha piperita")
+        Symptom.objects.create(name="Chest pain")
+        Tag.objects.create(name="Calming")
+        Category.objects.create(name="Digestive Health")
+
+    def setUp(self):
+        # The index outlives the per-test transaction rollback.
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_index()
+
+    def suggest(self, query, **params):
+        response = self.client.get(reverse('herbs-v1:herbs_autocomplete'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['name']) for item in response.json()]
+
+    def test_types_filter_before_limit(self):
+        for index in range(12):
+            Herb.objects.create(name=f"Catnip {index:02}")
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Cat Care")
+        self.assertEqual(self.suggest("cat", types='category', limit=1), [('category', "Cat Care")])
+
+    def test_invalid_limit(self):
+        for limit in (0, -3, 'many'):
+            response = self.client.get(reverse('herbs-v1:herbs_autocomplete'), {'q': "ch", 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+    def test_prefix_matches_every_indexed_type(self):
+        self.assertEqual(self.suggest("ch"), [('herb', "Chamomile"), ('symptom', "Chest pain")])
+        self.assertEqual(self.suggest("cal"), [('tag', "Calming")])
+        self.assertEqual(self.suggest("health"), [('category', "Digestive Health")])
+
+    def test_latin_name_resolves_to_herb(self):
+        self.assertEqual(self.suggest("mentha"), [('herb', "Peppermint")])
+
+    def test_typos_fall_back_to_trigrams(self):
+        self.assertIn(('herb', "Peppermint"), self.suggest("pepermint"))
+
+    def test_lookup_does_not_query_the_database(self):
+        self.suggest("ch")
+        with self.assertNumQueries(0):
+            self.suggest("cham", types='herb')
+
+    def test_index_rebuilds_after_changes(self):
+        self.suggest("gin")
+        with self.captureOnCommitCallbacks(execute=True):
+            Herb.objects.create(name="Ginger")
+        self.assertEqual(self.suggest("gin"), [('herb', "Ginger")])
+
+
+class KeysetPaginationTests(QueryBudgetMixin, TestCase):
+    query_budgets = {
+        'herbs_list_cursor': 8,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.herbs = create_catalog(30)
+
+    def walk(self, url, params):
+        names, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertNotIn('count', body)
+            names += [item['name'] for item in body['results']]
+            pages += 1
+            if not body['next']:
+                return names, pages, body
+            response = self.client.get(body['next'])
+
+    def test_walks_every_herb_once_in_order(self):
+        names, pages, _ = self.walk(reverse('herbs-v1:herbs_list'), {'pagination': 'cursor'})
+        self.assertEqual(names, sorted(herb.name for herb in self.herbs))
+        self.assertEqual(pages, 2)
+
+    def test_descending_ordering(self):
+        names, _, _ = self.walk(
+            reverse('herbs-v1:herbs_list'), {'pagination': 'cursor', 'ordering': '-created_at'}
+        )
+        self.assertEqual(names, [herb.name for herb in reversed(self.herbs)])
+
+    def test_previous_link_returns_first_page(self):
+        url = reverse('herbs-v1:herbs_list')
+        first = self.client.get(url, {'pagination': 'cursor'}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+
+    def test_deep_pages_skip_count_and_stay_within_budget(self):
+        url = reverse('herbs-v1:herbs_list')
+        first = self.client.get(url, {'pagination': 'cursor'}).json()
+        _, count = self.assertWithinQueryBudget('herbs_list_cursor', first['next'])
+        self.assertEqual(count, self.query_budgets['herbs_list_cursor'])
+
+    def test_taxonomy_lists_support_cursors(self):
+        names, _, _ = self.walk(reverse('herbs-v1:herbs_tags'), {'pagination': 'cursor'})
+        self.assertEqual(names, ["Calming"])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('herbs-v1:herbs_list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class HerbDetailDocumentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.herb = create_catalog(1)[0]
+        cls.url = reverse('herbs-v1:herbs_detail', kwargs={'slug': cls.herb.slug})
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, url=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(url or self.url)
+        return response
+
+    def test_hot_detail_is_served_without_queries(self):
+        self.fetch()
+        with self.assertNumQueries(0):
+            response = self.fetch()
+        self.assertEqual(response.json()['name'], self.herb.name)
+
+    def test_herb_save_rebuilds_document(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.herb.dosage = "2 cups"
+            self.herb.save()
+        self.assertEqual(self.fetch().json()['dosage'], "2 cups")
+
+    def test_slug_change_drops_previous_document(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.herb.slug = "renamed"
+            self.herb.save()
+        self.assertEqual(self.fetch().status_code, 404)
+
+    def test_m2m_changes_rebuild_document(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.herb.tags.add(Tag.objects.create(name="Bitter"))
+        self.assertEqual(
+            [tag['name'] for tag in self.fetch().json()['tags']], ["Bitter", "Calming"]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(name="Bitter").herbs.clear()
+        self.assertEqual([tag['name'] for tag in self.fetch().json()['tags']], ["Calming"])
+
+    def test_related_rows_rebuild_document(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            HerbWarning.objects.create(herb=self.herb, name="Children")
+            Symptom.objects.filter(name="Nausea").get().save()
+        self.assertEqual(
+            [warning['name'] for warning in self.fetch().json()['warnings']],
+            ["Children", "Pregnancy"],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(name="Calming").delete()
+        self.assertEqual(self.fetch().json()['tags'], [])
+
+    def test_stale_render_is_not_served_after_invalidation(self):
+        base_url = 'http://testserver/'
+        version, _ = get_detail_document(self.herb.slug, base_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.herb.dosage = "2 cups"
+            self.herb.save()
+        # A request that read the herb before the change finishes last.
+        set_detail_document(self.herb.slug, version, base_url, self.herb.updated_at, {'dosage': "stale"})
+        self.assertEqual(self.fetch().json()['dosage'], "2 cups")
+
+    def test_related_changes_leave_updated_at_alone(self):
+        updated_at = Herb.objects.values_list('updated_at', flat=True).get(pk=self.herb.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.herb.tags.clear()
+        herb = Herb.objects.get(pk=self.herb.pk)
+        self.assertEqual(herb.updated_at, updated_at)
+        self.assertGreater(herb.document_updated_at, updated_at)
+
+
+class HerbConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.herb = create_catalog(1)[0]
+        cls.url = reverse('herbs-v1:herbs_detail', kwargs={'slug': cls.herb.slug})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_carries_validators(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_matching_etag_answers_not_modified_without_serializing(self):
+        etag = self.client.get(self.url)['ETag']
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_matching_last_modified_answers_not_modified(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_related_changes_produce_a_new_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.herb.tags.clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['tags'], [])
+
+    def test_missing_herb_is_not_found(self):
+        url = reverse('herbs-v1:herbs_detail', kwargs={'slug': 'missing'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"anything"').status_code, 404)
+
+    def test_offers_revalidate_against_inventory_rows(self):
+        item = create_offer(self.herb)
+        url = reverse('herbs-v1:herbs_offers', kwargs={'slug': self.herb.slug})
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        item.prices.get().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['prices'], [])
+
+
+class HerbFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        digestive = Category.objects.create(name="Digestive")
+        sleep = Category.objects.create(name="Sleep")
+        calming, bitter = Tag.objects.create(name="Calming"), Tag.objects.create(name="Bitter")
+        nausea = Symptom.objects.create(name="Nausea")
+
+        chamomile = Herb.objects.create(name="Chamomile", category=sleep)
+        chamomile.tags.add(calming)
+        ginger = Herb.objects.create(name="Ginger", category=digestive)
+        ginger.tags.add(bitter)
+        ginger.symptoms.add(nausea)
+        gentian = Herb.objects.create(name="Gentian", category=digestive)
+        gentian.tags.add(bitter, calming)
+
+    def facets(self, **params):
+        response = self.client.get(reverse('herbs-v1:herbs_facets'), params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            facet: {row['slug']: row['count'] for row in rows}
+            for facet, rows in response.json().items()
+        }
+
+    def test_counts_every_facet(self):
+        self.assertEqual(self.facets(), {
+            'category': {'digestive': 2, 'sleep': 1},
+            'tags': {'bitter': 2, 'calming': 2},
+            'symptoms': {'nausea': 1},
+        })
+
+    def test_filters_apply_to_the_other_facets_only(self):
+        counts = self.facets(category='digestive')
+        self.assertEqual(counts['category'], {'digestive': 2, 'sleep': 1})
+        self.assertEqual(counts['tags'], {'bitter': 2, 'calming': 1})
+
+    def test_search_narrows_counts(self):
+        self.assertEqual(self.facets(search="ginger", facets='symptoms'), {'symptoms': {'nausea': 1}})
+        self.assertEqual(self.facets(search="gentian", facets='symptoms'), {'symptoms': {}})
+
+    def test_counts_use_one_query_per_facet(self):
+        with self.assertNumQueries(3):
+            self.facets(tags='bitter')
+
+    def test_unknown_facet_is_rejected(self):
+        response = self.client.get(reverse('herbs-v1:herbs_facets'), {'facets': 'colour'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(HERBS_BITMAP_INDEX=True)
+class HerbBitmapIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sleep = Category.objects.create(name="Sleep")
+        cls.calming, cls.bitter = Tag.objects.create(name="Calming"), Tag.objects.create(name="Bitter")
+        cls.nausea = Symptom.objects.create(name="Nausea")
+
+        cls.chamomile = Herb.objects.create(name="Chamomile", category=cls.sleep)
+        cls.chamomile.tags.add(cls.calming, cls.bitter)
+        cls.ginger = Herb.objects.create(name="Ginger")
+        cls.ginger.tags.add(cls.bitter)
+        cls.ginger.symptoms.add(cls.nausea)
+
+    def setUp(self):
+        # Start every test from a fresh index that applies changes incrementally.
+        bitmaps._holder.reset()
+
+    def names(self, **params):
+        response = self.client.get(
+            reverse('herbs-v1:herbs_list'), {'pagination': 'false', **params}
+        )
+        return [herb['name'] for herb in read_json(response)]
+
+    def test_facets_or_within_and_across(self):
+        self.assertEqual(self.names(tags='calming,bitter'), ["Chamomile", "Ginger"])
+        self.assertEqual(self.names(tags='bitter', symptoms='nausea'), ["Ginger"])
+        self.assertEqual(self.names(tags='bitter', category='sleep'), ["Chamomile"])
+        self.assertEqual(self.names(tags='unknown'), [])
+
+    def test_warmed_at_worker_start(self):
+        with self.settings(HERBS_BITMAP_INDEX=False):
+            bitmaps.warm_bitmap_index()
+        self.assertIsNone(bitmaps._holder.value)
+
+        bitmaps.warm_bitmap_index()
+        index = bitmaps._holder.value
+        self.assertIsNotNone(index)
+        self.assertEqual(self.names(tags='bitter', symptoms='nausea'), ["Ginger"])
+        self.assertIs(bitmaps.get_bitmap_index(), index)
+
+    def test_resolves_without_joining_m2m_tables(self):
+        self.names(tags='bitter')
+        with CaptureQueriesContext(connection) as context:
+            self.names(tags='bitter', symptoms='nausea')
+        herb_query = context.captured_queries[0]['sql']
+        self.assertNotIn('herbs_herb_tags', herb_query)
+        self.assertNotIn('herbs_herb_symptoms', herb_query)
+
+    def test_index_follows_committed_changes(self):
+        self.assertEqual(self.names(symptoms='nausea'), ["Ginger"])
+        index = bitmaps.get_bitmap_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chamomile.symptoms.add(self.nausea)
+            self.ginger.tags.remove(self.bitter)
+            self.nausea.herbs.remove(self.ginger)
+            self.ginger.category = self.sleep
+            self.ginger.save()
+
+        self.assertEqual(self.names(symptoms='nausea'), ["Chamomile"])
+        self.assertEqual(self.names(tags='bitter'), ["Chamomile"])
+        self.assertEqual(self.names(category='sleep'), ["Chamomile", "Ginger"])
+        self.assertIs(bitmaps.get_bitmap_index(), index)
+
+    def test_slug_changes_are_tracked(self):
+        self.names(tags='bitter')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bitter.slug = 'very-bitter'
+            self.bitter.save()
+        self.assertEqual(self.names(tags='bitter'), [])
+        self.assertEqual(self.names(tags='very-bitter'), ["Chamomile", "Ginger"])
+
+
+class HerbRankTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nausea = Symptom.objects.create(name="Nausea")
+        cls.bloating = Symptom.objects.create(name="Bloating")
+        cls.insomnia = Symptom.objects.create(name="Insomnia")
+        gastritis = Illness.objects.create(name="Gastritis")
+        gastritis.symptoms.add(cls.nausea, cls.bloating)
+
+        cls.ginger = Herb.objects.create(name="Ginger")
+        cls.ginger.symptoms.add(cls.nausea, cls.bloating)
+        cls.fennel = Herb.objects.create(name="Fennel")
+        cls.fennel.symptoms.add(cls.bloating)
+        cls.fennel.illnesses.add(gastritis)
+        cls.licorice = Herb.objects.create(name="Licorice")
+        cls.licorice.illnesses.add(gastritis)
+        cls.valerian = Herb.objects.create(name="Valerian")
+        cls.valerian.symptoms.add(cls.insomnia)
+
+    def setUp(self):
+        cache.clear()
+
+    def rank(self, **params):
+        response = self.client.get(reverse('herbs-v1:herbs_rank'), params)
+        self.assertEqual(response.status_code, 200)
+        return [(herb['name'], herb['score'], herb['matched_symptoms']) for herb in response.json()]
+
+    def test_scores_direct_and_illness_coverage(self):
+        self.assertEqual(self.rank(symptoms='nausea,bloating'), [
+            ("Ginger", 1.0, 2),
+            ("Fennel", 0.75, 2),
+            ("Licorice", 0.5, 2),
+        ])
+        self.assertEqual(self.rank(symptoms='nausea,insomnia,unknown'), [
+            ("Ginger", 0.3333, 1),
+            ("Valerian", 0.3333, 1),
+            ("Fennel", 0.1667, 1),
+            ("Licorice", 0.1667, 1),
+        ])
+
+    def test_limit_and_missing_symptoms(self):
+        self.assertEqual([name for name, _, _ in self.rank(symptoms='bloating', limit=2)], ["Fennel", "Ginger"])
+        response = self.client.get(reverse('herbs-v1:herbs_rank'))
+        self.assertEqual(response.status_code, 400)
+        for limit in ('0', '-1', 'many'):
+            response = self.client.get(reverse('herbs-v1:herbs_rank'), {'symptoms': 'bloating', 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+    def test_matrix_follows_committed_changes(self):
+        self.rank(symptoms='insomnia')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.licorice.symptoms.add(self.insomnia)
+            self.valerian.is_active = False
+            self.valerian.save()
+        self.assertEqual(self.rank(symptoms='insomnia'), [("Licorice", 1.0, 1)])
+
+
+class RelatedHerbTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.calming, cls.bitter, cls.warming = (
+            Tag.objects.create(name="Calming"), Tag.objects.create(name="Bitter"), Tag.objects.create(name="Warming")
+        )
+        cls.nausea = Symptom.objects.create(name="Nausea")
+
+        cls.chamomile = Herb.objects.create(name="Chamomile")
+        cls.chamomile.tags.add(cls.calming, cls.bitter)
+        cls.lavender = Herb.objects.create(name="Lavender")
+        cls.lavender.tags.add(cls.calming, cls.bitter)
+        cls.ginger = Herb.objects.create(name="Ginger")
+        cls.ginger.tags.add(cls.warming, cls.bitter)
+        cls.ginger.symptoms.add(cls.nausea)
+        cls.garlic = Herb.objects.create(name="Garlic")
+
+    def setUp(self):
+        cache.clear()
+
+    def related(self, herb):
+        response = self.client.get(reverse('herbs-v1:herbs_related', kwargs={'slug': herb.slug}))
+        self.assertEqual(response.status_code, 200)
+        return [(item['name'], round(item['score'], 3)) for item in response.json()]
+
+    def test_cosine_and_jaccard_scores(self):
+        matrix = FeatureMatrix.build(metric='cosine')
+        row = matrix.rows[self.chamomile.id]
+        scores = matrix.scores([row])[0]
+        self.assertAlmostEqual(float(scores[matrix.rows[self.lavender.id]]), 1.0, places=5)
+        self.assertAlmostEqual(float(scores[matrix.rows[self.ginger.id]]), 1 / 6 ** 0.5, places=5)
+        self.assertEqual(float(scores[row]), 0.0)
+
+        matrix = FeatureMatrix.build(metric='jaccard')
+        scores = matrix.scores([matrix.rows[self.chamomile.id]])[0]
+        self.assertAlmostEqual(float(scores[matrix.rows[self.ginger.id]]), 0.25, places=5)
+
+    def test_rebuild_and_read(self):
+        rebuild_related_herbs()
+        self.assertEqual(self.related(self.chamomile), [("Lavender", 1.0), ("Ginger", 0.408)])
+        self.assertEqual(self.related(self.garlic), [])
+        with self.assertNumQueries(1):
+            self.related(self.ginger)
+
+    def test_m2m_changes_update_affected_neighbours(self):
+        rebuild_related_herbs()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.garlic.tags.add(self.warming)
+        self.assertEqual(self.related(self.garlic), [("Ginger", 0.577)])
+        self.assertEqual(self.related(self.ginger)[0], ("Garlic", 0.577))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bitter.herbs.remove(self.ginger)
+        self.assertEqual(self.related(self.chamomile), [("Lavender", 1.0)])
+        self.assertEqual(
+            list(RelatedHerb.objects.filter(herb=self.ginger).values_list('related__name', flat=True)),
+            ["Garlic"],
+        )
+
+    def test_changes_to_a_queued_herb_are_coalesced(self):
+        with mock.patch('herbs.tasks.update_related_herbs.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.garlic.tags.add(self.warming)
+                self.garlic.symptoms.add(self.nausea)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.garlic.tags.add(self.calming)
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.args[0], ([self.garlic.id],))
+
+        update_related_herbs([self.garlic.id])
+        with mock.patch('herbs.tasks.update_related_herbs.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.garlic.tags.remove(self.calming)
+        apply_async.assert_called_once()
+
+    def test_update_matches_rebuild(self):
+        rebuild_related_herbs()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.garlic.tags.add(self.warming, self.calming)
+            self.lavender.symptoms.add(self.nausea)
+        updated = set(RelatedHerb.objects.values_list('herb_id', 'related_id', 'rank'))
+        rebuild_related_herbs()
+        self.assertEqual(updated, set(RelatedHerb.objects.values_list('herb_id', 'related_id', 'rank')))
+
+
+class SitemapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Sleep")
+        cls.herbs = [Herb.objects.create(name=f"Herb {index}", category=cls.category) for index in range(5)]
+        Herb.objects.create(name="Hidden", robots_index='noindex')
+        Herb.objects.create(name="Inactive", is_active=False)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(FRONTEND_DOMAIN='https://terrapura.example')
+    def test_index_and_sections_are_chunked(self):
+        with mock.patch('herbs.sitemaps.HerbSitemap.limit', 2):
+            index = self.read(self.client.get('/sitemap.xml'))
+            self.assertEqual(index.count('<sitemap>'), 5)
+            self.assertIn('/sitemap-herbs-3.xml</loc>', index)
+            self.assertIn('/sitemap-posts-1.xml</loc>', index)
+
+            page = self.read(self.client.get('/sitemap-herbs-3.xml'))
+            self.assertEqual(page.count('<url>'), 1)
+            self.assertIn(f'<loc>https://terrapura.example/herbs/{self.herbs[4].slug}/</loc>', page)
+            self.assertIn(f'<lastmod>{self.herbs[4].updated_at.isoformat()}</lastmod>', page)
+            self.assertEqual(self.client.get('/sitemap-herbs-4.xml').status_code, 404)
+
+        herbs = self.read(self.client.get('/sitemap-herbs-1.xml'))
+        self.assertEqual(herbs.count('<url>'), 5)
+        self.assertNotIn('hidden', herbs)
+        self.assertNotIn('inactive', herbs)
+        categories = self.read(self.client.get('/sitemap-categories-1.xml'))
+        self.assertIn('/herbs/?category=sleep</loc>', categories)
+        self.assertEqual(self.client.get('/sitemap-unknown-1.xml').status_code, 404)
+
+    def test_structured_data_is_cached_per_version(self):
+        cache.clear()
+        herb = self.herbs[0]
+        data = herb.get_structured_data('https://terrapura.example/')
+        with mock.patch('herbs.models.json.dumps') as dumps:
+            self.assertEqual(herb.get_structured_data('https://terrapura.example/'), data)
+            dumps.assert_not_called()
+
+        herb.dosage = "2 g"
+        herb.save()
+        self.assertIn('"doseValue": "2 g"', herb.get_structured_data('https://terrapura.example/'))
+
+
+class HerbOffersBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.herbs = create_catalog(3)
+        country = Country.objects.create(name="Germany", iso_code="DE")
+        other = Partner.objects.create(name="Kräuterhaus", country=country)
+        berlin = InventoryBase.objects.create(partner=other, name="Berlin", country=country)
+
+        create_offer(cls.herbs[0], price="12.5000")
+        create_offer(cls.herbs[0], price="1.2000", unit='g')
+        create_offer(cls.herbs[0], base=berlin, price="10.0000", currency_code='EUR')
+        create_offer(cls.herbs[1], base=berlin, price="9.0000", currency_code='EUR')
+
+    def get(self, **params):
+        return self.client.get(reverse('herbs-v1:herbs_offers_batch'), params)
+
+    def test_summaries_in_request_order(self):
+        slugs = [herb.slug for herb in self.herbs]
+        response = self.get(slugs=','.join(slugs))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(list(data), slugs)
+        self.assertEqual(data[slugs[0]], {
+            'slug': slugs[0],
+            'offer_count': 2,
+            'partner_count': 2,
+            'currencies': ['EUR', 'USD'],
+            'min_prices': [
+                {'currency': 'EUR', 'unit': 'kg', 'price': '10.0000'},
+                {'currency': 'USD', 'unit': 'g', 'price': '1.2000'},
+                {'currency': 'USD', 'unit': 'kg', 'price': '12.5000'},
+            ],
+        })
+        self.assertEqual(data[slugs[2]]['offer_count'], 0)
+        self.assertNotIn('offers', data[slugs[0]])
+
+    def test_fixed_number_of_queries(self):
+        slugs = ','.join(herb.slug for herb in self.herbs)
+        with self.assertNumQueries(2):
+            self.get(slugs=slugs)
+        # Plus items with their base, partner, country and herb, prices, and currencies.
+        with self.assertNumQueries(5):
+            data = self.get(slugs=slugs, include='offers').json()
+        self.assertEqual(len(data[self.herbs[0].slug]['offers']), 2)
+        self.assertEqual(data[self.herbs[1].slug]['offers'][0]['country'], "Germany")
+
+    def test_requires_slugs(self):
+        self.assertEqual(self.get().status_code, 400)
+        self.assertEqual(self.get(slugs=','.join(f"herb-{index}" for index in range(101))).status_code, 400)
+
+
+class HerbOfferPricePerKgTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.herb = create_catalog(1)[0]
+        country = Country.objects.create(name="Germany", iso_code="DE")
+        bases = [
+            InventoryBase.objects.create(
+                partner=Partner.objects.create(name=f"Partner {index}", country=country),
+                name=f"Base {index}",
+                country=country,
+            )
+            for index in range(4)
+        ]
+        # 20 EUR/kg, 0.0025 USD/g = 2.5 USD/kg = 2.0 EUR/kg, 10 GBP/lb, and a box only.
+        cls.eur = create_offer(cls.herb, base=bases[0], price="20.0000", currency_code='EUR')
+        cls.usd = create_offer(cls.herb, base=bases[1], price="0.0025", unit='g', currency_code='USD')
+        cls.gbp = create_offer(cls.herb, base=bases[2], price="10.0000", unit='lb', currency_code='GBP')
+        cls.box = create_offer(cls.herb, base=bases[3], price="5.0000", unit='box', currency_code='EUR')
+
+        eur, usd, gbp = (Currency.objects.get(code=code) for code in ('EUR', 'USD', 'GBP'))
+        ExchangeRate.objects.create(base_currency=usd, target_currency=eur, rate="0.800000")
+        ExchangeRate.objects.create(base_currency=eur, target_currency=gbp, rate="0.800000")
+
+    def get(self, **params):
+        return self.client.get(reverse('herbs-v1:herbs_offers', kwargs={'slug': self.herb.slug}), params)
+
+    def test_sorts_by_normalized_price(self):
+        response = self.get(currency='eur', sort='price_per_kg')
+        self.assertEqual(response.status_code, 200)
+        offers = response.json()
+        self.assertEqual([offer['id'] for offer in offers], [self.usd.id, self.eur.id, self.gbp.id, self.box.id])
+        self.assertEqual(
+            [offer['best_price_per_kg'] for offer in offers],
+            ["2.0000", "20.0000", "27.5578", None],
+        )
+        self.assertEqual(offers[0]['currency'], 'EUR')
+        self.assertEqual(offers[0]['prices'][0]['price_per_kg'], "2.0000")
+
+    def test_filters_and_cuts_to_top_n(self):
+        offers = self.get(currency='EUR', sort='price_per_kg', max_price_per_kg='25').json()
+        self.assertEqual([offer['id'] for offer in offers], [self.usd.id, self.eur.id])
+        offers = self.get(currency='EUR', sort='price_per_kg', limit='1').json()
+        self.assertEqual([offer['id'] for offer in offers], [self.usd.id])
+
+    def test_validation(self):
+        self.assertEqual(self.get(sort='price_per_kg').status_code, 400)
+        self.assertEqual(self.get(currency='EUR', sort='name').status_code, 400)
+        self.assertEqual(self.get(currency='XYZ').status_code, 400)
+        self.assertEqual(self.get(currency='EUR', limit='many').status_code, 400)
+        self.assertEqual(self.get(currency='EUR', limit='0').status_code, 400)
+        self.assertEqual(self.get(limit='-1').status_code, 400)
+
+
+class HerbPriceSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chamomile, cls.ginger, cls.mint = create_catalog(3)
+
+    def names(self, **params):
+        response = self.client.get(reverse('herbs-v1:herbs_list'), {'pagination': 'false', **params})
+        return [(herb['name'], herb['price']) for herb in read_json(response)]
+
+    def test_projection_follows_inventory_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = create_offer(self.chamomile, price="20.0000")
+            create_offer(self.chamomile, price="0.0100", unit='g')
+            create_offer(self.ginger, price="2.0000", unit='lb', currency_code='EUR')
+
+        summary = HerbPriceSummary.objects.get(herb=self.chamomile, currency__code='USD')
+        self.assertEqual((summary.min_price_per_kg, summary.max_price_per_kg), (Decimal("10"), Decimal("20")))
+        self.assertEqual(summary.offer_count, 1)
+        self.assertTrue(summary.in_stock)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.prices.get(unit='g').delete()
+        summary = HerbPriceSummary.objects.get(herb=self.chamomile, currency__code='USD')
+        self.assertEqual(summary.min_price_per_kg, Decimal("20"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.is_available = False
+            item.save()
+        self.assertFalse(HerbPriceSummary.objects.filter(herb=self.chamomile).exists())
+
+    def test_refresh_updates_rows_in_place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = create_offer(self.chamomile, price="20.0000")
+            create_offer(self.chamomile, price="0.0180", unit='g', currency_code='EUR')
+        summary = HerbPriceSummary.objects.get(herb=self.chamomile, currency__code='USD')
+
+        item.prices.filter(currency__code='USD').update(price="16.0000")
+        item.prices.filter(currency__code='EUR').delete()
+        refresh_price_summaries([self.chamomile.id])
+        self.assertEqual(
+            list(HerbPriceSummary.objects.filter(herb=self.chamomile).values_list('pk', 'min_price_per_kg')),
+            [(summary.pk, Decimal("16"))],
+        )
+
+    def test_rebuild_matches_incremental_state(self):
+        create_offer(self.chamomile, price="20.0000")
+        create_offer(self.ginger, price="12.0000")
+        self.assertEqual(HerbPriceSummary.objects.count(), 0)
+        self.assertEqual(rebuild_price_summaries(), 2)
+        self.assertEqual(
+            list(HerbPriceSummary.objects.order_by('min_price_per_kg').values_list('herb__name', flat=True)),
+            ["Herb 001", "Herb 000"],
+        )
+
+    def test_list_orders_and_filters_by_price(self):
+        create_offer(self.chamomile, price="20.0000")
+        create_offer(self.ginger, price="12.0000")
+        create_offer(self.mint, price="1.0000", currency_code='EUR')
+        rebuild_price_summaries()
+
+        self.assertEqual(self.names(ordering='price'), [
+            ("Herb 001", "12.0000"), ("Herb 000", "20.0000"), ("Herb 002", None),
+        ])
+        self.assertEqual(self.names(ordering='-price')[-1], ("Herb 002", None))
+        self.assertEqual(self.names(ordering='price', currency='eur')[0], ("Herb 002", "1.0000"))
+
+        InventoryItem.objects.filter(herb=self.ginger).update(is_available=False)
+        rebuild_price_summaries()
+        self.assertEqual([name for name, _ in self.names(in_stock='true')], ["Herb 000", "Herb 002"])
+        self.assertEqual([name for name, _ in self.names(in_stock='false')], ["Herb 001"])
+
+    def test_cursor_pagination_ignores_price_ordering(self):
+        response = self.client.get(reverse('herbs-v1:herbs_list'), {'pagination': 'cursor', 'ordering': 'price'})
+        self.assertEqual(response.status_code, 200)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, size=(1200, 800)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (120, 160, 90)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_category_image_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name="Sleep", image=self.upload("sleep.png"))
+        category.refresh_from_db()
+
+        variants = category.image_variants
+        self.assertEqual(variants['source'], category.image.name)
+        self.assertEqual(variants['width'], 1200)
+        self.assertEqual(sorted(variants['variants']['webp']), ['1024', '320', '640'])
+        path = os.path.join(self.media_root, variants['variants']['jpeg']['320'])
+        with Image.open(path) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (320, 213)))
+
+        data = self.client.get(reverse('herbs-v1:herbs_categories'), {'pagination': 'false'})
+        srcset = read_json(data)[0]['image_variants']['webp']
+        self.assertTrue(srcset.startswith('http://testserver/media/categories/sleep_320w.webp 320w, '))
+        self.assertTrue(srcset.endswith('_1024w.webp 1024w'))
+
+        # Saving without a new upload does not regenerate; replacing the file does.
+        with mock.patch('core.images.generate_image_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                category.save()
+        delay.assert_not_called()
+        with self.captureOnCommitCallbacks(execute=True):
+            category.image = self.upload("small.png", size=(200, 100))
+            category.save()
+        category.refresh_from_db()
+        self.assertEqual(category.image_variants['variants']['webp'], {'200': 'categories/small_200w.webp'})
+        self.assertFalse(os.path.exists(path))
+
+    def test_variants_are_deleted_with_the_row(self):
+        herb = Herb.objects.create(name="Chamomile")
+        with self.captureOnCommitCallbacks(execute=True):
+            media = HerbMedia.objects.create(herb=herb, type=HerbMedia.TypeChoices.IMAGE, file=self.upload("leaf.png"))
+        media.refresh_from_db()
+        path = os.path.join(self.media_root, media.file_variants['variants']['webp']['320'])
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            media.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_decompression_bombs_get_no_variants(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            with self.captureOnCommitCallbacks(execute=True):
+                category = Category.objects.create(name="Sleep", image=self.upload("sleep.png"))
+        category.refresh_from_db()
+        self.assertEqual(category.image_variants, {'source': category.image.name})
+
+    def test_non_image_media_has_no_variants(self):
+        herb = Herb.objects.create(name="Chamomile")
+        with self.captureOnCommitCallbacks(execute=True):
+            media = HerbMedia.objects.create(
+                herb=herb,
+                type=HerbMedia.TypeChoices.DOCUMENT,
+                file=SimpleUploadedFile("leaflet.pdf", b"%PDF-1.4"),
+            )
+        media.refresh_from_db()
+        self.assertEqual(media.file_variants, {'source': media.file.name})
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.herb = create_catalog(2)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def detail(self, **params):
+        return self.client.get(reverse('herbs-v1:herbs_detail', kwargs={'slug': self.herb.slug}), params)
+
+    def test_fields_trim_tree_and_queries(self):
+        # Version lookup, the herb, and the tags prefetch.
+        with self.assertNumQueries(3):
+            response = self.detail(fields='name,slug,tags.name,tags.slug')
+        self.assertEqual(response.json(), {
+            'name': self.herb.name,
+            'slug': self.herb.slug,
+            'tags': [{'name': "Calming", 'slug': "calming"}],
+        })
+
+    def test_expand_collapses_other_relations_to_slugs(self):
+        data = self.detail(fields='name,category,symptoms,medias', expand='category').json()
+        self.assertEqual(data['category']['slug'], "digestive-health")
+        self.assertEqual(data['symptoms'], ["nausea"])
+        self.assertEqual(data['medias'], [self.herb.medias.get().pk])
+
+        data = self.detail(expand='').json()
+        self.assertEqual(data['category'], "digestive-health")
+        self.assertEqual(data['ailments'], ["indigestion"])
+
+    def test_sparse_requests_bypass_document_cache(self):
+        full = self.detail().json()
+        self.assertIn('description', full)
+        self.assertEqual(set(self.detail(fields='name').json()), {'name'})
+        self.assertEqual(self.detail().json(), full)
+
+    def test_list_fields(self):
+        response = self.client.get(reverse('herbs-v1:herbs_list'), {'pagination': 'false', 'fields': 'name,slug'})
+        self.assertEqual(read_json(response), [
+            {'name': "Herb 000", 'slug': "herb-000"},
+            {'name': "Herb 001", 'slug': "herb-001"},
+        ])
+        # Count, herbs, and the medias prefetch only.
+        with self.assertNumQueries(3):
+            self.client.get(reverse('herbs-v1:herbs_list'), {'fields': 'name,medias.file'})
+
+
+class RendererTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.herb = create_catalog(3)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_msgpack_matches_json(self):
+        url = reverse('herbs-v1:herbs_detail', kwargs={'slug': self.herb.slug})
+        as_json = self.client.get(url)
+        as_msgpack = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(as_msgpack['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(as_msgpack.content), as_json.json())
+        self.assertNotEqual(as_msgpack['ETag'], as_json['ETag'])
+        self.assertIn('Accept', as_json['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=as_json['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_renderers(self):
+        url = reverse('herbs-v1:herbs_list')
+        as_json = self.client.get(url).json()
+        self.assertEqual(len(as_json['results']), 3)
+        self.assertEqual(msgpack.unpackb(self.client.get(url, {'format': 'msgpack'}).content), as_json)
+        self.assertEqual(read_json(self.client.get(url, {'pagination': 'false'})), as_json['results'])
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_renderers', scale=2, number=1, repeat=1, stdout=out)
+        self.assertIn("list x2 (6 herbs)", out.getvalue())
+        self.assertIn("MessagePackRenderer", out.getvalue())
+
+
+class TaxonomyBundleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog(1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bundle_is_cached_and_versioned(self):
+        url = reverse('herbs-v1:herbs_taxonomy')
+        response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(
+            set(data), {'version', 'url', 'categories', 'tags', 'symptoms', 'ailments', 'illnesses'}
+        )
+        self.assertEqual([illness['slug'] for illness in data['illnesses']], ["gastritis"])
+        self.assertEqual(response['ETag'], f'"{data["version"]}"')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        current = self.client.get(reverse('herbs-v1:herbs_taxonomy_current')).json()
+        self.assertEqual(current, {'version': data['version'], 'url': data['url']})
+
+        versioned = self.client.get(data['url'])
+        self.assertEqual(versioned.json(), data)
+        self.assertIn('immutable', versioned['Cache-Control'])
+        self.assertIn('max-age=31536000', versioned['Cache-Control'])
+
+    def test_taxonomy_changes_bump_version(self):
+        old = self.client.get(reverse('herbs-v1:herbs_taxonomy')).json()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name="Soothing")
+        new = self.client.get(reverse('herbs-v1:herbs_taxonomy')).json()
+        self.assertNotEqual(new['version'], old['version'])
+        self.assertEqual([tag['slug'] for tag in new['tags']], ["calming", "soothing"])
+
+        response = self.client.get(old['url'])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], new['url'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Illness.objects.get().symptoms.clear()
+        self.assertNotEqual(self.client.get(reverse('herbs-v1:herbs_taxonomy')).json()['version'], new['version'])
+
+    def test_bundle_rendered_before_a_commit_is_not_served_after_it(self):
+        url = reverse('herbs-v1:herbs_taxonomy')
+
+        def render_then_commit(request):
+            bundle = build_bundle(request)
+            with self.captureOnCommitCallbacks(execute=True):
+                Tag.objects.get_or_create(name="Soothing")
+            return bundle
+
+        with mock.patch('herbs.taxonomy.build_bundle', side_effect=render_then_commit):
+            self.client.get(url)
+        self.assertEqual([tag['slug'] for tag in self.client.get(url).json()['tags']], ["calming", "soothing"])
+
+
+class HerbGraphTests(TestCase):
+    def setUp(self):
+        self.illness = Illness.objects.create(name="Migraine")
+        self.headache = Symptom.objects.create(name="Headache")
+        self.nausea = Symptom.objects.create(name="Nausea")
+        self.ailment = Ailment.objects.create(name="Tension")
+        self.illness.symptoms.add(self.headache, self.nausea)
+        self.illness.ailments.add(self.ailment)
+
+        self.feverfew = Herb.objects.create(name="Feverfew")
+        self.ginger = Herb.objects.create(name="Ginger")
+        self.mint = Herb.objects.create(name="Peppermint")
+        self.feverfew.illnesses.add(self.illness)
+        self.feverfew.symptoms.add(self.headache)
+        self.ginger.symptoms.add(self.nausea)
+        self.mint.ailments.add(self.ailment)
+        rebuild_herb_graph()
+
+    def links(self):
+        return set(HerbConditionLink.objects.values_list('herb__name', 'kind', 'target_id', 'hops', 'paths'))
+
+    def herbs(self, url_name, slug, **params):
+        response = self.client.get(reverse(url_name, kwargs={'slug': slug}), {'pagination': 'false', **params})
+        return [(herb['name'], herb['hops'], herb['paths']) for herb in read_json(response)]
+
+    def test_closure(self):
+        self.assertEqual(self.herbs('herbs-v1:illness_herbs', 'migraine'), [
+            ("Feverfew", 1, 2), ("Ginger", 2, 1), ("Peppermint", 2, 1),
+        ])
+        self.assertEqual(self.herbs('herbs-v1:illness_herbs', 'migraine', max_hops=1), [("Feverfew", 1, 2)])
+        self.assertEqual(self.herbs('herbs-v1:symptom_herbs', 'headache'), [("Feverfew", 1, 2)])
+        self.assertEqual(self.herbs('herbs-v1:symptom_herbs', 'nausea'), [("Ginger", 1, 1), ("Feverfew", 2, 1)])
+        self.assertEqual(self.herbs('herbs-v1:ailment_herbs', 'tension'), [("Peppermint", 1, 1), ("Feverfew", 2, 1)])
+
+        # Illness lookup, count, and the herbs with their links in one join.
+        with self.assertNumQueries(3):
+            self.client.get(reverse('herbs-v1:illness_herbs', kwargs={'slug': 'migraine'}), {'fields': 'name'})
+
+        response = self.client.get(reverse('herbs-v1:illness_herbs', kwargs={'slug': 'migraine'}), {'max_hops': 3})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('herbs-v1:illness_herbs', kwargs={'slug': 'unknown'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_incremental_updates_match_rebuild(self):
+        cough = Symptom.objects.create(name="Cough")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ginger.illnesses.add(self.illness)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.illness.symptoms.remove(self.headache)
+        with self.captureOnCommitCallbacks(execute=True):
+            cough.illnesses.add(self.illness)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mint.symptoms.add(cough)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ailment.illnesses.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nausea.delete()
+
+        incremental = self.links()
+        self.assertEqual(len(incremental), len(build_links()))
+        rebuild_herb_graph()
+        self.assertEqual(incremental, self.links())
+        self.assertIn(("Peppermint", 'illness', self.illness.pk, 2, 1), incremental)
+        self.assertNotIn(("Feverfew", 'ailment', self.ailment.pk, 2, 1), incremental)
@@ -1,13 +1,75 @@
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter, SearchFilter
 
 from herbs.models import Herb
+from inventory.models import HerbPriceSummary
+from herbs.bitmaps import FACETS as BITMAP_FACETS, get_bitmap_index
+from herbs.search import get_search_backend
 
 
 class HerbFilter(filters.FilterSet):
     category = filters.BaseInFilter(field_name='category__slug', lookup_expr='in')
     tags = filters.BaseInFilter(field_name='tags__slug', lookup_expr='in')
     symptoms = filters.BaseInFilter(field_name='symptoms__slug', lookup_expr='in')
+    in_stock = filters.BooleanFilter(method='filter_in_stock')
 
     class Meta:
         model = Herb
         fields = ['category', 'tags', 'symptoms']
+
+    def filter_queryset(self, queryset):
+        """
+        With ``HERBS_BITMAP_INDEX`` on, the facet filters are resolved by the
+        in-memory bitmap index and applied as one ``id__in`` lookup.
+        """
+        if not settings.HERBS_BITMAP_INDEX:
+            return super().filter_queryset(queryset)
+
+        data = self.form.cleaned_data
+        ids = get_bitmap_index().resolve({facet: data.get(facet) for facet in BITMAP_FACETS})
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+
+        for name, value in data.items():
+            if name not in BITMAP_FACETS:
+                queryset = self.filters[name].filter(queryset, value)
+        return queryset
+
+    def filter_in_stock(self, queryset, name, value):
+        stocked = Exists(HerbPriceSummary.objects.filter(herb=OuterRef('pk'), in_stock=True))
+        return queryset.filter(stocked if value else ~stocked)
+
+
+class HerbSearchFilter(SearchFilter):
+    """
+    ``?search=`` backed by the ranked full-text index in :mod:`herbs.search`.
+
+    Results are ordered by relevance unless an explicit ``?ordering=`` is given.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return get_search_backend().search(queryset, query)
+
+
+class HerbOrderingFilter(OrderingFilter):
+    """
+    ``OrderingFilter`` that sorts herbs without a ``price`` last in both directions.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+        return queryset.order_by(*[self.get_expression(field) for field in ordering])
+
+    def get_expression(self, field):
+        if field.lstrip('-') != 'price':
+            return field
+        if field.startswith('-'):
+            return F('price').desc(nulls_last=True)
+        return F('price').asc(nulls_last=True)
@@ -7,6 +7,7 @@ from herbs.models import (
     HerbPreparationStep,
     HerbWarning,
     ScientificStudy,
+    RelatedHerb,
     Ailment,
     SideEffect,
     Symptom,
@@ -16,15 +17,20 @@ from herbs.models import (
 )
 
 from core.models import SEO_MODEL_FIELDS
+from core.serializers import ImageVariantsField
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Category
         fields = "__all__"
 
 
 class HerbMediaSerializer(serializers.ModelSerializer):
+    file_variants = ImageVariantsField()
+
     class Meta:
         model = HerbMedia
         fields = "__all__"
@@ -92,6 +98,8 @@ class HerbSerializer(serializers.ModelSerializer):
     symptoms = serializers.StringRelatedField(many=True, read_only=True)
     side_effects = serializers.StringRelatedField(many=True, read_only=True)
     medias = HerbMediaSerializer(many=True, read_only=True)
+    # Lowest price per kg, present when the queryset annotates it (see HerbsList).
+    price = serializers.DecimalField(max_digits=16, decimal_places=4, read_only=True)
 
     class Meta:
         model = Herb
@@ -110,6 +118,32 @@ class HerbSerializer(serializers.ModelSerializer):
             'sources',
             'tags',
             'medias',
+            'price',
+        ]
+
+
+class ConditionHerbSerializer(HerbSerializer):
+    hops = serializers.IntegerField(read_only=True)
+    paths = serializers.IntegerField(read_only=True)
+
+    class Meta(HerbSerializer.Meta):
+        fields = HerbSerializer.Meta.fields + ['hops', 'paths']
+
+
+class RelatedHerbSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source='related.name', read_only=True)
+    slug = serializers.CharField(source='related.slug', read_only=True)
+    latin_name = serializers.CharField(source='related.latin_name', read_only=True)
+    image_link = serializers.CharField(source='related.image_link', read_only=True)
+
+    class Meta:
+        model = RelatedHerb
+        fields = [
+            'name',
+            'slug',
+            'latin_name',
+            'image_link',
+            'score',
         ]
 
 
@@ -4,6 +4,15 @@ from .views import (
     HerbsList,
     HerbDetail,
     HerbOffer,
+    HerbOffersBatch,
+    HerbRelated,
+    HerbAutocomplete,
+    HerbFacets,
+    HerbRank,
+    HerbTaxonomy,
+    HerbTaxonomyCurrent,
+    ConditionHerbs,
+    HerbTaxonomyVersion,
     CategoryList,
     TagList,
     SymptomList,
@@ -15,7 +24,18 @@ urlpatterns = [
     path('categories/', CategoryList.as_view(), name='herbs_categories'),
     path('tags/', TagList.as_view(), name='herbs_tags'),
     path('symptoms/', SymptomList.as_view(), name='herbs_symptoms'),
+    path('illnesses/<slug:slug>/herbs/', ConditionHerbs.as_view(kind='illness'), name='illness_herbs'),
+    path('symptoms/<slug:slug>/herbs/', ConditionHerbs.as_view(kind='symptom'), name='symptom_herbs'),
+    path('ailments/<slug:slug>/herbs/', ConditionHerbs.as_view(kind='ailment'), name='ailment_herbs'),
+    path('taxonomy/', HerbTaxonomy.as_view(), name='herbs_taxonomy'),
+    path('taxonomy/current/', HerbTaxonomyCurrent.as_view(), name='herbs_taxonomy_current'),
+    path('taxonomy/<str:version>/', HerbTaxonomyVersion.as_view(), name='herbs_taxonomy_version'),
+    path('autocomplete/', HerbAutocomplete.as_view(), name='herbs_autocomplete'),
+    path('facets/', HerbFacets.as_view(), name='herbs_facets'),
+    path('rank/', HerbRank.as_view(), name='herbs_rank'),
+    path('offers/', HerbOffersBatch.as_view(), name='herbs_offers_batch'),
     path('', HerbsList.as_view(), name='herbs_list'),
     path('<slug:slug>/', HerbDetail.as_view(), name='herbs_detail'),
     path('<slug:slug>/offers/', HerbOffer.as_view(), name='herbs_offers'),
+    path('<slug:slug>/related/', HerbRelated.as_view(), name='herbs_related'),
 ]
@@ -1,90 +1,453 @@
+from hashlib import md5
+
 from rest_framework import status
 from rest_framework.request import Request
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import ListAPIView, RetrieveAPIView
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Prefetch
+from django.conf import settings
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 
-from core.mixins import OptionalPaginationMixin
+from core.mixins import OptionalPaginationMixin, PrefetchPlanMixin, ConditionalGetMixin, SparseFieldsetMixin
+from core.prefetch import get_prefetch_plan, apply_prefetch_plan
+from herbs.autocomplete import get_index
+from herbs.documents import get_detail_document, set_detail_document
+from herbs.facets import FACETS, facet_counts
+from herbs.graph import herbs_for_condition
+from herbs.ranking import get_symptom_matrix
+from herbs.taxonomy import get_bundle
 from herbs.models import (
     Herb,
+    HerbConditionLink,
+    Ailment,
+    Illness,
     Category,
+    RelatedHerb,
     Tag,
 )
 
-from inventory.models import (
-    InventoryItem,
-    InventoryPrice,
-)
+from checkout.models import Currency, ExchangeRate
+from checkout.reservations import get_reservation_backend
+from inventory.models import HerbPriceSummary, InventoryItem
+from inventory.offers import available_offers, offer_summaries, exchange_rates, rank_offers
 from inventory.v1.serializers import (
     InventoryOfferSerializer,
+    HerbOfferSummarySerializer,
 )
 
 from .serializers import (
     HerbSerializer,
     HerbSEOSerializer,
+    ConditionHerbSerializer,
+    RelatedHerbSerializer,
     CategorySerializer,
     TagSerializer,
     Symptom,
     SymptomSerializer,
 )
-from .filters import HerbFilter
+from .filters import HerbFilter, HerbSearchFilter, HerbOrderingFilter
 
 
-class HerbsList(OptionalPaginationMixin, ListAPIView):
+class HerbsList(SparseFieldsetMixin, PrefetchPlanMixin, OptionalPaginationMixin, ListAPIView):
+    """
+    ``price`` is the lowest price per kilogram in ``?currency=`` (or
+    ``HERBS_PRICE_CURRENCY``), read from the ``HerbPriceSummary`` projection.
+    """
     permission_classes = [AllowAny]
     queryset = Herb.objects.filter(is_active=True)
     serializer_class = HerbSerializer
-    filter_backends = (DjangoFilterBackend, SearchFilter, OrderingFilter)
+    filter_backends = (DjangoFilterBackend, HerbSearchFilter, HerbOrderingFilter)
     filterset_class = HerbFilter
     search_fields = ['name', 'latin_name', 'description']
-    ordering_fields = ['name', 'created_at']
+    ordering_fields = ['name', 'created_at', 'price']
 
+    def get_queryset(self):
+        currency = self.request.query_params.get('currency') or settings.HERBS_PRICE_CURRENCY
+        prices = HerbPriceSummary.objects.filter(herb=OuterRef('pk'), currency__code=currency.upper())
+        return super().get_queryset().annotate(price=Subquery(prices.order_by().values('min_price_per_kg')[:1]))
 
-class HerbDetail(RetrieveAPIView):
+
+class HerbDetail(ConditionalGetMixin, SparseFieldsetMixin, PrefetchPlanMixin, RetrieveAPIView):
     permission_classes = [AllowAny]
     queryset = Herb.objects.filter(is_active=True)
     serializer_class = HerbSEOSerializer
     lookup_field = "slug"
 
+    def get_document(self, request: Request, slug: str):
+        """
+        The cached full document; sparse (``?fields=`` / ``?expand=``) requests
+        render their own trimmed tree instead.
+        """
+        if self.get_fieldset() is not None:
+            return None
+        if not hasattr(self, '_document'):
+            self._document_version, self._document = get_detail_document(slug, request.build_absolute_uri('/'))
+        return self._document
+
+    def get_version(self, request: Request, *args, **kwargs):
+        slug = kwargs[self.lookup_field]
+        document = self.get_document(request, slug)
+        if document is not None:
+            updated_at = document[0]
+        else:
+            updated_at = (
+                Herb.objects.filter(slug=slug, is_active=True)
+                .values_list(Coalesce('document_updated_at', 'updated_at'), flat=True).first()
+            )
+        if updated_at is None:
+            return None
+        return f"herb-{slug}-{updated_at.timestamp():.6f}", updated_at
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        slug = kwargs[self.lookup_field]
+        document = self.get_document(request, slug)
+        if document is None:
+            instance = self.get_object()
+            if self.get_fieldset() is not None:
+                return Response(self.get_serializer(instance).data)
+            document = (
+                instance.document_updated_at or instance.updated_at, self.get_serializer(instance).data
+            )
+            set_detail_document(slug, self._document_version, request.build_absolute_uri('/'), *document)
+        return Response(document[1])
 
-class HerbOffer(APIView):
+
+class HerbOffer(ConditionalGetMixin, APIView):
+    """
+    Available offers for a herb. ``?currency=EUR`` adds each price (and each
+    offer's best price) per kilogram in that currency; ``?sort=price_per_kg``
+    puts the cheapest offers first, ``?max_price_per_kg=`` drops the rest and
+    ``?limit=`` keeps the top N.
+    """
     permission_classes = [AllowAny]
+    sort_fields = ['price_per_kg']
+    max_limit = 100
 
-    def get(self, request: Request, slug: str, *args, **kwargs) -> Response:
+    def get_version(self, request: Request, slug: str, *args, **kwargs):
+        """
+        Cart holds change ``available_quantity`` without touching any
+        timestamp, so the ETag carries the items' reserved totals and offers
+        have no ``Last-Modified``.
+        """
+        items = list(
+            InventoryItem.objects.filter(herb__slug=slug, herb__is_active=True, is_available=True)
+            .annotate(price_count=Count('prices'), prices_updated=Max('prices__updated_at'))
+            .only('id', 'updated_at', 'reserved_quantity')
+            .order_by('pk')
+        )
+        if not items:
+            return None
+        version = {
+            'price_count': sum(item.price_count for item in items),
+            'items_updated': max(item.updated_at for item in items),
+            'prices_updated': max((item.prices_updated for item in items if item.prices_updated), default=None),
+        }
+        if request.query_params.get('currency'):
+            # Converted prices also depend on the exchange rates.
+            version.update(ExchangeRate.objects.aggregate(
+                rate_count=Count('id'), rates_updated=Max('updated_at'),
+            ))
+        timestamps = [
+            value for value in (
+                version['items_updated'], version['prices_updated'], version.get('rates_updated')
+            ) if value
+        ]
+        reserved = get_reservation_backend().reserved(items)
+        etag = "offers-{}-{}-{}-{}-{}-{}".format(
+            slug,
+            len(items),
+            version['price_count'],
+            version.get('rate_count', 0),
+            "-".join(f"{value.timestamp():.6f}" for value in timestamps),
+            md5(repr([reserved[item.pk] for item in items]).encode()).hexdigest()[:12],
+        )
+        return etag, None
+
+    def retrieve(self, request: Request, slug: str, *args, **kwargs) -> Response:
+        params = request.query_params
+        currency = params.get('currency', '').upper()
+        sort = params.get('sort')
+        if sort and sort not in self.sort_fields:
+            return Response({"detail": f"Unknown sort: {sort}."}, status=status.HTTP_400_BAD_REQUEST)
+        if (sort or 'max_price_per_kg' in params) and not currency:
+            return Response(
+                {"detail": "Sorting or filtering by price per kg requires a currency."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         try:
-            herb = Herb.objects.get(slug=slug, is_active=True)
-        except Herb.DoesNotExist:
+            limit = min(int(params['limit']), self.max_limit) if 'limit' in params else None
+            max_price = float(params['max_price_per_kg']) if 'max_price_per_kg' in params else None
+        except ValueError:
+            return Response({"detail": "Invalid limit or max_price_per_kg."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None and limit < 1:
+            return Response({"detail": "Invalid limit or max_price_per_kg."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not Herb.objects.filter(slug=slug, is_active=True).exists():
             return Response({"detail": "Herb not found."}, status=status.HTTP_404_NOT_FOUND)
+        if currency and not Currency.objects.filter(code=currency).exists():
+            return Response({"detail": f"Unknown currency: {currency}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = list(available_offers(herb__slug=slug))
+        if not currency:
+            return Response(InventoryOfferSerializer(items[:limit], many=True).data, status=status.HTTP_200_OK)
+
+        ranked, best, per_price = rank_offers(items, exchange_rates(currency), max_price_per_kg=max_price)
+        if not sort:
+            # Keep the default ordering, only annotate.
+            kept = {item.id for item in ranked}
+            ranked = [item for item in items if item.id in kept]
+        ranked = ranked[:limit]
+        offers = InventoryOfferSerializer(ranked, many=True).data
+        for item, offer in zip(ranked, offers):
+            offer['currency'] = currency
+            offer['best_price_per_kg'] = _format_price(best.get(item.id))
+            # Serialized prices follow the prefetched ``item.prices``.
+            for price, data in zip(item.prices.all(), offer['prices']):
+                data['price_per_kg'] = _format_price(per_price.get(price.id))
+        return Response(offers, status=status.HTTP_200_OK)
+
+
+def _format_price(value):
+    return None if value is None else f"{value:.4f}"
 
-        inventory_items = (
-            InventoryItem.objects.filter(herb=herb, is_available=True)
-            .select_related('base__partner')
-            .prefetch_related(
-                Prefetch('prices', queryset=InventoryPrice.objects.select_related('currency'))
+
+class HerbOffersBatch(APIView):
+    """
+    Offer summaries for ``?slugs=a,b,c`` (offer and partner counts, currencies
+    and the lowest price per currency and unit), with ``?include=offers`` to
+    embed the offers themselves. Answers in a fixed number of queries.
+    """
+    permission_classes = [AllowAny]
+    max_slugs = 100
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        slugs = list(dict.fromkeys(value for value in request.query_params.get('slugs', '').split(',') if value))
+        if not slugs:
+            return Response({"detail": "The slugs parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(slugs) > self.max_slugs:
+            return Response(
+                {"detail": f"At most {self.max_slugs} slugs can be requested at once."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
+
+        summaries = offer_summaries(slugs)
+        if 'offers' in request.query_params.get('include', '').split(','):
+            for summary in summaries.values():
+                summary['offers'] = []
+            for item in available_offers(herb__slug__in=slugs).select_related('herb'):
+                summaries[item.herb.slug]['offers'].append(item)
+
+        data = HerbOfferSummarySerializer(list(summaries.values()), many=True).data
+        return Response({summary['slug']: summary for summary in data}, status=status.HTTP_200_OK)
+
+
+class HerbRelated(ListAPIView):
+    """
+    The precomputed nearest neighbours of a herb, best first.
+    """
+    permission_classes = [AllowAny]
+    serializer_class = RelatedHerbSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return (
+            RelatedHerb.objects.filter(herb__slug=self.kwargs['slug'], related__is_active=True)
+            .select_related('related')
+            .order_by('rank')
         )
 
-        offers = InventoryOfferSerializer(inventory_items, many=True).data
-        return Response(offers, status=status.HTTP_200_OK)
+
+class ConditionHerbs(SparseFieldsetMixin, PrefetchPlanMixin, OptionalPaginationMixin, ListAPIView):
+    """
+    Herbs relevant to an illness, symptom or ailment, read from the
+    ``HerbConditionLink`` closure: directly linked herbs first, then those
+    linked through an illness (``?max_hops=1`` keeps only the direct ones).
+    """
+    permission_classes = [AllowAny]
+    serializer_class = ConditionHerbSerializer
+    kind = None
+    condition_models = {
+        HerbConditionLink.KindChoices.ILLNESS: Illness,
+        HerbConditionLink.KindChoices.SYMPTOM: Symptom,
+        HerbConditionLink.KindChoices.AILMENT: Ailment,
+    }
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        if request.query_params.get('max_hops', '2') not in ('1', '2'):
+            return Response({"detail": "max_hops must be 1 or 2."}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        target = get_object_or_404(self.condition_models[self.kind], slug=self.kwargs['slug'], is_active=True)
+        max_hops = int(self.request.query_params.get('max_hops', 2))
+        return apply_prefetch_plan(
+            herbs_for_condition(self.kind, target.pk, max_hops=max_hops), self.get_prefetch_plan()
+        )
+
+
+def taxonomy_url(request, version):
+    return request.build_absolute_uri(reverse('herbs-v1:herbs_taxonomy_version', kwargs={'version': version}))
+
+
+class HerbTaxonomy(ConditionalGetMixin, APIView):
+    """
+    Categories, tags, symptoms, ailments and illnesses in one payload, with
+    the content ``version`` and the immutable ``url`` serving that version.
+    """
+    permission_classes = [AllowAny]
+
+    def get_version(self, request: Request, *args, **kwargs):
+        return get_bundle(request)[0], None
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        version, data = get_bundle(request)
+        return Response({'version': version, 'url': taxonomy_url(request, version), **data})
+
+
+class HerbTaxonomyCurrent(HerbTaxonomy):
+    """
+    Only the current taxonomy ``version`` and its immutable ``url``, so
+    clients revalidate a few bytes and fetch the bundle from the long-cached
+    versioned URL.
+    """
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        version, _ = get_bundle(request)
+        return Response({'version': version, 'url': taxonomy_url(request, version)})
+
+
+class HerbTaxonomyVersion(APIView):
+    """
+    A specific taxonomy version, cacheable forever. Outdated versions redirect
+    to the current one.
+    """
+    permission_classes = [AllowAny]
+    max_age = 60 * 60 * 24 * 365
+
+    def get(self, request: Request, version: str, *args, **kwargs):
+        current, data = get_bundle(request)
+        if version != current:
+            response = redirect(taxonomy_url(request, current))
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        response = Response({'version': current, 'url': taxonomy_url(request, current), **data})
+        patch_cache_control(response, public=True, max_age=self.max_age, immutable=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class HerbAutocomplete(APIView):
+    permission_classes = [AllowAny]
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({"detail": "Invalid limit."}, status=status.HTTP_400_BAD_REQUEST)
+        types = {value for value in request.query_params.get('types', '').split(',') if value}
+
+        suggestions = get_index().lookup(query, limit=limit, types=types)
+        return Response([suggestion._asdict() for suggestion in suggestions], status=status.HTTP_200_OK)
+
+
+class HerbFacets(APIView):
+    """
+    Counts per category, tag and symptom for the filters and search given in
+    the query string. ``?facets=tags,symptoms`` limits the facets computed.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        requested = [value for value in request.query_params.get('facets', '').split(',') if value]
+        unknown = [value for value in requested if value not in FACETS]
+        if unknown:
+            return Response(
+                {"detail": f"Unknown facets: {', '.join(unknown)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        counts = facet_counts(
+            Herb.objects.filter(is_active=True),
+            request.query_params,
+            request=request,
+            facets=requested or None,
+        )
+        return Response(counts, status=status.HTTP_200_OK)
+
+
+class HerbRank(APIView):
+    """
+    Herbs ranked by weighted coverage of ``?symptoms=a,b,c``, counting direct
+    symptom links fully and links through the herb's illnesses at half weight.
+    """
+    permission_classes = [AllowAny]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        slugs = [value for value in request.query_params.get('symptoms', '').split(',') if value]
+        if not slugs:
+            return Response(
+                {"detail": "The symptoms parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({"detail": "Invalid limit."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ranking = get_symptom_matrix().rank(slugs, limit=limit)
+        queryset = apply_prefetch_plan(
+            Herb.objects.filter(id__in=[herb_id for herb_id, _, _ in ranking], is_active=True),
+            get_prefetch_plan(HerbSerializer),
+        )
+        herbs = {herb.id: herb for herb in queryset}
+
+        results = []
+        for herb_id, score, matched in ranking:
+            if herb_id not in herbs:
+                continue
+            data = HerbSerializer(herbs[herb_id], context={'request': request}).data
+            data['score'] = round(score, 4)
+            data['matched_symptoms'] = matched
+            results.append(data)
+        return Response(results, status=status.HTTP_200_OK)
 
 
 class CategoryList(OptionalPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ['name', 'created_at']
 
 
 class TagList(OptionalPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     queryset = Tag.objects.filter(is_active=True)
     serializer_class = TagSerializer
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ['name', 'created_at']
 
 
 class SymptomList(OptionalPaginationMixin, ListAPIView):
     permission_classes = [AllowAny]
     queryset = Symptom.objects.filter(is_active=True)
     serializer_class = SymptomSerializer
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ['name', 'created_at']
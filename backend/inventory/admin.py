@@ -7,6 +7,7 @@ from .models import (
     InventoryBase,
     InventoryItem,
     InventoryPrice,
+    InventoryUnitConversion,
     InventoryTransactionLog,
     LowStockAlert,
     Order,
@@ -38,6 +39,15 @@ class InventoryPriceStackedInline(NestedStackedInline):
     )
 
 
+class InventoryUnitConversionStackedInline(NestedStackedInline):
+    model = InventoryUnitConversion
+    extra = 0
+    fields = (
+        'unit',
+        'kilograms',
+    )
+
+
 @admin.register(InventoryBase)
 class InventoryBaseAdmin(ExportMixin, VersionAdmin):
     resource_class = InventoryBaseResource
@@ -56,7 +66,7 @@ class InventoryItemAdmin(ExportMixin, NestedModelAdmin, VersionAdmin):
     list_filter = ('is_available', 'base__partner', 'is_active')
     search_fields = ('herb__name', 'base__name')
 
-    inlines = (InventoryPriceStackedInline,)
+    inlines = (InventoryPriceStackedInline, InventoryUnitConversionStackedInline)
 
 
 @admin.register(InventoryPrice)
@@ -0,0 +1,120 @@
+"""
+Low stock alerts.
+
+:func:`scan_low_stock` keeps ``LowStockAlert`` in step with stock in a fixed
+number of queries: items below their threshold come from the
+``inventory_item_low_stock_idx`` partial index, those without an active alert
+get one through :func:`raise_alerts`, and alerts of items back above their
+threshold are deleted in one statement, so a later shortage raises a fresh
+alert. Orders taking an item below its threshold raise its alert the same way
+(see ``inventory.stock``).
+
+:func:`send_low_stock_digests` then mails each partner a single digest of its
+unsent alerts, instead of one message per item.
+"""
+from collections import defaultdict
+
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from inventory.models import InventoryItem, LowStockAlert
+from partners.models import PartnerContact, PartnerStaff
+
+# Must match the condition of ``inventory_item_low_stock_idx``.
+BELOW_THRESHOLD = Q(quantity__lt=F('low_stock_threshold'))
+DIGEST_ROLES = [PartnerStaff.StaffRoleChoices.ADMIN, PartnerStaff.StaffRoleChoices.MANAGER]
+
+
+def raise_alerts(items):
+    """
+    Raises the alerts of ``items``, an ``InventoryItem`` queryset, in one
+    upsert: missing alerts are created and inactive ones reactivated, both
+    unsent. Active alerts are left alone, so a digest is not sent twice.
+
+    :return: Number of alerts raised.
+    """
+    raised = list(items.exclude(low_stock_alert__is_active=True).values_list('pk', flat=True))
+    LowStockAlert.objects.bulk_create(
+        [LowStockAlert(inventory_item_id=pk) for pk in raised],
+        update_conflicts=True,
+        unique_fields=['inventory_item'],
+        update_fields=['is_active', 'notified', 'triggered_at', 'updated_at'],
+    )
+    return len(raised)
+
+
+def scan_low_stock():
+    """
+    Raises the alerts of items below their threshold and clears those of
+    items that are not anymore.
+
+    :return: ``(created, cleared)`` numbers of alerts.
+    """
+    with transaction.atomic():
+        created = raise_alerts(InventoryItem.objects.filter(BELOW_THRESHOLD))
+        cleared, _ = LowStockAlert.objects.filter(
+            inventory_item__quantity__gte=F('inventory_item__low_stock_threshold')
+        ).delete()
+    return created, cleared
+
+
+def digest_recipients(partner_ids):
+    """
+    :return: Mapping of partner id to the sorted email addresses of its email
+        contacts and active admin / manager staff.
+    """
+    recipients = defaultdict(set)
+    contacts = PartnerContact.objects.filter(
+        partner__in=partner_ids, type=PartnerContact.ContactType.EMAIL, is_active=True
+    ).values_list('partner_id', 'value')
+    staff = PartnerStaff.objects.filter(
+        partner__in=partner_ids, role__in=DIGEST_ROLES, is_active=True, user__is_active=True
+    ).values_list('partner_id', 'user__email')
+    for partner_id, email in [*contacts, *staff]:
+        recipients[partner_id].add(email)
+    return {partner_id: sorted(emails) for partner_id, emails in recipients.items()}
+
+
+def format_digest(partner, alerts):
+    subject = f"Low stock at {partner.name}: {len(alerts)} item(s)"
+    lines = [
+        f"- {item.herb.name} @ {item.base.name}: {item.quantity:g} {item.quantity_unit} "
+        f"(threshold {item.low_stock_threshold:g})"
+        for item in (alert.inventory_item for alert in alerts)
+    ]
+    body = "\n".join([f"The following items of {partner.name} are running low:", "", *lines])
+    return subject, body
+
+
+def send_low_stock_digests():
+    """
+    Mails one digest per partner with its active, unsent alerts and marks
+    them as notified. Alerts of partners without recipients stay unsent.
+
+    :return: Number of digests sent.
+    """
+    alerts = (
+        LowStockAlert.objects.filter(notified=False, is_active=True)
+        .select_related('inventory_item__herb', 'inventory_item__base__partner')
+        .order_by('inventory_item__base__partner', 'inventory_item__base__name', 'inventory_item__herb__name')
+    )
+    by_partner = defaultdict(list)
+    for alert in alerts:
+        by_partner[alert.inventory_item.base.partner].append(alert)
+    if not by_partner:
+        return 0
+
+    recipients = digest_recipients([partner.pk for partner in by_partner])
+    messages, sent = [], []
+    for partner, partner_alerts in by_partner.items():
+        if not recipients.get(partner.pk):
+            continue
+        messages.append((*format_digest(partner, partner_alerts), None, recipients[partner.pk]))
+        sent.extend(alert.pk for alert in partner_alerts)
+
+    if messages:
+        send_mass_mail(messages)
+        LowStockAlert.objects.filter(pk__in=sent).update(notified=True, updated_at=timezone.now())
+    return len(messages)
@@ -0,0 +1,140 @@
+"""
+Stock ledger balances.
+
+``InventoryTransactionLog`` is replayed in id order from a zero balance:
+``add`` entries increase it, ``remove`` and ``order`` entries decrease it and
+``adjust`` entries are stock counts that set it.
+
+:func:`take_snapshots` periodically stores an ``InventoryLedgerSnapshot`` for
+every item with logs since the previous run, all stamped with the same
+watermark: the latest log id at that time. An item's latest snapshot then
+accounts for all of its logs up to the latest watermark, so
+:func:`balances_at` reads one snapshot per item and replays only the logs
+after that watermark, however long the history is.
+
+Ids are handed out when a log is inserted, not when its transaction commits,
+so a log still in flight can have a lower id than one already visible.
+Snapshots therefore stop ``STOCK_LEDGER_SNAPSHOT_LAG`` seconds in the past,
+when every transaction that wrote a lower id has long committed.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from inventory.models import InventoryItem, InventoryLedgerSnapshot, InventoryTransactionLog
+
+ActionChoices = InventoryTransactionLog.ActionChoices
+SIGNS = {ActionChoices.ADD: 1, ActionChoices.REMOVE: -1, ActionChoices.ORDER: -1}
+# Floating point slack when comparing balances.
+EPSILON = 1e-6
+
+
+def replay(balance, entries):
+    """
+    :param entries: ``(action, quantity)`` pairs in id order.
+    :return: The balance after applying the entries.
+    """
+    for action, quantity in entries:
+        balance = quantity if action == ActionChoices.ADJUST else balance + SIGNS[action] * quantity
+    return balance
+
+
+def _watermark(moment):
+    """
+    :return: Watermark of the latest snapshot run at ``moment``, 0 if none.
+    """
+    latest = (
+        InventoryLedgerSnapshot.objects.filter(taken_at__lte=moment)
+        .order_by('-taken_at', '-last_transaction')
+        .values_list('last_transaction', flat=True)
+        .first()
+    )
+    return latest or 0
+
+
+def _balances(moment, items=None, last_transaction=None):
+    """
+    :param last_transaction: Replay the logs up to this id instead of those
+        created by ``moment``.
+    :return: ``(pk, on-hand quantity, ledger balance, replayed)`` for each
+        item, where ``replayed`` tells whether it had logs after the watermark.
+    """
+    watermark = _watermark(moment)
+    snapshots = InventoryLedgerSnapshot.objects.filter(
+        inventory_item=OuterRef('pk'), taken_at__lte=moment
+    ).order_by('-taken_at', '-last_transaction')
+    rows = (InventoryItem.objects.all() if items is None else items).annotate(
+        snapshot=Subquery(snapshots.values('quantity')[:1]),
+    ).order_by('pk').values_list('pk', 'quantity', 'snapshot')
+
+    logs = InventoryTransactionLog.objects.filter(pk__gt=watermark)
+    if last_transaction is None:
+        logs = logs.filter(created_at__lte=moment)
+    else:
+        logs = logs.filter(pk__lte=last_transaction)
+    if items is not None:
+        logs = logs.filter(inventory_item__in=items.values('pk'))
+    tails = {
+        inventory_item_id: [(action, quantity) for _, action, quantity in entries]
+        for inventory_item_id, entries in groupby(
+            logs.order_by('inventory_item', 'pk').values_list('inventory_item_id', 'action', 'quantity').iterator(),
+            key=lambda entry: entry[0],
+        )
+    }
+    return [
+        (pk, on_hand, replay(snapshot or 0, tails.get(pk, ())), pk in tails)
+        for pk, on_hand, snapshot in rows
+    ]
+
+
+def balances_at(moment=None, items=None):
+    """
+    Reconstructs the ledger balance of items at ``moment`` (default now),
+    e.g. ``balances_at(moment, InventoryItem.objects.filter(base=base))`` for
+    the stock of a base.
+
+    :param items: ``InventoryItem`` queryset, all items by default.
+    :return: Mapping of item id to its balance, in the item's unit.
+    """
+    return {pk: balance for pk, _, balance, _ in _balances(moment or timezone.now(), items)}
+
+
+def stock_at(inventory_item, moment=None):
+    return balances_at(moment, InventoryItem.objects.filter(pk=inventory_item.pk))[inventory_item.pk]
+
+
+def take_snapshots(moment=None):
+    """
+    Snapshots the balance of every item with logs since the previous run, as
+    of ``STOCK_LEDGER_SNAPSHOT_LAG`` seconds before ``moment`` (default now).
+
+    :return: Number of snapshots created.
+    """
+    cutoff = (moment or timezone.now()) - timedelta(seconds=settings.STOCK_LEDGER_SNAPSHOT_LAG)
+    watermark = InventoryTransactionLog.objects.filter(created_at__lte=cutoff).aggregate(latest=Max('pk'))['latest']
+    if watermark is None or watermark <= _watermark(cutoff):
+        return 0
+    snapshots = [
+        InventoryLedgerSnapshot(inventory_item_id=pk, quantity=balance, last_transaction=watermark, taken_at=cutoff)
+        for pk, _, balance, replayed in _balances(cutoff, last_transaction=watermark)
+        if replayed
+    ]
+    InventoryLedgerSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def audit(items=None, tolerance=EPSILON):
+    """
+    Compares the on-hand quantity of items with their current ledger balance.
+
+    :return: ``(pk, on hand, ledger balance)`` of each item that differs by
+        more than ``tolerance``, ordered by id.
+    """
+    return [
+        (pk, on_hand, balance)
+        for pk, on_hand, balance, _ in _balances(timezone.now(), items)
+        if abs(on_hand - balance) > tolerance
+    ]
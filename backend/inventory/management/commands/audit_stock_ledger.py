@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from inventory.ledger import EPSILON, audit
+from inventory.models import InventoryItem
+
+
+class Command(BaseCommand):
+    help = 'Compare the on-hand quantity of inventory items with their transaction ledger balance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', type=int, help='Only audit the items of this inventory base id')
+        parser.add_argument(
+            '--tolerance', type=float, default=EPSILON, help='Largest difference not reported as a mismatch'
+        )
+
+    def handle(self, *args, **options):
+        items = InventoryItem.objects.all()
+        if options['base'] is not None:
+            items = items.filter(base_id=options['base'])
+        mismatches = audit(items, tolerance=options['tolerance'])
+        for pk, on_hand, balance in mismatches:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ Item #{pk}: {on_hand:g} on hand, {balance:g} in the ledger ({on_hand - balance:+g})"
+            ))
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f"❌ {len(mismatches)} of {items.count()} item(s) differ from the ledger"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ All {items.count()} item(s) match the ledger"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.projections import rebuild_price_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-herb price summaries from the current inventory prices'
+
+    def handle(self, *args, **options):
+        count = rebuild_price_summaries()
+        self.stdout.write(self.style.SUCCESS(f"✅ Stored {count} herb price summar(ies)"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Snapshot the ledger balance of the inventory items with new transaction logs'
+
+    def handle(self, *args, **options):
+        count = take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"✅ Stored {count} ledger snapshot(s)"))
@@ -1,4 +1,5 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
 from django.contrib.auth import get_user_model
@@ -111,6 +112,12 @@ class InventoryItem(BaseModel):
         validators=[MinValueValidator(0.0001)],
         verbose_name=_('Low Stock Threshold')
     )
+    reserved_quantity = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name=_('Reserved Quantity'),
+        help_text=_('Quantity held by shopping carts when reservations are kept in the database.'),
+    )
 
     class Meta:
         verbose_name = _('Inventory Item')
@@ -122,6 +129,12 @@ class InventoryItem(BaseModel):
             models.Index(fields=['base']),
             models.Index(fields=['base', 'herb']),
             models.Index(fields=['is_available']),
+            # Only the rows below their threshold, for the low stock scanner.
+            models.Index(
+                fields=['base'],
+                condition=models.Q(quantity__lt=models.F('low_stock_threshold')),
+                name='inventory_item_low_stock_idx',
+            ),
         ]
 
     def __str__(self):
@@ -131,6 +144,39 @@ class InventoryItem(BaseModel):
         return self.quantity < self.low_stock_threshold
 
 
+class InventoryUnitConversion(models.Model):
+    """
+    Mass of one count or volume unit of a specific item (e.g. kg per bag),
+    used by ``inventory.units`` where no fixed factor exists.
+    """
+    inventory_item = models.ForeignKey(
+        InventoryItem,
+        on_delete=models.CASCADE,
+        related_name='unit_conversions',
+        verbose_name=_('Inventory Item'),
+    )
+    unit = models.CharField(
+        max_length=20,
+        choices=QuantityUnitChoices.choices,
+        verbose_name=_('Unit'),
+    )
+    kilograms = models.FloatField(
+        validators=[MinValueValidator(0.0001)],
+        verbose_name=_('Kilograms'),
+        help_text=_('Kilograms in one unit of this item.'),
+    )
+
+    class Meta:
+        verbose_name = _('Unit Conversion')
+        verbose_name_plural = _('Unit Conversions')
+        constraints = [
+            models.UniqueConstraint(fields=['inventory_item', 'unit'], name='unique_inventory_unit_conversion'),
+        ]
+
+    def __str__(self):
+        return f"1 {self.unit} of {self.inventory_item_id} = {self.kilograms} kg"
+
+
 class InventoryPrice(BaseModel):
     inventory_item = models.ForeignKey(
         InventoryItem,
@@ -173,6 +219,66 @@ class InventoryPrice(BaseModel):
         return f"{self.inventory_item} - {self.get_unit_display()}: {self.price} {self.currency.code}"
 
 
+class HerbPriceSummary(models.Model):
+    """
+    Denormalized price range of a herb's available offers in one currency,
+    maintained by ``inventory.projections``. Prices are per kilogram; offers
+    priced only in volume or packaging units count towards ``offer_count``
+    but not towards the range.
+    """
+    herb = models.ForeignKey(
+        'herbs.Herb',
+        on_delete=models.CASCADE,
+        related_name='price_summaries',
+        verbose_name=_('Herb'),
+    )
+    currency = models.ForeignKey(
+        'checkout.Currency',
+        on_delete=models.CASCADE,
+        related_name='herb_price_summaries',
+        verbose_name=_('Currency'),
+    )
+    min_price_per_kg = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        blank=True,
+        null=True,
+        verbose_name=_('Lowest Price per kg'),
+    )
+    max_price_per_kg = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        blank=True,
+        null=True,
+        verbose_name=_('Highest Price per kg'),
+    )
+    offer_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Offer Count'),
+    )
+    in_stock = models.BooleanField(
+        default=False,
+        verbose_name=_('In Stock'),
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Updated at'),
+    )
+
+    class Meta:
+        verbose_name = _('Herb Price Summary')
+        verbose_name_plural = _('Herb Price Summaries')
+        unique_together = ('herb', 'currency')
+        ordering = ['herb', 'currency']
+        indexes = [
+            models.Index(fields=['currency', 'min_price_per_kg']),
+            models.Index(fields=['herb', 'in_stock']),
+        ]
+
+    def __str__(self):
+        return f"{self.herb_id} / {self.currency_id}: {self.min_price_per_kg} - {self.max_price_per_kg}"
+
+
 class InventoryTransactionLog(BaseModel):
     class ActionChoices(models.TextChoices):
         ADD = 'add', _('Added Stock')
@@ -220,6 +326,46 @@ class InventoryTransactionLog(BaseModel):
         return f"{self.action} {self.quantity} - {self.inventory_item}"
 
 
+class InventoryLedgerSnapshot(models.Model):
+    """
+    Balance of an item's transaction ledger up to a log entry, taken
+    periodically by ``inventory.ledger`` so reconstructing stock only replays
+    the logs after the nearest snapshot.
+    """
+    inventory_item = models.ForeignKey(
+        InventoryItem,
+        on_delete=models.CASCADE,
+        related_name='ledger_snapshots',
+        verbose_name=_('Inventory Item'),
+    )
+    quantity = models.FloatField(
+        verbose_name=_('Quantity'),
+        help_text=_("Ledger balance in the item's unit."),
+    )
+    last_transaction = models.PositiveBigIntegerField(
+        verbose_name=_('Last Transaction'),
+        help_text=_('Id of the latest transaction log when the snapshot was taken; '
+                    'the balance includes every log of the item up to it.'),
+    )
+    taken_at = models.DateTimeField(verbose_name=_('Taken At'))
+
+    class Meta:
+        verbose_name = _('Ledger Snapshot')
+        verbose_name_plural = _('Ledger Snapshots')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['inventory_item', 'last_transaction'], name='unique_inventory_ledger_snapshot'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['inventory_item', 'taken_at']),
+            models.Index(fields=['taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_item_id}: {self.quantity} at {self.taken_at:%Y-%m-%d %H:%M}"
+
+
 class LowStockAlert(BaseModel):
     inventory_item = models.OneToOneField(
         InventoryItem,
@@ -290,6 +436,13 @@ class Order(BaseModel):
         help_text=_('Indicates if the payment has been released to the partner wallet.'),
     )
     released_at = models.DateTimeField(verbose_name=_('Released at'), blank=True, null=True)
+    stock_deducted_at = models.DateTimeField(
+        verbose_name=_('Stock deducted at'),
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_('Set once the ordered quantities have been taken out of stock.'),
+    )
 
     class Meta:
         verbose_name = _('Order')
@@ -307,6 +460,32 @@ class Order(BaseModel):
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
 
+    def clean(self):
+        super().clean()
+        if self.pk is None or self.stock_deducted_at is not None or self.status != self.StatusChoices.PROCESSING:
+            return
+
+        from inventory.stock import StockError, check_order_stock
+
+        try:
+            check_order_stock(self)
+        except StockError as error:
+            raise ValidationError({'status': str(error)})
+
+    def save(self, *args, **kwargs):
+        """
+        Deducts stock when an existing order enters PROCESSING, in the same
+        transaction as the status change, so a ``StockError`` aborts both. Orders already deducted skip this without a query.
+        """
+        if self.pk is None or self.stock_deducted_at is not None or self.status != self.StatusChoices.PROCESSING:
+            return super().save(*args, **kwargs)
+
+        from inventory.stock import deduct_order_stock
+
+        with transaction.atomic(using=kwargs.get('using')):
+            deduct_order_stock(self, performed_by=self.user)
+            super().save(*args, **kwargs)
+
 
 class OrderItem(BaseModel):
     order = models.ForeignKey(
@@ -0,0 +1,132 @@
+"""
+Offer lookups shared by the herb offer endpoints.
+"""
+import numpy as np
+from django.db.models import Count, Min, Q
+
+from checkout.models import ExchangeRate
+from core.prefetch import get_prefetch_plan, apply_prefetch_plan
+from inventory.models import InventoryItem, InventoryPrice
+from inventory.units import per_kg_for_items
+from inventory.v1.serializers import InventoryOfferSerializer
+
+
+def available_offers(**lookup):
+    """
+    Available inventory items matching ``lookup`` with everything
+    ``InventoryOfferSerializer`` renders loaded up front.
+    """
+    return apply_prefetch_plan(
+        InventoryItem.objects.filter(is_available=True, herb__is_active=True, **lookup),
+        get_prefetch_plan(InventoryOfferSerializer),
+    )
+
+
+def offer_summaries(slugs):
+    """
+    Per-herb offer summaries computed with two grouped queries, whatever the
+    number of herbs.
+
+    :return: Mapping of each slug to ``offer_count``, ``partner_count``,
+        ``currencies`` and ``min_prices`` (lowest price per currency and unit).
+    """
+    summaries = {
+        slug: {'slug': slug, 'offer_count': 0, 'partner_count': 0, 'currencies': [], 'min_prices': []}
+        for slug in slugs
+    }
+
+    counts = (
+        InventoryItem.objects.filter(herb__slug__in=slugs, herb__is_active=True, is_available=True)
+        .values('herb__slug')
+        .annotate(offer_count=Count('id', distinct=True), partner_count=Count('base__partner', distinct=True))
+        .values_list('herb__slug', 'offer_count', 'partner_count')
+    )
+    for slug, offer_count, partner_count in counts:
+        summaries[slug]['offer_count'] = offer_count
+        summaries[slug]['partner_count'] = partner_count
+
+    prices = (
+        InventoryPrice.objects.filter(
+            inventory_item__herb__slug__in=slugs,
+            inventory_item__herb__is_active=True,
+            inventory_item__is_available=True,
+        )
+        .values('inventory_item__herb__slug', 'currency__code', 'unit')
+        .annotate(min_price=Min('price'))
+        .order_by('inventory_item__herb__slug', 'currency__code', 'unit')
+        .values_list('inventory_item__herb__slug', 'currency__code', 'unit', 'min_price')
+    )
+    for slug, currency, unit, min_price in prices:
+        summary = summaries[slug]
+        if currency not in summary['currencies']:
+            summary['currencies'].append(currency)
+        summary['min_prices'].append({'currency': currency, 'unit': unit, 'price': min_price})
+
+    return summaries
+
+
+def exchange_rates(currency_code):
+    """
+    :return: Mapping of currency code to the factor converting it into
+        ``currency_code``, from direct rates or, failing that, inverted ones.
+    """
+    rates = {currency_code: 1.0}
+    pairs = ExchangeRate.objects.filter(
+        Q(base_currency__code=currency_code) | Q(target_currency__code=currency_code),
+        is_active=True,
+    ).values_list('base_currency__code', 'target_currency__code', 'rate')
+    for base, target, rate in pairs:
+        if target == currency_code:
+            rates[base] = float(rate)
+        elif rate:
+            rates.setdefault(target, 1 / float(rate))
+    return rates
+
+
+def prices_per_kg(prices, rates):
+    """
+    :param prices: ``InventoryPrice`` rows with their currency loaded.
+    :return: Array of each price per kilogram in the target currency of
+        ``rates``, ``nan`` where the unit or currency cannot be converted.
+    """
+    amounts = np.fromiter((price.price for price in prices), dtype=np.float64, count=len(prices))
+    factors = np.fromiter(
+        (rates.get(price.currency.code, np.nan) for price in prices), dtype=np.float64, count=len(prices)
+    )
+    return per_kg_for_items(
+        amounts * factors, [price.unit for price in prices], [price.inventory_item_id for price in prices]
+    )
+
+
+def rank_offers(items, rates, limit=None, max_price_per_kg=None):
+    """
+    Orders offers by their cheapest price per kilogram in one vectorized pass.
+
+    :param items: ``InventoryItem`` rows with ``prices`` (and their currencies) prefetched.
+    :return: ``(items, best, per_price)`` where ``best`` maps item ids to their
+        lowest price per kilogram and ``per_price`` maps price ids to theirs;
+        offers without a convertible price come last (or are dropped when
+        ``max_price_per_kg`` is given).
+    """
+    items = list(items)
+    prices, owners = [], []
+    for position, item in enumerate(items):
+        for price in item.prices.all():
+            prices.append(price)
+            owners.append(position)
+
+    values = prices_per_kg(prices, rates)
+    best = np.full(len(items), np.inf)
+    np.fmin.at(best, np.asarray(owners, dtype=np.int64), values)
+
+    order = np.argsort(best, kind='stable')
+    if max_price_per_kg is not None:
+        order = order[best[order] <= max_price_per_kg]
+    order = order[:limit]
+
+    per_price = {price.id: value for price, value in zip(prices, values.tolist()) if not np.isnan(value)}
+    return (
+        [items[position] for position in order],
+        {items[position].id: float(best[position]) for position in order if np.isfinite(best[position])},
+        per_price,
+    )
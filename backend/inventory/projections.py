@@ -0,0 +1,127 @@
+"""
+``HerbPriceSummary`` projection.
+
+One row per herb and currency holding the per-kilogram price range of the
+herb's available offers, the number of offers and whether any is in stock.
+Catalog listings read it with an indexed subquery instead of joining the
+inventory tables. The receivers below refresh the rows of the affected herbs
+after every committed ``InventoryItem`` or ``InventoryPrice`` change;
+``rebuild_price_summaries`` recomputes the whole table.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Subquery, Value, When
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from inventory.models import HerbPriceSummary, InventoryItem, InventoryPrice, InventoryUnitConversion
+from inventory.units import KG_PER_UNIT
+
+
+def _price_per_kg():
+    # Other units use the item's conversion override, or stay NULL without one.
+    override = InventoryUnitConversion.objects.filter(
+        inventory_item=OuterRef('inventory_item'), unit=OuterRef('unit')
+    ).values('kilograms')[:1]
+    return Case(
+        *[
+            When(unit=unit, then=F('price') / Value(Decimal(str(kilograms))))
+            for unit, kilograms in KG_PER_UNIT.items()
+        ],
+        default=F('price') / Subquery(override, output_field=DecimalField(max_digits=16, decimal_places=4)),
+        output_field=DecimalField(max_digits=16, decimal_places=4),
+    )
+
+
+def _summaries(prices):
+    rows = (
+        prices.filter(inventory_item__is_available=True)
+        .values('inventory_item__herb_id', 'currency_id')
+        .annotate(
+            min_price=Min(_price_per_kg()),
+            max_price=Max(_price_per_kg()),
+            offer_count=Count('inventory_item', distinct=True),
+            in_stock=Max(Case(
+                When(inventory_item__quantity__gt=0, then=1), default=0, output_field=IntegerField()
+            )),
+        )
+        .order_by()
+        .values_list('inventory_item__herb_id', 'currency_id', 'min_price', 'max_price', 'offer_count', 'in_stock')
+    )
+    return [
+        HerbPriceSummary(
+            herb_id=herb_id,
+            currency_id=currency_id,
+            min_price_per_kg=min_price,
+            max_price_per_kg=max_price,
+            offer_count=offer_count,
+            in_stock=bool(in_stock),
+        )
+        for herb_id, currency_id, min_price, max_price, offer_count, in_stock in rows
+    ]
+
+
+def _write(summaries, rows):
+    """
+    Upserts ``summaries`` and deletes the ``rows`` they no longer cover, so
+    concurrent refreshes of a herb never collide on its unique rows.
+    """
+    with transaction.atomic():
+        HerbPriceSummary.objects.bulk_create(
+            summaries,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['herb', 'currency'],
+            update_fields=['min_price_per_kg', 'max_price_per_kg', 'offer_count', 'in_stock', 'updated_at'],
+        )
+        kept = {(summary.herb_id, summary.currency_id) for summary in summaries}
+        stale = [
+            pk for pk, herb_id, currency_id in rows.values_list('pk', 'herb_id', 'currency_id')
+            if (herb_id, currency_id) not in kept
+        ]
+        HerbPriceSummary.objects.filter(pk__in=stale).delete()
+
+
+def rebuild_price_summaries():
+    """
+    :return: Number of summary rows written.
+    """
+    summaries = _summaries(InventoryPrice.objects.all())
+    _write(summaries, HerbPriceSummary.objects.all())
+    return len(summaries)
+
+
+def refresh_price_summaries(herb_ids):
+    herb_ids = {herb_id for herb_id in herb_ids if herb_id is not None}
+    if not herb_ids:
+        return
+    summaries = _summaries(InventoryPrice.objects.filter(inventory_item__herb_id__in=herb_ids))
+    _write(summaries, HerbPriceSummary.objects.filter(herb_id__in=herb_ids))
+
+
+def schedule_refresh(herb_ids):
+    herb_ids = set(herb_ids)
+    transaction.on_commit(lambda: refresh_price_summaries(herb_ids))
+
+
+@receiver(pre_save, sender=InventoryItem)
+def remember_previous_herb(sender, instance, raw=False, **kwargs):
+    instance._previous_herb_id = None
+    if not raw and instance.pk:
+        instance._previous_herb_id = (
+            InventoryItem.objects.filter(pk=instance.pk).values_list('herb_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=InventoryItem)
+def refresh_for_item(sender, instance, **kwargs):
+    schedule_refresh([instance.herb_id, getattr(instance, '_previous_herb_id', None)])
+
+
+@receiver([post_save, post_delete], sender=InventoryPrice)
+@receiver([post_save, post_delete], sender=InventoryUnitConversion)
+def refresh_for_price(sender, instance, **kwargs):
+    schedule_refresh(
+        InventoryItem.objects.filter(pk=instance.inventory_item_id).values_list('herb_id', flat=True)
+    )
@@ -0,0 +1,173 @@
+"""
+Stock deduction for orders.
+
+:func:`deduct_order_stock` takes an order's quantities out of stock exactly
+once: it claims the order by setting ``stock_deducted_at``, locks every
+affected ``InventoryItem`` in one ``SELECT ... FOR UPDATE`` (in primary key
+order, so concurrent orders cannot deadlock), checks that all of them cover
+the order, then deducts with a single ``UPDATE`` built from ``F()``
+expressions, bulk creates the transaction logs and raises the low stock
+alerts. Any shortage raises :class:`InsufficientStock` (a line in a unit
+that cannot be converted, :class:`UnconvertibleQuantity`) and rolls
+everything back, so concurrent orders for the same stock cannot oversell.
+:func:`check_order_stock` runs the same checks without locking, for form
+validation.
+
+Lines are checked against the available-to-sell quantity: stock held by
+other shopping carts (see ``checkout.reservations``) is not for sale, while
+the holds of the customer's own cart at the partner count towards the order
+and are consumed by it.
+"""
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from checkout.models import ShoppingCart
+from inventory.alerts import raise_alerts
+from inventory.models import InventoryItem, InventoryTransactionLog, Order
+from inventory.units import convert_for_items
+from inventory.projections import schedule_refresh
+
+
+class StockError(Exception):
+    """
+    An order that cannot take its quantities out of stock.
+    """
+
+
+class InsufficientStock(StockError):
+    def __init__(self, shortages):
+        """
+        :param shortages: Mapping of inventory item id to ``(requested, available)``
+            in the item's unit.
+        """
+        self.shortages = shortages
+        super().__init__(
+            "Insufficient stock for inventory item(s) " + ", ".join(str(pk) for pk in sorted(shortages))
+        )
+
+
+class UnconvertibleQuantity(StockError):
+    def __init__(self, inventory_item_ids):
+        """
+        :param inventory_item_ids: Items whose order lines are in a unit that
+            cannot be converted to the item's stock unit.
+        """
+        self.inventory_item_ids = inventory_item_ids
+        super().__init__(
+            "Order quantities cannot be converted to the stock unit of inventory item(s) "
+            + ", ".join(str(pk) for pk in sorted(inventory_item_ids))
+        )
+
+
+def _requested(order, lock=False):
+    """
+    :return: ``(items, requested, cart_id)``: the order's inventory items by
+        id, the quantity requested of each in its stock unit, and the id of
+        the customer's cart at the partner.
+    :raises StockError: When an item does not cover the order.
+    """
+    # Imported here: reservations raise this module's InsufficientStock.
+    from checkout.reservations import EPSILON, available_quantities
+
+    lines = list(
+        order.items.filter(inventory_item__isnull=False)
+        .values_list('inventory_item_id', 'quantity', 'quantity_unit')
+    )
+    queryset = InventoryItem.objects.filter(pk__in={inventory_item_id for inventory_item_id, _, _ in lines})
+    if lock:
+        queryset = queryset.select_for_update()
+    items = {item.pk: item for item in queryset.order_by('pk')}
+
+    item_ids = [inventory_item_id for inventory_item_id, _, _ in lines]
+    quantities = convert_for_items(
+        [quantity for _, quantity, _ in lines],
+        [unit for _, _, unit in lines],
+        [items[inventory_item_id].quantity_unit for inventory_item_id in item_ids],
+        item_ids,
+    )
+    unconvertible = np.isnan(quantities)
+    if unconvertible.any():
+        raise UnconvertibleQuantity(set(np.asarray(item_ids)[unconvertible].tolist()))
+    requested = defaultdict(float)
+    for inventory_item_id, quantity in zip(item_ids, quantities.tolist()):
+        requested[inventory_item_id] += quantity
+
+    cart_id = (
+        ShoppingCart.objects.filter(user=order.user_id, partner=order.partner_id)
+        .values_list('pk', flat=True).first()
+    )
+    available = available_quantities(items.values(), cart_id)
+    shortages = {
+        pk: (quantity, available[pk]) for pk, quantity in requested.items() if quantity > available[pk] + EPSILON
+    }
+    if shortages:
+        raise InsufficientStock(shortages)
+    return items, requested, cart_id
+
+
+def check_order_stock(order):
+    """
+    Checks, without locking or deducting, that ``order`` could take its
+    quantities out of stock.
+
+    :raises StockError: When it could not.
+    """
+    _requested(order)
+
+
+def deduct_order_stock(order, performed_by=None):
+    """
+    Deducts the quantities of ``order`` from stock, unless already done.
+
+    :return: ``True`` when stock was deducted, ``False`` when the order had
+        already been deducted; ``order.stock_deducted_at`` is set either way.
+    :raises StockError: When an item does not cover the order.
+    """
+    # Imported here: reservations raise this module's InsufficientStock.
+    from checkout.reservations import get_reservation_backend
+
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = Order.objects.filter(pk=order.pk, stock_deducted_at__isnull=True).update(stock_deducted_at=now)
+        if not claimed:
+            # Deducted through another instance: keep its claim when this one is saved.
+            order.stock_deducted_at = (
+                Order.objects.filter(pk=order.pk).values_list('stock_deducted_at', flat=True).get()
+            )
+            return False
+
+        items, requested, cart_id = _requested(order, lock=True)
+        if requested:
+            InventoryItem.objects.filter(pk__in=requested).update(
+                quantity=F('quantity') - Case(
+                    *[When(pk=pk, then=Value(quantity)) for pk, quantity in requested.items()],
+                    output_field=FloatField(),
+                ),
+                updated_at=now,
+            )
+            InventoryTransactionLog.objects.bulk_create([
+                InventoryTransactionLog(
+                    inventory_item_id=pk,
+                    action=InventoryTransactionLog.ActionChoices.ORDER,
+                    quantity=quantity,
+                    performed_by=performed_by,
+                    note=f"Auto-deducted by order #{order.pk}",
+                )
+                for pk, quantity in requested.items()
+            ])
+            low = [
+                pk for pk, quantity in requested.items()
+                if items[pk].quantity - quantity < items[pk].low_stock_threshold
+            ]
+            if low:
+                raise_alerts(InventoryItem.objects.filter(pk__in=low))
+            if cart_id:
+                get_reservation_backend().consume(cart_id, list(requested))
+            schedule_refresh(items[pk].herb_id for pk in requested)
+
+    order.stock_deducted_at = now
+    return True
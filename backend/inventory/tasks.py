@@ -0,0 +1,14 @@
+from celery import shared_task
+
+from inventory import alerts, ledger
+
+
+@shared_task
+def scan_low_stock():
+    created, cleared = alerts.scan_low_stock()
+    return {'created': created, 'cleared': cleared, 'digests': alerts.send_low_stock_digests()}
+
+
+@shared_task
+def take_ledger_snapshots():
+    return ledger.take_snapshots()
@@ -1,3 +1,356 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import Max
 from django.test import TestCase
+from django.utils import timezone
+
+from checkout.models import Currency, ShoppingCart, ShoppingCartItem, StockHold
+
+from herbs.models import Herb
+from inventory.models import (
+    HerbPriceSummary,
+    InventoryBase,
+    InventoryItem,
+    InventoryLedgerSnapshot,
+    InventoryPrice,
+    InventoryUnitConversion,
+    InventoryTransactionLog,
+    LowStockAlert,
+    Order,
+    OrderItem,
+)
+from inventory.alerts import scan_low_stock
+from inventory.ledger import audit, balances_at, stock_at, take_snapshots
+from inventory.offers import prices_per_kg
+from inventory.stock import InsufficientStock, UnconvertibleQuantity
+from inventory.units import UnitConverter, convert_quantity
+from inventory.tasks import scan_low_stock as scan_low_stock_task
+from partners.models import Country, Partner, PartnerContact, PartnerStaff
+
+
+class StockDeductionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email="buyer@example.com", password="secret", first_name="Ada", last_name="Buyer"
+        )
+        country = Country.objects.create(name="France", iso_code="FR")
+        cls.partner = Partner.objects.create(name="Herboristerie", country=country)
+        cls.base = InventoryBase.objects.create(partner=cls.partner, name="Lyon", country=country)
+
+    def setUp(self):
+        self.chamomile = InventoryItem.objects.create(
+            herb=Herb.objects.create(name="Chamomile"), base=self.base, quantity=10, low_stock_threshold=5
+        )
+        self.ginger = InventoryItem.objects.create(
+            herb=Herb.objects.create(name="Ginger"), base=self.base, quantity=2, low_stock_threshold=1
+        )
+
+    def create_order(self, *lines):
+        order = Order.objects.create(user=self.user, partner=self.partner, total_price=Decimal("10"))
+        for item, quantity, unit in lines:
+            OrderItem.objects.create(
+                order=order, inventory_item=item, quantity=quantity, quantity_unit=unit,
+                unit_price=Decimal("1"), total_price=Decimal("1"),
+            )
+        return order
+
+    def process(self, order):
+        order.status = Order.StatusChoices.PROCESSING
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+    def test_deducts_once_per_transition(self):
+        order = self.create_order(
+            (self.chamomile, 3, 'kg'), (self.chamomile, 1500, 'g'), (self.ginger, 500, 'g'),
+        )
+        # A fixed number of queries, whatever the number of lines.
+        with self.assertNumQueries(15):
+            self.process(order)
+
+        self.chamomile.refresh_from_db()
+        self.ginger.refresh_from_db()
+        self.assertAlmostEqual(self.chamomile.quantity, 5.5)
+        self.assertAlmostEqual(self.ginger.quantity, 1.5)
+        self.assertEqual(
+            sorted(InventoryTransactionLog.objects.values_list('inventory_item__herb__name', 'quantity', 'action')),
+            [("Chamomile", 4.5, 'order'), ("Ginger", 0.5, 'order')],
+        )
+        self.assertFalse(LowStockAlert.objects.exists())
+
+        order.notes = "Packed"
+        with self.assertNumQueries(1):
+            order.save()
+        Order.objects.get(pk=order.pk).save()
+        self.chamomile.refresh_from_db()
+        self.assertAlmostEqual(self.chamomile.quantity, 5.5)
+        self.assertEqual(InventoryTransactionLog.objects.count(), 2)
+
+    def test_low_stock_alerts_are_upserted(self):
+        LowStockAlert.objects.create(inventory_item=self.ginger, notified=True, is_active=False)
+        self.process(self.create_order((self.chamomile, 6, 'kg'), (self.ginger, 1.5, 'kg')))
+
+        alerts = {alert.inventory_item_id: alert for alert in LowStockAlert.objects.all()}
+        self.assertEqual(set(alerts), {self.chamomile.pk, self.ginger.pk})
+        self.assertFalse(alerts[self.chamomile.pk].notified)
+        self.assertTrue(alerts[self.ginger.pk].is_active)
+        self.assertFalse(alerts[self.ginger.pk].notified)
+
+    def test_notified_alerts_are_not_sent_again(self):
+        PartnerContact.objects.create(partner=self.partner, name="Shop", type='email', value="shop@example.com")
+        LowStockAlert.objects.create(inventory_item=self.ginger, notified=True)
+        InventoryItem.objects.filter(pk=self.ginger.pk).update(quantity=0.5)
+        scan_low_stock_task.delay().get()
+        self.assertEqual(len(mail.outbox), 0)
+
+        InventoryItem.objects.filter(pk=self.ginger.pk).update(quantity=2)
+        self.process(self.create_order((self.ginger, 1.5, 'kg')))
+        self.assertTrue(LowStockAlert.objects.get().notified)
+        self.assertEqual(scan_low_stock_task.delay().get()['digests'], 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_holds_of_other_carts_are_not_for_sale(self):
+        other = get_user_model().objects.create_user(
+            email="other@example.com", password="secret", first_name="Bo", last_name="Buyer"
+        )
+        ShoppingCartItem.objects.create(
+            cart=ShoppingCart.objects.create(user=other, partner=self.partner), inventory_item=self.ginger, quantity_kg=1
+        )
+        own = ShoppingCart.objects.create(user=self.user, partner=self.partner)
+        ShoppingCartItem.objects.create(cart=own, inventory_item=self.ginger, quantity_kg=1)
+
+        order = self.create_order((self.ginger, 1.5, 'kg'))
+        order.status = Order.StatusChoices.PROCESSING
+        with self.assertRaises(InsufficientStock) as context:
+            order.save()
+        self.assertEqual(context.exception.shortages, {self.ginger.pk: (1.5, 1)})
+
+        # The customer's own hold covers the order and is consumed by it.
+        self.process(self.create_order((self.ginger, 1, 'kg')))
+        self.ginger.refresh_from_db()
+        self.assertEqual((self.ginger.quantity, self.ginger.reserved_quantity), (1, 1))
+        self.assertEqual(list(StockHold.objects.values_list('cart__user', flat=True)), [other.pk])
+
+    def test_stale_instances_do_not_deduct_again(self):
+        order = self.create_order((self.chamomile, 3, 'kg'))
+        first, second = Order.objects.get(pk=order.pk), Order.objects.get(pk=order.pk)
+        self.process(first)
+        self.process(second)
+        self.assertIsNotNone(second.stock_deducted_at)
+        Order.objects.get(pk=order.pk).save()
+
+        self.chamomile.refresh_from_db()
+        self.assertAlmostEqual(self.chamomile.quantity, 7)
+        self.assertEqual(InventoryTransactionLog.objects.count(), 1)
+
+    def test_unconvertible_lines_are_a_validation_error(self):
+        order = self.create_order((self.chamomile, 2, 'bag'))
+        order.status = Order.StatusChoices.PROCESSING
+        with self.assertRaises(ValidationError) as context:
+            order.full_clean()
+        self.assertIn('status', context.exception.message_dict)
+        with self.assertRaises(UnconvertibleQuantity) as context:
+            order.save()
+        self.assertEqual(context.exception.inventory_item_ids, {self.chamomile.pk})
+        self.assertIsNone(Order.objects.get(pk=order.pk).stock_deducted_at)
+
+        order = self.create_order((self.ginger, 3, 'kg'))
+        order.status = Order.StatusChoices.PROCESSING
+        with self.assertRaises(ValidationError):
+            order.full_clean()
+
+    def test_shortage_rolls_back(self):
+        self.process(self.create_order((self.ginger, 1.5, 'kg')))
+        order = self.create_order((self.chamomile, 1, 'kg'), (self.ginger, 1, 'kg'))
+        order.status = Order.StatusChoices.PROCESSING
+        with self.assertRaises(InsufficientStock) as context:
+            order.save()
+        self.assertEqual(set(context.exception.shortages), {self.ginger.pk})
+
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual(order.status, Order.StatusChoices.PENDING)
+        self.assertIsNone(order.stock_deducted_at)
+        self.chamomile.refresh_from_db()
+        self.assertEqual(self.chamomile.quantity, 10)
+        self.assertEqual(InventoryTransactionLog.objects.count(), 1)
+
+
+class UnitConversionTests(TestCase):
+    def test_converter(self):
+        converter = UnitConverter([(1, 'bag', 2.5), (2, 'l', 0.9), (2, 'g', 5)])
+        values = converter.convert(
+            [1, 1, 1000, 2, 1, 3, 250, 1],
+            ['bag', 'bag', 'g', 'l', 'lb', 'kg', 'ml', 'g'],
+            ['kg', 'g', 'kg', 'kg', 'oz', 'bag', 'l', 'kg'],
+            [1, 2, 1, 2, 1, 1, 1, 2],
+        )
+        np.testing.assert_allclose(values, [2.5, np.nan, 1, 1.8, 16, 1.2, 0.25, 0.001])
+        np.testing.assert_allclose(converter.per_kg([10, 10], ['g', 'bag'], [1, 1]), [10000, 4])
+
+        self.assertEqual(convert_quantity(2, 'kg', 'g'), 2000)
+        with self.assertRaises(ValueError):
+            convert_quantity(2, 'bag', 'kg')
+        with self.assertRaises(ValueError):
+            converter.convert([1], ['kg'], ['stone'])
+
+    def test_overrides_apply_to_stock_and_prices(self):
+        user = get_user_model().objects.create_user(
+            email="buyer@example.com", password="secret", first_name="Ada", last_name="Buyer"
+        )
+        country = Country.objects.create(name="France", iso_code="FR")
+        partner = Partner.objects.create(name="Herboristerie", country=country)
+        base = InventoryBase.objects.create(partner=partner, name="Lyon", country=country)
+        item = InventoryItem.objects.create(
+            herb=Herb.objects.create(name="Chamomile"), base=base, quantity=10, quantity_unit='kg'
+        )
+        InventoryUnitConversion.objects.create(inventory_item=item, unit='bag', kilograms=0.5)
+        usd = Currency.objects.create(code="USD", name="Dollar", symbol="$")
+        with self.captureOnCommitCallbacks(execute=True):
+            price = InventoryPrice.objects.create(inventory_item=item, unit='bag', price=Decimal("4"), currency=usd)
+        self.assertEqual(HerbPriceSummary.objects.get().min_price_per_kg, Decimal("8"))
+        np.testing.assert_allclose(prices_per_kg([price], {'USD': 1.0}), [8])
+
+        order = Order.objects.create(user=user, partner=partner, total_price=Decimal("12"))
+        OrderItem.objects.create(
+            order=order, inventory_item=item, quantity=3, quantity_unit='bag',
+            unit_price=Decimal("4"), total_price=Decimal("12"),
+        )
+        order.status = Order.StatusChoices.PROCESSING
+        order.save()
+        item.refresh_from_db()
+        self.assertAlmostEqual(item.quantity, 8.5)
+
+
+class LowStockScanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="France", iso_code="FR")
+        cls.partner = Partner.objects.create(name="Herboristerie", country=country)
+        cls.other = Partner.objects.create(name="Apothicaire", country=country)
+        PartnerContact.objects.create(partner=cls.partner, name="Shop", type='email', value="shop@example.com")
+        PartnerContact.objects.create(partner=cls.partner, name="Phone", type='phone', value="+33100000000")
+        PartnerStaff.objects.create(
+            partner=cls.partner, role=PartnerStaff.StaffRoleChoices.MANAGER,
+            user=get_user_model().objects.create_user(
+                email="manager@example.com", password="secret", first_name="Ada", last_name="Manager"
+            ),
+        )
+        base = InventoryBase.objects.create(partner=cls.partner, name="Lyon", country=country)
+        other_base = InventoryBase.objects.create(partner=cls.other, name="Nice", country=country)
+        herbs = [Herb.objects.create(name=name) for name in ("Chamomile", "Ginger", "Mint")]
+        cls.chamomile = InventoryItem.objects.create(herb=herbs[0], base=base, quantity=1, low_stock_threshold=5)
+        cls.ginger = InventoryItem.objects.create(herb=herbs[1], base=base, quantity=2, low_stock_threshold=3)
+        cls.mint = InventoryItem.objects.create(herb=herbs[2], base=base, quantity=8, low_stock_threshold=5)
+        cls.orphan = InventoryItem.objects.create(herb=herbs[0], base=other_base, quantity=1, low_stock_threshold=5)
+
+    def test_scan_creates_and_clears_alerts(self):
+        with self.assertNumQueries(5):
+            # Savepoint, scan, insert, clear, release.
+            self.assertEqual(scan_low_stock(), (3, 0))
+        self.assertEqual(scan_low_stock(), (0, 0))
+
+        InventoryItem.objects.filter(pk=self.ginger.pk).update(quantity=10)
+        InventoryItem.objects.filter(pk=self.mint.pk).update(quantity=1)
+        self.assertEqual(scan_low_stock(), (1, 1))
+        self.assertEqual(
+            set(LowStockAlert.objects.values_list('inventory_item', flat=True)),
+            {self.chamomile.pk, self.mint.pk, self.orphan.pk},
+        )
+
+        # Inactive alerts are raised again, unsent.
+        LowStockAlert.objects.filter(inventory_item=self.mint).update(is_active=False, notified=True)
+        self.assertEqual(scan_low_stock(), (1, 0))
+        alert = LowStockAlert.objects.get(inventory_item=self.mint)
+        self.assertEqual((alert.is_active, alert.notified), (True, False))
+
+    def test_one_digest_per_partner(self):
+        self.assertEqual(scan_low_stock_task.delay().get(), {'created': 3, 'cleared': 0, 'digests': 1})
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ["manager@example.com", "shop@example.com"])
+        self.assertIn("2 item(s)", message.subject)
+        self.assertIn("Chamomile @ Lyon", message.body)
+        self.assertIn("Ginger @ Lyon", message.body)
+        # The partner without recipients keeps its alert for a later digest.
+        self.assertEqual(
+            list(LowStockAlert.objects.filter(notified=False).values_list('inventory_item', flat=True)),
+            [self.orphan.pk],
+        )
+
+        self.assertEqual(scan_low_stock_task.delay().get(), {'created': 0, 'cleared': 0, 'digests': 0})
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="France", iso_code="FR")
+        partner = Partner.objects.create(name="Herboristerie", country=country)
+        cls.base = InventoryBase.objects.create(partner=partner, name="Lyon", country=country)
+        other_base = InventoryBase.objects.create(partner=partner, name="Nice", country=country)
+        cls.chamomile = InventoryItem.objects.create(
+            herb=Herb.objects.create(name="Chamomile"), base=cls.base, quantity=6
+        )
+        cls.ginger = InventoryItem.objects.create(herb=Herb.objects.create(name="Ginger"), base=other_base, quantity=3)
+
+    def log(self, item, action, quantity, days_ago):
+        entry = InventoryTransactionLog.objects.create(inventory_item=item, action=action, quantity=quantity)
+        InventoryTransactionLog.objects.filter(pk=entry.pk).update(created_at=self.now - timedelta(days=days_ago))
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.log(self.chamomile, 'add', 10, days_ago=10)
+        self.log(self.chamomile, 'order', 4, days_ago=8)
+        self.log(self.ginger, 'add', 5, days_ago=8)
+
+    def test_snapshots_replay_only_the_tail(self):
+        self.assertEqual(take_snapshots(self.now - timedelta(days=7)), 2)
+        self.assertEqual(take_snapshots(self.now - timedelta(days=7)), 0)
+        self.log(self.chamomile, 'adjust', 8, days_ago=5)
+        self.log(self.chamomile, 'remove', 1, days_ago=2)
+
+        self.assertEqual(take_snapshots(self.now - timedelta(days=4)), 1)
+        self.assertEqual(
+            list(
+                InventoryLedgerSnapshot.objects.order_by('taken_at', 'inventory_item').values_list('quantity', flat=True)
+            ),
+            [6, 5, 8],
+        )
+        # Only logs after the latest watermark are replayed.
+        InventoryTransactionLog.objects.filter(action='add').delete()
+        self.assertEqual(stock_at(self.chamomile, self.now - timedelta(days=9)), 0)
+        self.assertEqual(stock_at(self.chamomile, self.now - timedelta(days=7)), 6)
+        self.assertEqual(balances_at(self.now - timedelta(days=3)), {self.chamomile.pk: 8, self.ginger.pk: 5})
+        self.assertEqual(balances_at(items=InventoryItem.objects.filter(base=self.base)), {self.chamomile.pk: 7})
+
+    def test_snapshots_wait_for_logs_still_in_flight(self):
+        take_snapshots(self.now - timedelta(days=7))
+        # A later log commits first, while one with a lower id is still in flight.
+        in_flight = InventoryTransactionLog.objects.aggregate(latest=Max('pk'))['latest'] + 1
+        InventoryTransactionLog.objects.create(pk=in_flight + 1, inventory_item=self.chamomile, action='remove', quantity=1)
+        self.assertEqual(take_snapshots(), 0)
+
+        InventoryTransactionLog.objects.create(pk=in_flight, inventory_item=self.chamomile, action='remove', quantity=2)
+        later = timezone.now() + timedelta(seconds=settings.STOCK_LEDGER_SNAPSHOT_LAG + 1)
+        self.assertEqual(take_snapshots(later), 1)
+        self.assertEqual(InventoryLedgerSnapshot.objects.get(last_transaction=in_flight + 1).quantity, 3)
+        self.assertEqual(stock_at(self.chamomile, later), 3)
+
+    def test_audit(self):
+        take_snapshots(self.now - timedelta(days=7))
+        self.assertEqual(audit(), [(self.ginger.pk, 3, 5)])
 
-# Create your tests here.
+        out = StringIO()
+        call_command('audit_stock_ledger', stdout=out)
+        self.assertIn("1 of 2 item(s) differ", out.getvalue())
+        call_command('audit_stock_ledger', base=self.base.pk, stdout=out)
+        self.assertIn("All 1 item(s) match", out.getvalue())
@@ -0,0 +1,156 @@
+"""
+Unit conversion for quantities and prices.
+
+Every unit of ``QuantityUnitChoices`` belongs to a dimension with a fixed
+factor inside it: mass units in kilograms, volume units in liters, and each
+packaging unit (bag, box, pack, unit) on its own. Units of the same dimension
+convert with the fixed factors; anything else goes through kilograms, using
+the item's ``InventoryUnitConversion`` overrides (e.g. kg per bag, or kg per
+liter) for non-mass units.
+
+:class:`UnitConverter` works on whole arrays: units are turned into indexes
+with one ``searchsorted`` and factors gathered with fancy indexing, so
+converting a queryset costs no per-row Python branching. Conversions without
+a factor come out as ``nan``.
+"""
+import numpy as np
+
+from inventory.models import InventoryUnitConversion, QuantityUnitChoices
+
+# Kilograms in one mass unit.
+KG_PER_UNIT = {
+    QuantityUnitChoices.GRAM: 0.001,
+    QuantityUnitChoices.KILOGRAM: 1.0,
+    QuantityUnitChoices.POUND: 0.45359237,
+    QuantityUnitChoices.OUNCE: 0.028349523125,
+}
+# Liters in one volume unit.
+LITERS_PER_UNIT = {
+    QuantityUnitChoices.LITER: 1.0,
+    QuantityUnitChoices.MILLILITER: 0.001,
+}
+
+UNITS = np.array(sorted(QuantityUnitChoices.values))
+_MASS, _VOLUME = 0, 1
+# Dimension of each unit; packaging units each get their own.
+DIMENSIONS = np.array([
+    _MASS if unit in KG_PER_UNIT else _VOLUME if unit in LITERS_PER_UNIT else 2 + index
+    for index, unit in enumerate(UNITS)
+])
+# Factor of each unit inside its dimension.
+FACTORS = np.array([KG_PER_UNIT.get(unit, LITERS_PER_UNIT.get(unit, 1.0)) for unit in UNITS])
+# Kilograms in one unit where that is fixed.
+KILOGRAMS = np.array([KG_PER_UNIT.get(unit, np.nan) for unit in UNITS])
+
+
+def unit_indexes(units):
+    """
+    :return: Index of each unit in ``UNITS``.
+    :raises ValueError: On an unknown unit.
+    """
+    units = np.array([str(unit) for unit in units], dtype=str)
+    if not len(units):
+        return np.empty(0, dtype=np.int64)
+    indexes = np.minimum(np.searchsorted(UNITS, units), len(UNITS) - 1)
+    unknown = UNITS[indexes] != units
+    if unknown.any():
+        raise ValueError(f"Unknown unit(s): {', '.join(sorted(set(units[unknown].tolist())))}")
+    return indexes
+
+
+class UnitConverter:
+    def __init__(self, overrides=()):
+        """
+        :param overrides: ``(inventory_item_id, unit, kilograms)`` triples.
+        """
+        overrides = list(overrides)
+        keys = self._key([item_id for item_id, _, _ in overrides], unit_indexes([unit for _, unit, _ in overrides]))
+        values = np.array([kilograms for _, _, kilograms in overrides], dtype=np.float64)
+        order = np.argsort(keys)
+        self.override_keys, self.override_values = keys[order], values[order]
+
+    @staticmethod
+    def _key(item_ids, indexes):
+        return np.asarray(item_ids, dtype=np.int64) * len(UNITS) + indexes
+
+    @classmethod
+    def for_items(cls, inventory_item_ids):
+        """
+        A converter loaded with the overrides of the given items, in one query.
+        """
+        return cls(
+            InventoryUnitConversion.objects.filter(inventory_item_id__in=set(inventory_item_ids))
+            .values_list('inventory_item_id', 'unit', 'kilograms')
+        )
+
+    def kilograms(self, indexes, item_ids=None):
+        """
+        :return: Kilograms in one of each unit, from the fixed factors or,
+            for non-mass units, the item's overrides.
+        """
+        factors = KILOGRAMS[indexes]
+        if item_ids is None or not len(self.override_keys):
+            return factors
+        keys = self._key(item_ids, indexes)
+        positions = np.minimum(np.searchsorted(self.override_keys, keys), len(self.override_keys) - 1)
+        found = (self.override_keys[positions] == keys) & np.isnan(factors)
+        return np.where(found, self.override_values[positions], factors)
+
+    def ratios(self, from_units, to_units, item_ids=None):
+        """
+        :return: Multiplier converting a quantity in each ``from_units`` into
+            the matching ``to_units`` (``nan`` when there is no conversion).
+        """
+        source, target = unit_indexes(from_units), unit_indexes(to_units)
+        same_dimension = DIMENSIONS[source] == DIMENSIONS[target]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            through_kg = self.kilograms(source, item_ids) / self.kilograms(target, item_ids)
+        return np.where(same_dimension, FACTORS[source] / FACTORS[target], through_kg)
+
+    def convert(self, quantities, from_units, to_units, item_ids=None):
+        return np.asarray(quantities, dtype=np.float64) * self.ratios(from_units, to_units, item_ids)
+
+    def to_kg(self, quantities, units, item_ids=None):
+        return self.convert(quantities, units, [QuantityUnitChoices.KILOGRAM] * len(units), item_ids)
+
+    def per_kg(self, amounts, units, item_ids=None):
+        """
+        :return: Each amount given per unit (e.g. a price) per kilogram instead.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.asarray(amounts, dtype=np.float64) / self.kilograms(unit_indexes(units), item_ids)
+
+
+def convert_for_items(quantities, from_units, to_units, item_ids):
+    """
+    :meth:`UnitConverter.convert` for rows of the given items, querying their
+    overrides only when fixed factors leave something unconverted.
+    """
+    values = UnitConverter().convert(quantities, from_units, to_units)
+    if np.isnan(values).any():
+        values = UnitConverter.for_items(item_ids).convert(quantities, from_units, to_units, item_ids)
+    return values
+
+
+def per_kg_for_items(amounts, units, item_ids):
+    """
+    :meth:`UnitConverter.per_kg` counterpart of :func:`convert_for_items`.
+    """
+    converter = UnitConverter()
+    if np.isnan(KILOGRAMS[unit_indexes(units)]).any():
+        converter = UnitConverter.for_items(item_ids)
+    return converter.per_kg(amounts, units, item_ids)
+
+
+def convert_quantity(quantity, from_unit, to_unit, inventory_item_id=None):
+    """
+    Scalar :func:`convert_for_items`.
+
+    :raises ValueError: When the units cannot be converted.
+    """
+    if from_unit == to_unit:
+        return quantity
+    value = convert_for_items([quantity], [from_unit], [to_unit], [inventory_item_id or 0])[0]
+    if np.isnan(value):
+        raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    return float(value)
@@ -1,6 +1,8 @@
+from django.db import models
 from rest_framework import serializers
 from inventory.models import InventoryBase, InventoryItem, InventoryPrice
 
+from checkout.reservations import available_quantities
 from checkout.v1.serializers import CurrencySerializer
 
 
@@ -21,13 +23,44 @@ class InventoryPriceSerializer(serializers.ModelSerializer):
         fields = ['id', 'unit', 'price', 'currency']
 
 
+class InventoryOfferListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Look up the cart holds of the whole list at once.
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.available = available_quantities(items)
+        return super().to_representation(items)
+
+
 class InventoryOfferSerializer(serializers.ModelSerializer):
     base = InventoryBaseSerializer(many=False)
     country = serializers.CharField(source='base.country.name')
     quantity = serializers.FloatField()
+    available_quantity = serializers.SerializerMethodField()
     unit = serializers.CharField(source='get_quantity_unit_display')
     prices = InventoryPriceSerializer(many=True)
+    # Item id -> quantity not held by shopping carts, set by the list serializer.
+    available = {}
 
     class Meta:
         model = InventoryItem
-        fields = ['id', 'base', 'country', 'quantity', 'unit', 'is_available', 'prices']
+        fields = ['id', 'base', 'country', 'quantity', 'available_quantity', 'unit', 'is_available', 'prices']
+        list_serializer_class = InventoryOfferListSerializer
+
+    def get_available_quantity(self, item) -> float:
+        available = self.available if item.pk in self.available else available_quantities([item])
+        return available[item.pk]
+
+
+class OfferMinPriceSerializer(serializers.Serializer):
+    currency = serializers.CharField()
+    unit = serializers.CharField()
+    price = serializers.DecimalField(max_digits=12, decimal_places=4)
+
+
+class HerbOfferSummarySerializer(serializers.Serializer):
+    slug = serializers.CharField()
+    offer_count = serializers.IntegerField()
+    partner_count = serializers.IntegerField()
+    currencies = serializers.ListField(child=serializers.CharField())
+    min_prices = OfferMinPriceSerializer(many=True)
+    offers = InventoryOfferSerializer(many=True, required=False)
@@ -26,6 +26,39 @@ export async function fetchHerbs({
 }
 
 
+export async function fetchFacets({category, tags, symptoms, search = '', facets = ''} = {}) {
+    const params = new URLSearchParams();
+    if (category) params.append('category', category);
+    if (tags) params.append('tags', tags);
+    if (symptoms) params.append('symptoms', symptoms);
+    if (search) params.append('search', search);
+    if (facets) params.append('facets', facets);
+
+    const res = await fetch(`${API_ENDPOINTS.herbs.facets}?${params.toString()}`);
+    if (!res.ok) throw new Error(`Failed to fetch facets`);
+    return await res.json();
+}
+
+
+export async function fetchRankedHerbs(symptoms, {limit = 20} = {}) {
+    const params = new URLSearchParams({symptoms, limit});
+
+    const res = await fetch(`${API_ENDPOINTS.herbs.rank}?${params.toString()}`);
+    if (!res.ok) throw new Error(`Failed to rank herbs`);
+    return await res.json();
+}
+
+
+export async function fetchAutocomplete(q, {limit = 10, types = ''} = {}) {
+    const params = new URLSearchParams({q, limit});
+    if (types) params.append('types', types);
+
+    const res = await fetch(`${API_ENDPOINTS.herbs.autocomplete}?${params.toString()}`);
+    if (!res.ok) throw new Error(`Failed to fetch suggestions`);
+    return await res.json();
+}
+
+
 export async function fetchHerbDetail(slug) {
     const res = await fetch(API_ENDPOINTS.herbs.herbDetail(slug));
 
@@ -66,6 +99,47 @@ export async function fetchHerbOffers(slug) {
     return await res.json();
 }
 
+export async function fetchOfferSummaries(slugs, {includeOffers = false} = {}) {
+    const params = new URLSearchParams({slugs: slugs.join(',')});
+    if (includeOffers) params.append('include', 'offers');
+
+    const res = await fetch(`${API_ENDPOINTS.herbs.offers}?${params.toString()}`);
+    if (!res.ok) throw new Error(`Failed to fetch offer summaries`);
+    return await res.json();
+}
+
+
+export async function fetchRelatedHerbs(slug) {
+    const res = await fetch(API_ENDPOINTS.herbs.herbRelated(slug));
+    if (!res.ok) throw new Error(`Failed to fetch related herbs for: ${slug}`);
+    return await res.json();
+}
+
+
+// Herbs for an illness, symptom or ailment (`kind` is `illnesses`, `symptoms`
+// or `ailments`), direct links first; `maxHops = 1` keeps only those.
+export async function fetchConditionHerbs(kind, slug, {maxHops = 2, page = 1} = {}) {
+    const params = new URLSearchParams({max_hops: maxHops, page});
+
+    const res = await fetch(`${API_ENDPOINTS.herbs.conditionHerbs(kind, slug)}?${params.toString()}`);
+    if (!res.ok) throw new Error(`Failed to fetch herbs for: ${slug}`);
+    return await res.json();
+}
+
+
+// Categories, tags, symptoms, ailments and illnesses in one bundle. Only the
+// small current-version lookup is revalidated; the bundle itself comes from
+// its versioned URL, which the browser caches as immutable.
+export async function fetchTaxonomy() {
+    const current = await fetch(API_ENDPOINTS.herbs.taxonomyCurrent);
+    if (!current.ok) throw new Error(`Failed to fetch taxonomy version`);
+    const {url} = await current.json();
+
+    const res = await fetch(url);
+    if (!res.ok) throw new Error(`Failed to fetch taxonomy`);
+    return await res.json();
+}
+
 
 export async function fetchCategories({pagination = false} = {}) {
     const params = new URLSearchParams();
@@ -8,9 +8,17 @@ export const API_ENDPOINTS = {
         self: `${API_BASE}/herbs/`,
         herbDetail: (slug) => `${API_BASE}/herbs/${slug}/`,
         herbOffers: (slug) => `${API_BASE}/herbs/${slug}/offers/`,
+        herbRelated: (slug) => `${API_BASE}/herbs/${slug}/related/`,
+        conditionHerbs: (kind, slug) => `${API_BASE}/herbs/${kind}/${slug}/herbs/`,
         categories: `${API_BASE}/herbs/categories/`,
         tags: `${API_BASE}/herbs/tags/`,
         symptoms: `${API_BASE}/herbs/symptoms/`,
+        autocomplete: `${API_BASE}/herbs/autocomplete/`,
+        facets: `${API_BASE}/herbs/facets/`,
+        rank: `${API_BASE}/herbs/rank/`,
+        offers: `${API_BASE}/herbs/offers/`,
+        taxonomy: `${API_BASE}/herbs/taxonomy/`,
+        taxonomyCurrent: `${API_BASE}/herbs/taxonomy/current/`,
     },
     auth: {
         authorize: `${BASE_URL}/api/auth/authorize/`,